@@ -1 +1,36 @@
-from src.esql.accessor import ESQLAccessor
\ No newline at end of file
+import sys
+from importlib import import_module
+
+
+# Public names and the modules they are imported from on first use, so that importing the
+# package, or only its parser, does not import pandas and the execution engine.
+LAZY_ATTRIBUTES = {
+    'ESQLAccessor': '.accessor',
+    'SampleSpec': '.execution.sampling',
+    'PartialState': '.partial',
+    'partial_aggregate': '.partial',
+    'merge_states': '.partial',
+    'finalize': '.partial',
+    'LazyQuery': '.lazy',
+    'collect': '.lazy',
+    'parse_query': '.parser.parse'
+}
+LAZY_SUBMODULES = {'accessor', 'aio', 'cli', 'cluster', 'execution', 'lazy', 'parser', 'partial', 'server'}
+
+
+def __getattr__(name: str):
+    if name in LAZY_ATTRIBUTES:
+        return getattr(import_module(LAZY_ATTRIBUTES[name], __name__), name)
+    if name in LAZY_SUBMODULES:
+        return import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(LAZY_ATTRIBUTES) | LAZY_SUBMODULES)
+
+
+# When pandas is already imported, the DataFrame accessor is registered right away, so that
+# df.esql works after 'import esql'. Otherwise importing esql.accessor registers it.
+if 'pandas' in sys.modules:
+    from . import accessor
@@ -1,32 +1,124 @@
 import pandas as pd
 from beartype import beartype
 from beartype.vale import Is
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated, Literal
+from collections.abc import Iterable, Iterator
 from pandas.api.extensions import register_dataframe_accessor
 from pandas.api.types import is_string_dtype, is_numeric_dtype, is_bool_dtype, is_datetime64_any_dtype
 
-from src.esql.parser.parse import get_parsed_query
-from src.esql.execution.execute import execute
+from .parser.parse import get_parsed_query
+
+if TYPE_CHECKING:
+    from .execution.sampling import SampleSpec
+    from .lazy import LazyQuery
 
 
 IntGreaterThanZero = Annotated[int, Is[lambda x: x > 0]]
 
 @register_dataframe_accessor("esql")
 class ESQLAccessor:
+    # The execution engine and the asyncio executor are imported on first use, so that
+    # registering the accessor stays cheap for programs that never run a query.
     def __init__(self, data: pd.DataFrame):
+        from .execution.catalog import DatasetCatalog
+
         self.data = _enforce_allowed_dtypes(data)
+        self.catalog = DatasetCatalog(self.data)
 
     @beartype
-    def query(self, query: str, decimal_places: IntGreaterThanZero=2) -> pd.DataFrame:
+    def query(self, query: str, decimal_places: IntGreaterThanZero=2, approximate: 'SampleSpec | None'=None, memory_limit: IntGreaterThanZero | str | None=None, engine: Literal['default', 'jit']='default') -> pd.DataFrame:
+        '''
+        Run a query. approximate runs it on a sample and adds '.ci_low' and '.ci_high' bounds
+        after every sum, count and average. memory_limit (bytes, or a string like '4GB') spills
+        the groups to temporary files one partition at a time. engine='jit' compiles the query
+        with Numba when it is installed.
+        '''
+        from .execution.execute import execute
+
         parsed_query = get_parsed_query(self.data, query)
-        result_dataframe = execute(parsed_query, decimal_places)
+        result_dataframe = execute(parsed_query, decimal_places, catalog=self.catalog, approximate=approximate, memory_limit=memory_limit, engine=engine)
         return result_dataframe
 
+    @beartype
+    def iter_query(self, query: str, batch_size: IntGreaterThanZero=10_000, decimal_places: IntGreaterThanZero=2, memory_limit: IntGreaterThanZero | str | None=None) -> Iterator[pd.DataFrame]:
+        '''
+        Run a query and yield its result in DataFrames of at most batch_size rows, as the
+        groups are finalized. Without ORDER BY, the rows come in the order of the hash
+        partitions of the groups rather than in the order of query().
+        '''
+        from .execution.execute import iter_execute
+
+        parsed_query = get_parsed_query(self.data, query)
+        return iter_execute(parsed_query, decimal_places, batch_size, catalog=self.catalog, memory_limit=memory_limit)
+
+    @beartype
+    def lazy(self, query: str, decimal_places: IntGreaterThanZero=2) -> 'LazyQuery':
+        '''
+        Parse a query without executing it. Lazy queries are executed together with
+        esql.collect(), which shares the work of the queries over the same DataFrame.
+        '''
+        from .lazy import LazyQuery
+
+        parsed_query = get_parsed_query(self.data, query)
+        return LazyQuery(query, parsed_query, decimal_places, self.catalog)
+
+    @beartype
+    def create_index(self, *columns: str) -> None:
+        '''
+        Build inverted indexes on columns that are often compared with '=' in WHERE
+        or SUCH THAT clauses, so those predicates only visit the matching rows.
+        '''
+        for column in columns:
+            self.catalog.create_index(column)
+
+    @beartype
+    def drop_index(self, *columns: str) -> None:
+        for column in columns:
+            self.catalog.drop_index(column)
+
+    @beartype
+    async def aquery(self, query: str, decimal_places: IntGreaterThanZero=2, timeout: float | None=None) -> pd.DataFrame:
+        from .aio import get_default_executor
+
+        return await get_default_executor().query(
+            data=self.data,
+            query=query,
+            decimal_places=decimal_places,
+            timeout=timeout,
+            catalog=self.catalog
+        )
+
+    @beartype
+    async def aquery_batch(self, queries: Iterable[str], decimal_places: IntGreaterThanZero=2, timeout: float | None=None, return_exceptions: bool=False) -> list:
+        from .aio import get_default_executor
+
+        return await get_default_executor().query_batch(
+            data=self.data,
+            queries=queries,
+            decimal_places=decimal_places,
+            timeout=timeout,
+            return_exceptions=return_exceptions,
+            catalog=self.catalog
+        )
+
 
-def _enforce_allowed_dtypes(data: pd.DataFrame) -> pd.DataFrame:
+def __getattr__(name: str):
+    # beartype resolves the annotations that name SampleSpec and LazyQuery when a method is
+    # called, which imports their modules on first use like the execution engine.
+    if name == 'SampleSpec':
+        from .execution.sampling import SampleSpec
+        return SampleSpec
+    if name == 'LazyQuery':
+        from .lazy import LazyQuery
+        return LazyQuery
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _enforce_allowed_dtypes(data: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     '''
     Convert DataFrame columns so that each column's dtype is one of:
       - "string" for textual data
+      - category for categorical textual data, which is kept as is
       - bool for boolean data
       - datetime.date for date/time data
       - int or float for numeric data
@@ -37,15 +129,19 @@ def _enforce_allowed_dtypes(data: pd.DataFrame) -> pd.DataFrame:
     
     Parameters:
         df: The input DataFrame.
+        copy: Whether the columns that are left unchanged are copied. Without a copy they
+            share their arrays with the input DataFrame, such as memory-mapped files.
     
     Returns:
         pd.DataFrame: A new DataFrame with enforced dtypes.
     '''
-    data = data.copy()
+    data = data.copy(deep=copy)
     for column in data.columns:
         current_dtype = data[column].dtype
         if pd.api.types.is_bool_dtype(current_dtype):
             continue
+        elif isinstance(current_dtype, pd.CategoricalDtype) and data[column].cat.categories.inferred_type in ('string', 'empty'):
+            continue
         elif pd.api.types.is_numeric_dtype(current_dtype):
             continue
         elif pd.api.types.is_datetime64_any_dtype(current_dtype):
@@ -0,0 +1,134 @@
+import asyncio
+import weakref
+import pandas as pd
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from .accessor import _enforce_allowed_dtypes
+from .parser.parse import get_parsed_query
+from .execution.execute import execute
+from .execution.cancellation import CancellationToken
+from .execution.catalog import DatasetCatalog
+
+
+class AsyncQueryExecutor:
+    '''
+    Runs ESQL queries from asyncio code on a thread pool, at most max_concurrency at a time.
+    Timed out or cancelled queries are stopped through their CancellationToken. A catalog
+    must describe data whose dtypes are already normalized.
+    '''
+    def __init__(self, max_concurrency: int = 4, timeout: float | None = None):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than zero")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="esql-async"
+        )
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+    async def query(self, data: pd.DataFrame, query: str, decimal_places: int = 2, timeout: float | None = None, catalog: DatasetCatalog | None = None) -> pd.DataFrame:
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(loop)
+        cancellation_token = CancellationToken()
+
+        await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(
+                self._executor,
+                _run_query,
+                data,
+                query,
+                decimal_places,
+                cancellation_token,
+                catalog
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+        # The slot is only freed once the worker thread has actually stopped,
+        # so cancelled queries that are still unwinding count against the limit.
+        future.add_done_callback(lambda _: semaphore.release())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            cancellation_token.cancel()
+            future.add_done_callback(_consume_exception)
+            raise
+
+    async def query_batch(self, data: pd.DataFrame, queries: Iterable[str], decimal_places: int = 2, timeout: float | None = None, return_exceptions: bool = False, catalog: DatasetCatalog | None = None) -> list[pd.DataFrame | BaseException]:
+        '''
+        Run several queries concurrently, bounded by max_concurrency, and return the
+        results in the order of the queries. With return_exceptions, failed queries
+        are returned as exceptions instead of cancelling the remaining queries.
+        '''
+        if catalog is None:
+            # The data is normalized and encoded once for all the queries.
+            data, catalog = await asyncio.get_running_loop().run_in_executor(self._executor, _prepare_data, data)
+        tasks = [
+            asyncio.ensure_future(self.query(data, query, decimal_places, timeout, catalog))
+            for query in queries
+        ]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+
+_default_executor: AsyncQueryExecutor | None = None
+
+
+def configure(max_concurrency: int = 4, timeout: float | None = None) -> AsyncQueryExecutor:
+    '''
+    Replace the executor used by `df.esql.aquery` and `df.esql.aquery_batch`.
+    '''
+    global _default_executor
+    previous_executor = _default_executor
+    _default_executor = AsyncQueryExecutor(
+        max_concurrency=max_concurrency,
+        timeout=timeout
+    )
+    if previous_executor is not None:
+        previous_executor.shutdown(wait=False)
+    return _default_executor
+
+
+def get_default_executor() -> AsyncQueryExecutor:
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = AsyncQueryExecutor()
+    return _default_executor
+
+
+def _run_query(data: pd.DataFrame, query: str, decimal_places: int, cancellation_token: CancellationToken, catalog: DatasetCatalog | None = None) -> pd.DataFrame:
+    cancellation_token.raise_if_cancelled()
+    if catalog is None:
+        data = _enforce_allowed_dtypes(data)
+    parsed_query = get_parsed_query(data, query)
+    return execute(parsed_query, decimal_places, cancellation_token, catalog)
+
+
+def _prepare_data(data: pd.DataFrame) -> tuple[pd.DataFrame, DatasetCatalog]:
+    data = _enforce_allowed_dtypes(data)
+    return data, DatasetCatalog(data)
+
+
+def _consume_exception(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
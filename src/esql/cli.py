@@ -0,0 +1,108 @@
+import sys
+import argparse
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = _build_argument_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        return _serve(args)
+    if args.command == 'worker':
+        return _worker(args)
+    parser.print_help()
+    return 1
+
+
+def _build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='esql', description="ExtendedSQL command line interface")
+    subparsers = parser.add_subparsers(dest='command')
+
+    serve = subparsers.add_parser('serve', help="Serve ESQL queries over HTTP for datasets kept in memory, with Flask's development server")
+    _add_dataset_arguments(serve)
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8000)
+    serve.add_argument('--workers', type=int, default=4,
+        help="Number of queries that are executed concurrently.")
+    serve.add_argument('--cache-size', type=int, default=128,
+        help="Number of parsed plans and results cached per dataset. 0 disables caching.")
+
+    worker = subparsers.add_parser('worker', help="Serve partial aggregates of dataset shards to a coordinator over TCP")
+    _add_dataset_arguments(worker, "Register a shard of a dataset (a CSV file or a directory of .npy columns) under a name. Can be repeated.")
+    worker.add_argument('--listen', default='127.0.0.1', metavar='HOST:PORT',
+        help="Address to listen on, on the default cluster port unless one is given. Port 0 picks a free port.")
+    worker.add_argument('--workers', type=int, default=4,
+        help="Number of queries that are executed concurrently.")
+    return parser
+
+
+def _add_dataset_arguments(parser: argparse.ArgumentParser, dataset_help: str = "Register a CSV file under a name. Can be repeated.") -> None:
+    parser.add_argument('--dataset', action='append', default=[], metavar='NAME=PATH', required=True,
+        help=dataset_help)
+    parser.add_argument('--dtype', action='append', default=[], metavar='NAME.COLUMN=DTYPE',
+        help="Enforce a dtype for a dataset column while loading (e.g. sales.quant=float64 or sales.date=date). Can be repeated.")
+    parser.add_argument('--index', action='append', default=[], metavar='NAME.COLUMN',
+        help="Build an inverted index on a dataset column for equality predicates. Can be repeated.")
+
+
+def _serve(args: argparse.Namespace) -> int:
+    from .server.app import create_app
+
+    registry = _load_registry(args, cache_size=args.cache_size)
+    app = create_app(registry, workers=args.workers)
+    # Flask's development server. Production deployments serve create_app() with a WSGI server.
+    app.run(host=args.host, port=args.port, threaded=True)
+    return 0
+
+
+def _worker(args: argparse.Namespace) -> int:
+    from .cluster.worker import ShardWorker
+    from .cluster.protocol import parse_address
+
+    try:
+        address = parse_address(args.listen)
+    except ValueError as error:
+        raise SystemExit(f"Invalid --listen '{args.listen}'. Expected HOST:PORT.") from error
+    registry = _load_registry(args, cache_size=0)
+    with ShardWorker(address, registry, workers=args.workers) as worker:
+        host, port = worker.address
+        print(f"Worker listening on {host}:{port}", file=sys.stderr, flush=True)
+        worker.serve_forever()
+    return 0
+
+
+def _load_registry(args: argparse.Namespace, cache_size: int) -> 'DatasetRegistry':
+    from .server.registry import DatasetRegistry
+
+    datasets = dict(_split_assignment(dataset, '--dataset') for dataset in args.dataset)
+    dtypes: dict[str, dict[str, str]] = {name: {} for name in datasets}
+    for assignment in args.dtype:
+        target, dtype = _split_assignment(assignment, '--dtype')
+        name, _, column = target.partition('.')
+        if name not in datasets or not column:
+            raise SystemExit(f"Invalid --dtype '{assignment}'. Expected NAME.COLUMN=DTYPE for a registered dataset.")
+        dtypes[name][column] = dtype
+    indexes: dict[str, list[str]] = {name: [] for name in datasets}
+    for target in args.index:
+        name, _, column = target.partition('.')
+        if name not in datasets or not column:
+            raise SystemExit(f"Invalid --index '{target}'. Expected NAME.COLUMN for a registered dataset.")
+        indexes[name].append(column)
+
+    registry = DatasetRegistry(cache_size=cache_size)
+    for name, path in datasets.items():
+        dataset = registry.load(name, path, dtypes[name])
+        for column in indexes[name]:
+            dataset.create_index(column)
+        print(f"Loaded dataset '{name}' from {path} ({len(dataset.data)} rows)", file=sys.stderr)
+    return registry
+
+
+def _split_assignment(assignment: str, option: str) -> tuple[str, str]:
+    name, separator, value = assignment.partition('=')
+    if not separator or not name or not value:
+        raise SystemExit(f"Invalid {option} '{assignment}'. Expected NAME=VALUE.")
+    return name.strip(), value.strip()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import socket
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from ..partial import PartialState, merge_states, finalize, schema_frame, validate_partial_query
+from ..parser.parse import get_parsed_query
+from ..parser.types import ParsedQuery
+from .error import WorkerError
+from .protocol import send_message, receive_message, parse_address, encode_plan
+
+
+class Coordinator:
+    '''
+    Runs queries over a dataset sharded across ShardWorker processes. The query is parsed
+    once against the cached columns of the dataset, and the workers' partial states are
+    merged and finalized here.
+    '''
+    def __init__(self, workers: list[str | tuple[str, int]], timeout: float | None = 60):
+        if not workers:
+            raise ValueError("A coordinator needs at least one worker")
+        self.addresses = [parse_address(worker) for worker in workers]
+        self.timeout = timeout
+        self._schemas: dict[str, dict[str, str]] = {}
+
+    def describe(self, dataset: str) -> dict[str, str]:
+        '''
+        The column dtypes of a dataset, which every worker must hold with the same columns.
+        '''
+        descriptions = self._broadcast({'type': 'describe', 'dataset': dataset})
+        columns = descriptions[0][0]['dataset']['columns']
+        for address, (header, _) in zip(self.addresses, descriptions):
+            if list(header['dataset']['columns']) != list(columns):
+                raise WorkerError(address, f"The shard of '{dataset}' has the columns {list(header['dataset']['columns'])}, expected {list(columns)}")
+        return columns
+
+    def schema(self, dataset: str) -> dict[str, str]:
+        '''
+        The column dtypes of a dataset, described by the workers on first use.
+        '''
+        if dataset not in self._schemas:
+            self._schemas[dataset] = self.describe(dataset)
+        return self._schemas[dataset]
+
+    def partial_states(self, dataset: str, query: str) -> list[PartialState]:
+        return self._partial_states(dataset, query, self._parse(dataset, query))
+
+    def query(self, dataset: str, query: str, decimal_places: int = 2) -> pd.DataFrame:
+        parsed_query = self._parse(dataset, query)
+        state = merge_states(self._partial_states(dataset, query, parsed_query))
+        return finalize(state, decimal_places=decimal_places, parsed_query=parsed_query)
+
+    def _parse(self, dataset: str, query: str) -> ParsedQuery:
+        parsed_query = get_parsed_query(schema_frame(self.schema(dataset)), query)
+        validate_partial_query(parsed_query)
+        return parsed_query
+
+    def _partial_states(self, dataset: str, query: str, parsed_query: ParsedQuery) -> list[PartialState]:
+        header = {
+            'type': 'partial_aggregate',
+            'dataset': dataset,
+            'query': query,
+            'columns': list(self.schema(dataset)),
+            'plan': encode_plan(parsed_query)
+        }
+        try:
+            responses = self._broadcast(header)
+        except WorkerError:
+            # The shards may have been reloaded with other columns, so they are described again.
+            self._schemas.pop(dataset, None)
+            raise
+        return [PartialState.from_bytes(payload) for _, payload in responses]
+
+    def _broadcast(self, header: dict) -> list[tuple[dict, bytes]]:
+        with ThreadPoolExecutor(max_workers=len(self.addresses), thread_name_prefix="esql-coordinator") as executor:
+            futures = [executor.submit(self._request, address, header) for address in self.addresses]
+            return [future.result() for future in futures]
+
+    def _request(self, address: tuple[str, int], header: dict) -> tuple[dict, bytes]:
+        try:
+            with socket.create_connection(address, timeout=self.timeout) as connection:
+                send_message(connection, header)
+                message = receive_message(connection)
+        except OSError as error:
+            raise WorkerError(address, str(error)) from error
+        if message is None:
+            raise WorkerError(address, "Connection closed without a response")
+        response_header, payload = message
+        if response_header.get('status') != 'ok':
+            raise WorkerError(address, response_header.get('message', "Unknown error"))
+        return response_header, payload
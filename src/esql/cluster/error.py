@@ -0,0 +1,8 @@
+class WorkerError(Exception):
+    def __init__(self, address: tuple[str, int], message: str):
+        self.address = address
+        self.message = f"Worker {address[0]}:{address[1]} failed: {message}"
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message}"
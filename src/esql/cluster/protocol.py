@@ -0,0 +1,100 @@
+import json
+import socket
+import struct
+from datetime import date
+from typing import Any
+
+from ..parser.types import LogicalOperator, ParsedQuery
+
+
+# Every message is a JSON header and a binary payload, preceded by both their lengths.
+FRAME = struct.Struct('!IQ')
+MAX_HEADER_BYTES = 1 << 20
+
+DEFAULT_PORT = 7400
+
+
+def send_message(connection: socket.socket, header: dict, payload: bytes = b'') -> None:
+    encoded_header = json.dumps(header).encode()
+    connection.sendall(FRAME.pack(len(encoded_header), len(payload)) + encoded_header)
+    if payload:
+        connection.sendall(payload)
+
+
+def receive_message(connection: socket.socket) -> tuple[dict, bytes] | None:
+    '''
+    Read the next message from a connection. Returns None when the other side closed
+    the connection before a new message.
+    '''
+    frame = _receive_exactly(connection, FRAME.size, allow_end=True)
+    if frame is None:
+        return None
+    header_length, payload_length = FRAME.unpack(frame)
+    if header_length > MAX_HEADER_BYTES:
+        raise ConnectionError(f"Message header of {header_length} bytes is too large")
+    header = json.loads(_receive_exactly(connection, header_length))
+    return header, _receive_exactly(connection, payload_length)
+
+
+def parse_address(address: str | tuple[str, int]) -> tuple[str, int]:
+    '''
+    The host and port of an address given as 'host:port', 'host' or a (host, port) tuple.
+    '''
+    if isinstance(address, tuple):
+        return address
+    host, separator, port = address.rpartition(':')
+    if not separator:
+        return address, DEFAULT_PORT
+    if not port.isdigit():
+        raise ValueError(f"Invalid address: '{address}'. Expected HOST:PORT.")
+    return host or '127.0.0.1', int(port)
+
+
+def encode_plan(parsed_query: ParsedQuery) -> dict:
+    '''
+    A parsed query as a JSON header value, without its data. Dates and logical operators
+    become tagged objects, which decode_plan() turns back.
+    '''
+    return {key: _encode_plan_value(value) for key, value in parsed_query.items() if key != 'data'}
+
+
+def decode_plan(plan: dict) -> ParsedQuery:
+    return {'data': None, **_decode_plan_value(plan)}
+
+
+def _encode_plan_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _encode_plan_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode_plan_value(item) for item in value]
+    if isinstance(value, LogicalOperator):
+        return {'$operator': value.value}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    return value
+
+
+def _decode_plan_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode_plan_value(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if '$operator' in value:
+        return LogicalOperator(value['$operator'])
+    if '$date' in value:
+        return date.fromisoformat(value['$date'])
+    return {key: _decode_plan_value(item) for key, item in value.items()}
+
+
+def _receive_exactly(connection: socket.socket, number_of_bytes: int, allow_end: bool = False) -> bytes | None:
+    buffer = bytearray(number_of_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < number_of_bytes:
+        count = connection.recv_into(view[received:])
+        if count == 0:
+            if allow_end and received == 0:
+                return None
+            raise ConnectionError("Connection closed in the middle of a message")
+        received += count
+    return bytes(buffer)
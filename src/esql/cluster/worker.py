@@ -0,0 +1,64 @@
+import threading
+import socketserver
+
+from ..partial import partial_aggregate
+from ..parser.error import ParsingError
+from ..execution.error import RuntimeError
+from ..server.error import DatasetNotFoundError
+from ..server.registry import DatasetRegistry
+from .protocol import send_message, receive_message, decode_plan
+
+
+class ShardWorker(socketserver.ThreadingTCPServer):
+    '''
+    A TCP server that owns one shard of every dataset in its registry. It answers
+    'describe' and 'partial_aggregate' requests, the latter with a plan parsed by the
+    coordinator or a query, and computes at most `workers` queries at the same time.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], registry: DatasetRegistry, workers: int = 4):
+        super().__init__(address, _WorkerRequestHandler)
+        self.registry = registry
+        self._query_slots = threading.BoundedSemaphore(workers)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        host, port = self.server_address[:2]
+        return host, port
+
+    def handle_request_message(self, header: dict) -> tuple[dict, bytes]:
+        try:
+            dataset = self.registry.get(header.get('dataset', ''))
+            if header.get('type') == 'describe':
+                return {'status': 'ok', 'dataset': dataset.describe()}, b''
+            if header.get('type') == 'partial_aggregate':
+                parsed_query = None
+                if 'plan' in header:
+                    columns = list(dataset.data.columns)
+                    if list(header['columns']) != columns:
+                        return {'status': 'error', 'message': f"The shard of '{dataset.name}' has the columns {columns}, the plan was parsed for {list(header['columns'])}"}, b''
+                    parsed_query = decode_plan(header['plan'])
+                with self._query_slots:
+                    state = partial_aggregate(dataset.data, header['query'], catalog=dataset.catalog, parsed_query=parsed_query)
+                return {'status': 'ok', 'groups': state.number_of_groups}, state.to_bytes()
+            return {'status': 'error', 'message': f"Unknown request type: '{header.get('type')}'"}, b''
+        except (ParsingError, RuntimeError, DatasetNotFoundError) as error:
+            return {'status': 'error', 'message': str(error)}, b''
+        except Exception as error:
+            # Malformed requests and unexpected failures are reported too, so the connection keeps answering.
+            return {'status': 'error', 'message': f"{type(error).__name__}: {error}"}, b''
+
+
+class _WorkerRequestHandler(socketserver.BaseRequestHandler):
+    server: ShardWorker
+
+    def handle(self) -> None:
+        while True:
+            message = receive_message(self.request)
+            if message is None:
+                return
+            header, _ = message
+            response_header, payload = self.server.handle_request_message(header)
+            send_message(self.request, response_header, payload)
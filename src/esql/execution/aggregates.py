@@ -0,0 +1,648 @@
+import copy
+import warnings
+import numpy as np
+import pandas as pd
+
+from .error import RuntimeError
+from ..parser.types import GlobalAggregate, GroupAggregate
+from ..parser.util import parse_percentile_function
+
+
+# Number of bits of the hash that choose a HyperLogLog register (4096 registers, ~1.6% error).
+HLL_PRECISION = 12
+HLL_MIN_PRECISION = 4
+
+# Most registers that the HyperLogLog sketches of one aggregate can take (64 MB).
+HLL_MAX_REGISTERS = 1 << 26
+
+# The delta degrees of freedom of each variance function, and whether it is a standard deviation.
+VARIANCE_FUNCTIONS = {
+    'var': (1, False),
+    'stddev': (1, True),
+    'var_pop': (0, False),
+    'stddev_pop': (0, True)
+}
+
+# Exact percentiles partition the values of each group separately up to this many groups.
+PARTITION_MAX_GROUPS = 16384
+
+# Largest number of centroids per group of a t-digest, minus one.
+TDIGEST_COMPRESSION = 100
+
+
+class AggregateState:
+    '''
+    The state of one aggregate for every group, stored as arrays indexed by group id.
+    finalize() returns the value of every group and a mask of the groups with a value.
+    '''
+    # Whether update() can fold the rows in chunks at no extra cost. States that keep or
+    # recompress their values would copy them again for every chunk.
+    chunked_updates = True
+
+    def __init__(self, number_of_groups: int):
+        self.number_of_groups = number_of_groups
+        self.counts = np.zeros(number_of_groups, dtype=np.int64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        self.counts += np.bincount(group_ids, minlength=self.number_of_groups)
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.counts, self.counts > 0
+
+    def merge(self, other: 'AggregateState') -> None:
+        '''
+        Fold the state of the same groups over other rows into this state.
+        '''
+        self.counts += other.counts
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'AggregateState':
+        '''
+        A new state for coarser groups, where group_map gives the new group id of every
+        group of this state. This state is left unchanged.
+        '''
+        state = copy.copy(self)
+        state.number_of_groups = number_of_groups
+        state.counts = _sum_by_group(self.counts, group_map, number_of_groups)
+        return state
+
+
+class CountState(AggregateState):
+    pass
+
+
+class SumState(AggregateState):
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+        self._integer = _is_integer_dtype(dtype)
+        self.sums = np.zeros(number_of_groups, dtype=np.int64 if self._integer else np.float64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        if self._integer:
+            np.add.at(self.sums, group_ids, values.astype(np.int64))
+        else:
+            self.sums += np.bincount(group_ids, weights=values.astype(np.float64), minlength=self.number_of_groups)
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.sums, self.counts > 0
+
+    def merge(self, other: 'SumState') -> None:
+        super().merge(other)
+        self.sums = self.sums + other.sums
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'SumState':
+        state = super().regroup(group_map, number_of_groups)
+        state.sums = _sum_by_group(self.sums, group_map, number_of_groups)
+        return state
+
+
+class AvgState(SumState):
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups, np.float64)
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        has_value = self.counts > 0
+        averages = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(self.sums, self.counts, out=averages, where=has_value)
+        return averages, has_value
+
+
+class MinState(AggregateState):
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+        self.values = np.full(number_of_groups, _largest_value(dtype), dtype=_accumulator_dtype(dtype))
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        np.minimum.at(self.values, group_ids, values.astype(self.values.dtype))
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.values, self.counts > 0
+
+    def merge(self, other: 'MinState') -> None:
+        super().merge(other)
+        self.values = np.minimum(self.values, other.values)
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'MinState':
+        state = super().regroup(group_map, number_of_groups)
+        state.values = np.full(number_of_groups, _largest_value(self.values.dtype), dtype=self.values.dtype)
+        np.minimum.at(state.values, group_map, self.values)
+        return state
+
+
+class MaxState(AggregateState):
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+        self.values = np.full(number_of_groups, -_largest_value(dtype), dtype=_accumulator_dtype(dtype))
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        np.maximum.at(self.values, group_ids, values.astype(self.values.dtype))
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.values, self.counts > 0
+
+    def merge(self, other: 'MaxState') -> None:
+        super().merge(other)
+        self.values = np.maximum(self.values, other.values)
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'MaxState':
+        state = super().regroup(group_map, number_of_groups)
+        state.values = np.full(number_of_groups, -_largest_value(self.values.dtype), dtype=self.values.dtype)
+        np.maximum.at(state.values, group_map, self.values)
+        return state
+
+
+class VarianceState(AggregateState):
+    '''
+    The variance or standard deviation of every group, kept as count, mean and M2 and
+    merged by the parallel formula of Chan et al. ddof is 1 for the sample variance.
+    '''
+    def __init__(self, number_of_groups: int, ddof: int, square_root: bool):
+        super().__init__(number_of_groups)
+        self.ddof = ddof
+        self.square_root = square_root
+        self.means = np.zeros(number_of_groups, dtype=np.float64)
+        self.m2 = np.zeros(number_of_groups, dtype=np.float64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        values = values.astype(np.float64)
+        counts = np.bincount(group_ids, minlength=self.number_of_groups)
+        means = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(np.bincount(group_ids, weights=values, minlength=self.number_of_groups), counts, out=means, where=counts > 0)
+        m2 = np.bincount(group_ids, weights=(values - means[group_ids]) ** 2, minlength=self.number_of_groups)
+        self._combine(counts, means, m2)
+
+    def merge(self, other: 'VarianceState') -> None:
+        self._combine(other.counts, other.means, other.m2)
+
+    def _combine(self, counts: np.ndarray, means: np.ndarray, m2: np.ndarray) -> None:
+        total_counts = self.counts + counts
+        has_value = total_counts > 0
+        deltas = means - self.means
+        shares = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(counts, total_counts, out=shares, where=has_value)
+        self.m2 = self.m2 + m2 + deltas ** 2 * self.counts * shares
+        self.means = self.means + deltas * shares
+        self.counts = total_counts
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'VarianceState':
+        # The M2 of the merged groups adds the spread of their means around the new mean.
+        state = super().regroup(group_map, number_of_groups)
+        state.means = np.zeros(number_of_groups, dtype=np.float64)
+        np.divide(np.bincount(group_map, weights=self.counts * self.means, minlength=number_of_groups), state.counts, out=state.means, where=state.counts > 0)
+        state.m2 = np.bincount(group_map, weights=self.m2 + self.counts * (self.means - state.means[group_map]) ** 2, minlength=number_of_groups)
+        return state
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        has_value = self.counts > self.ddof
+        variances = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(self.m2, self.counts - self.ddof, out=variances, where=has_value)
+        return (np.sqrt(variances) if self.square_root else variances), has_value
+
+
+class CountDistinctState(AggregateState):
+    '''
+    Counts the distinct values of every group exactly. The distinct (group, value) pairs
+    are kept, so encoded string columns only store their codes. States of different
+    chunks of the same table merge by combining their pairs.
+    '''
+    chunked_updates = False
+
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+        self.group_ids = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=dtype)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        self._add_pairs(group_ids, values)
+
+    def merge(self, other: 'CountDistinctState') -> None:
+        self.counts += other.counts
+        self._add_pairs(other.group_ids, other.values)
+
+    def _add_pairs(self, group_ids: np.ndarray, values: np.ndarray) -> None:
+        group_ids = np.concatenate([self.group_ids, group_ids.astype(np.int64)])
+        values = np.concatenate([self.values, values])
+        codes, uniques = pd.factorize(values)
+        pairs = group_ids * max(len(uniques), 1) + codes
+        first = ~pd.Series(pairs).duplicated().to_numpy()
+        self.group_ids = group_ids[first]
+        self.values = values[first]
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'CountDistinctState':
+        state = super().regroup(group_map, number_of_groups)
+        state.group_ids = np.zeros(0, dtype=np.int64)
+        state.values = self.values[:0]
+        state._add_pairs(group_map[self.group_ids], self.values)
+        return state
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return np.bincount(self.group_ids, minlength=self.number_of_groups).astype(np.int64), self.counts > 0
+
+
+class HyperLogLogState(AggregateState):
+    '''
+    Estimates the distinct values of every group with a HyperLogLog sketch of 2^precision
+    registers. The precision is lowered, down to HLL_MIN_PRECISION, to keep the sketches within
+    HLL_MAX_REGISTERS, and a RuntimeWarning is issued when they still exceed it. The values
+    must be 64 bit hashes (see EncodedTable.value_hashes).
+    '''
+    def __init__(self, number_of_groups: int, precision: int = HLL_PRECISION):
+        super().__init__(number_of_groups)
+        while precision > HLL_MIN_PRECISION and number_of_groups << precision > HLL_MAX_REGISTERS:
+            precision -= 1
+        if number_of_groups << precision > HLL_MAX_REGISTERS:
+            warnings.warn(
+                f"The HyperLogLog sketches of {number_of_groups} groups take {number_of_groups << precision} bytes, more than "
+                f"the {HLL_MAX_REGISTERS} bytes of HLL_MAX_REGISTERS. Set a memory_limit to compute the groups in partitions.",
+                RuntimeWarning,
+                stacklevel=2
+            )
+        self.precision = precision
+        self.registers = np.zeros((number_of_groups, 1 << precision), dtype=np.uint8)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        hashes = _mix_hashes(values.astype(np.uint64))
+        suffix_bits = 64 - self.precision
+        register_ids = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffixes = hashes & np.uint64((1 << suffix_bits) - 1)
+        # The rank is the position of the first 1 bit of the suffix, counted from its top.
+        ranks = (suffix_bits - _bit_lengths(suffixes) + 1).astype(np.uint8)
+        flat_registers = self.registers.reshape(-1)
+        np.maximum.at(flat_registers, group_ids * (1 << self.precision) + register_ids, ranks)
+
+    def merge(self, other: 'HyperLogLogState') -> None:
+        if other.precision != self.precision:
+            raise RuntimeError(f"Cannot merge HyperLogLog sketches of precisions {self.precision} and {other.precision}")
+        self.counts += other.counts
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'HyperLogLogState':
+        state = super().regroup(group_map, number_of_groups)
+        state.registers = np.zeros((number_of_groups, self.registers.shape[1]), dtype=np.uint8)
+        np.maximum.at(state.registers, group_map, self.registers)
+        return state
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        number_of_registers = 1 << self.precision
+        estimates = np.zeros(self.number_of_groups, dtype=np.float64)
+        zeros = np.zeros(self.number_of_groups, dtype=np.int64)
+        # Groups are summed in blocks, so the powers of two never take more memory than the registers.
+        block = max(1, HLL_MAX_REGISTERS // 8 // number_of_registers)
+        for start in range(0, self.number_of_groups, block):
+            registers = self.registers[start:start + block]
+            estimates[start:start + block] = np.ldexp(1.0, -registers.astype(np.int32)).sum(axis=1)
+            zeros[start:start + block] = (registers == 0).sum(axis=1)
+        estimates = _hll_alpha(number_of_registers) * number_of_registers ** 2 / estimates
+        # Small cardinalities are estimated by linear counting of the empty registers.
+        use_linear_counting = (estimates <= 2.5 * number_of_registers) & (zeros > 0)
+        linear_counts = number_of_registers * np.log(number_of_registers / np.maximum(zeros, 1))
+        estimates = np.where(use_linear_counting, linear_counts, estimates)
+        return np.rint(estimates).astype(np.int64), self.counts > 0
+
+
+class PercentileState(AggregateState):
+    '''
+    Computes a percentile of every group exactly, interpolating linearly between the
+    closest values like numpy and pandas do.
+    '''
+    chunked_updates = False
+
+    def __init__(self, number_of_groups: int, quantile: float):
+        super().__init__(number_of_groups)
+        self.quantile = quantile
+        self.group_ids = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.float64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        self.group_ids = np.concatenate([self.group_ids, group_ids.astype(np.int64)])
+        self.values = np.concatenate([self.values, values.astype(np.float64)])
+
+    def merge(self, other: 'PercentileState') -> None:
+        self.counts += other.counts
+        self.group_ids = np.concatenate([self.group_ids, other.group_ids])
+        self.values = np.concatenate([self.values, other.values])
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'PercentileState':
+        state = super().regroup(group_map, number_of_groups)
+        state.group_ids = group_map[self.group_ids]
+        return state
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        has_value = self.counts > 0
+        percentiles = np.zeros(self.number_of_groups, dtype=np.float64)
+        present_group_ids = np.flatnonzero(has_value)
+        if len(present_group_ids) <= PARTITION_MAX_GROUPS:
+            order = _order_by_group(self.group_ids, self.number_of_groups)
+            starts = np.concatenate([[0], np.cumsum(self.counts)])
+            values = self.values[order]
+            for group_id in present_group_ids:
+                group_values = values[starts[group_id]:starts[group_id + 1]]
+                position = self.quantile * (len(group_values) - 1)
+                lower, upper = int(np.floor(position)), int(np.ceil(position))
+                partitioned = np.partition(group_values, [lower, upper])
+                percentiles[group_id] = partitioned[lower] + (partitioned[upper] - partitioned[lower]) * (position - lower)
+            return percentiles, has_value
+
+        order = _order_by_group_and_value(self.group_ids, self.values, self.number_of_groups)
+        values = self.values[order]
+        starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        positions = self.quantile * (self.counts[present_group_ids] - 1)
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        lower_values = values[starts[present_group_ids] + lower]
+        upper_values = values[starts[present_group_ids] + upper]
+        percentiles[present_group_ids] = lower_values + (upper_values - lower_values) * (positions - lower)
+        return percentiles, has_value
+
+
+class TDigestState(AggregateState):
+    '''
+    Estimates a percentile of every group with a merging t-digest of at most compression + 1
+    centroids per group, kept in flat arrays sorted by group and mean.
+    '''
+    chunked_updates = False
+
+    def __init__(self, number_of_groups: int, quantile: float, compression: int = TDIGEST_COMPRESSION):
+        super().__init__(number_of_groups)
+        self.quantile = quantile
+        self.compression = compression
+        self.group_ids = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros(0, dtype=np.float64)
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.minimums = np.full(number_of_groups, np.inf)
+        self.maximums = np.full(number_of_groups, -np.inf)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        values = values.astype(np.float64)
+        np.minimum.at(self.minimums, group_ids, values)
+        np.maximum.at(self.maximums, group_ids, values)
+        self._compress(group_ids.astype(np.int64), values, np.ones(len(values), dtype=np.float64))
+
+    def merge(self, other: 'TDigestState') -> None:
+        self.counts += other.counts
+        np.minimum(self.minimums, other.minimums, out=self.minimums)
+        np.maximum(self.maximums, other.maximums, out=self.maximums)
+        self._compress(other.group_ids, other.means, other.weights)
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'TDigestState':
+        state = super().regroup(group_map, number_of_groups)
+        state.minimums = np.full(number_of_groups, np.inf)
+        state.maximums = np.full(number_of_groups, -np.inf)
+        np.minimum.at(state.minimums, group_map, self.minimums)
+        np.maximum.at(state.maximums, group_map, self.maximums)
+        state.group_ids = np.zeros(0, dtype=np.int64)
+        state.means = np.zeros(0, dtype=np.float64)
+        state.weights = np.zeros(0, dtype=np.float64)
+        state._compress(group_map[self.group_ids], self.means, self.weights)
+        return state
+
+    def _compress(self, group_ids: np.ndarray, means: np.ndarray, weights: np.ndarray) -> None:
+        group_ids = np.concatenate([self.group_ids, group_ids])
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        if len(group_ids) == 0:
+            return
+        order = _order_by_group_and_value(group_ids, means, self.number_of_groups)
+        group_ids, means, weights = group_ids[order], means[order], weights[order]
+
+        # The share of its group's weight before the middle of every centroid.
+        weight_before = np.cumsum(weights) - weights
+        group_starts = np.flatnonzero(np.concatenate([[True], group_ids[1:] != group_ids[:-1]]))
+        group_weight_before = np.repeat(weight_before[group_starts], np.diff(np.append(group_starts, len(group_ids))))
+        totals = np.bincount(group_ids, weights=weights, minlength=self.number_of_groups)[group_ids]
+        quantiles = (weight_before - group_weight_before + weights / 2) / totals
+        # The k1 scale function puts more centroids near the extremes than in the middle.
+        buckets = np.floor(self.compression * (np.arcsin(2 * quantiles - 1) / np.pi + 0.5)).astype(np.int64)
+
+        keys = group_ids * (self.compression + 1) + buckets
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(weights * means, starts) / self.weights
+        self.group_ids = group_ids[starts]
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        has_value = self.counts > 0
+        percentiles = np.zeros(self.number_of_groups, dtype=np.float64)
+        if len(self.group_ids) == 0:
+            return percentiles, has_value
+
+        # Every centroid sits at the middle of its weight. With centroids of weight 1, the
+        # interpolation is the same as the exact one. The extremes sit at the first and last value.
+        totals = np.bincount(self.group_ids, weights=self.weights, minlength=self.number_of_groups)
+        weight_before = np.cumsum(self.weights) - self.weights
+        group_starts = np.searchsorted(self.group_ids, np.arange(self.number_of_groups))
+        group_ends = np.searchsorted(self.group_ids, np.arange(self.number_of_groups), side='right')
+        centers = weight_before - np.append(weight_before, 0)[group_starts][self.group_ids] + self.weights / 2
+        positions = centers / (totals[self.group_ids] + 1) + self.group_ids
+
+        present_group_ids = np.flatnonzero(has_value)
+        targets = self.quantile * (totals[present_group_ids] - 1) + 0.5
+        right = np.searchsorted(positions, targets / (totals[present_group_ids] + 1) + present_group_ids, side='right')
+        left = right - 1
+        has_left = left >= group_starts[present_group_ids]
+        has_right = right < group_ends[present_group_ids]
+        safe_left = np.clip(left, 0, len(self.means) - 1)
+        safe_right = np.clip(right, 0, len(self.means) - 1)
+        left_centers = np.where(has_left, centers[safe_left], 0.5)
+        left_values = np.where(has_left, self.means[safe_left], self.minimums[present_group_ids])
+        right_centers = np.where(has_right, centers[safe_right], totals[present_group_ids] - 0.5)
+        right_values = np.where(has_right, self.means[safe_right], self.maximums[present_group_ids])
+        spans = right_centers - left_centers
+        fractions = np.divide(targets - left_centers, spans, out=np.zeros(len(spans)), where=spans > 0)
+        percentiles[present_group_ids] = left_values + (right_values - left_values) * np.clip(fractions, 0, 1)
+        return percentiles, has_value
+
+
+class WeightedCountState(AggregateState):
+    '''
+    Estimates a count or sum of the whole table from a sample whose rows stand for weight
+    rows each (Horvitz-Thompson), with the variance of the estimate.
+    '''
+    def __init__(self, number_of_groups: int):
+        super().__init__(number_of_groups)
+        self.estimates = np.zeros(number_of_groups, dtype=np.float64)
+        self.variances = np.zeros(number_of_groups, dtype=np.float64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        weights = _weights_or_ones(weights, len(group_ids))
+        self._accumulate(group_ids, np.ones(len(group_ids), dtype=np.float64), weights)
+
+    def _accumulate(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray) -> None:
+        self.estimates += np.bincount(group_ids, weights=weights * values, minlength=self.number_of_groups)
+        self.variances += np.bincount(group_ids, weights=weights * (weights - 1) * values ** 2, minlength=self.number_of_groups)
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        return self.estimates, self.counts > 0
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'WeightedCountState':
+        state = super().regroup(group_map, number_of_groups)
+        state.estimates = _sum_by_group(self.estimates, group_map, number_of_groups)
+        state.variances = _sum_by_group(self.variances, group_map, number_of_groups)
+        return state
+
+    def standard_errors(self) -> np.ndarray:
+        return np.sqrt(np.maximum(self.variances, 0))
+
+
+class WeightedSumState(WeightedCountState):
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        AggregateState.update(self, group_ids, values)
+        weights = _weights_or_ones(weights, len(group_ids))
+        self._accumulate(group_ids, values.astype(np.float64), weights)
+
+
+class WeightedAvgState(AggregateState):
+    '''
+    Estimates an average as the ratio of the weighted sum and the weighted count. Its
+    variance is linearized around the ratio, from the weight * (weight - 1) sums of 1,
+    value and value^2.
+    '''
+    def __init__(self, number_of_groups: int, dtype: np.dtype):
+        super().__init__(number_of_groups)
+        self.weights = np.zeros(number_of_groups, dtype=np.float64)
+        self.sums = np.zeros(number_of_groups, dtype=np.float64)
+        self.moments = np.zeros((3, number_of_groups), dtype=np.float64)
+
+    def update(self, group_ids: np.ndarray, values: np.ndarray, weights: np.ndarray | None = None) -> None:
+        super().update(group_ids, values)
+        weights = _weights_or_ones(weights, len(group_ids))
+        values = values.astype(np.float64)
+        self.weights += np.bincount(group_ids, weights=weights, minlength=self.number_of_groups)
+        self.sums += np.bincount(group_ids, weights=weights * values, minlength=self.number_of_groups)
+        excess_weights = weights * (weights - 1)
+        for power in range(3):
+            self.moments[power] += np.bincount(group_ids, weights=excess_weights * values ** power, minlength=self.number_of_groups)
+
+    def regroup(self, group_map: np.ndarray, number_of_groups: int) -> 'WeightedAvgState':
+        state = super().regroup(group_map, number_of_groups)
+        state.weights = _sum_by_group(self.weights, group_map, number_of_groups)
+        state.sums = _sum_by_group(self.sums, group_map, number_of_groups)
+        state.moments = np.stack([_sum_by_group(moments, group_map, number_of_groups) for moments in self.moments])
+        return state
+
+    def finalize(self) -> tuple[np.ndarray, np.ndarray]:
+        has_value = self.weights > 0
+        averages = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(self.sums, self.weights, out=averages, where=has_value)
+        return averages, self.counts > 0
+
+    def standard_errors(self) -> np.ndarray:
+        averages, _ = self.finalize()
+        variances = self.moments[2] - 2 * averages * self.moments[1] + averages ** 2 * self.moments[0]
+        standard_errors = np.zeros(self.number_of_groups, dtype=np.float64)
+        np.divide(np.sqrt(np.maximum(variances, 0)), self.weights, out=standard_errors, where=self.weights > 0)
+        return standard_errors
+
+
+def aggregate_key(aggregate: GlobalAggregate | GroupAggregate) -> str:
+    if 'group' in aggregate:
+        return f"{aggregate['group']}.{aggregate['column']}.{aggregate['function']}"
+    return f"{aggregate['column']}.{aggregate['function']}"
+
+
+def create_aggregate_state(function: str, number_of_groups: int, dtype: np.dtype, weighted: bool = False) -> AggregateState:
+    # Minimums and maximums of a sample are not scaled, so they have no weighted state.
+    if weighted and function == 'count':
+        return WeightedCountState(number_of_groups)
+    elif weighted and function == 'sum':
+        return WeightedSumState(number_of_groups, dtype)
+    elif weighted and function == 'avg':
+        return WeightedAvgState(number_of_groups, dtype)
+    percentile = parse_percentile_function(function)
+    if percentile is not None:
+        quantile, approximate = percentile
+        return TDigestState(number_of_groups, quantile) if approximate else PercentileState(number_of_groups, quantile)
+    if function == 'count':
+        return CountState(number_of_groups)
+    elif function in VARIANCE_FUNCTIONS:
+        ddof, square_root = VARIANCE_FUNCTIONS[function]
+        return VarianceState(number_of_groups, ddof, square_root)
+    elif function == 'count_distinct':
+        return CountDistinctState(number_of_groups, dtype)
+    elif function == 'approx_count_distinct':
+        return HyperLogLogState(number_of_groups)
+    elif function == 'sum':
+        return SumState(number_of_groups, dtype)
+    elif function == 'avg':
+        return AvgState(number_of_groups, dtype)
+    elif function == 'min':
+        return MinState(number_of_groups, dtype)
+    elif function == 'max':
+        return MaxState(number_of_groups, dtype)
+    raise RuntimeError(f"Unknown aggregate function: '{function}'")
+
+
+def _is_integer_dtype(dtype: np.dtype) -> bool:
+    return np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_)
+
+
+def _accumulator_dtype(dtype: np.dtype) -> np.dtype:
+    return np.dtype(np.int64) if _is_integer_dtype(dtype) else np.dtype(np.float64)
+
+
+def _largest_value(dtype: np.dtype) -> int | float:
+    return np.iinfo(np.int64).max if _is_integer_dtype(dtype) else np.inf
+
+
+def _sum_by_group(values: np.ndarray, group_ids: np.ndarray, number_of_groups: int) -> np.ndarray:
+    # Integer sums stay exact, which bincount's float weights would not guarantee.
+    if values.dtype.kind in 'iu':
+        sums = np.zeros(number_of_groups, dtype=np.int64)
+        np.add.at(sums, group_ids, values)
+        return sums
+    return np.bincount(group_ids, weights=values, minlength=number_of_groups)
+
+
+def _weights_or_ones(weights: np.ndarray | None, number_of_rows: int) -> np.ndarray:
+    return np.ones(number_of_rows, dtype=np.float64) if weights is None else weights.astype(np.float64)
+
+
+def _mix_hashes(hashes: np.ndarray) -> np.ndarray:
+    # The splitmix64 finalizer, so that weak hashes (e.g. of small integers) use all 64 bits.
+    hashes = hashes + np.uint64(0x9E3779B97F4A7C15)
+    hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def _bit_lengths(values: np.ndarray) -> np.ndarray:
+    lengths = np.zeros(len(values), dtype=np.int64)
+    values = values.copy()
+    for shift in [32, 16, 8, 4, 2, 1]:
+        wide = values >= np.uint64(1 << shift)
+        lengths[wide] += shift
+        values[wide] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def _hll_alpha(number_of_registers: int) -> float:
+    if number_of_registers <= 16:
+        return 0.673
+    elif number_of_registers <= 32:
+        return 0.697
+    elif number_of_registers <= 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / number_of_registers)
+
+
+def _order_by_group(group_ids: np.ndarray, number_of_groups: int) -> np.ndarray:
+    # A stable sort of 16 bit keys is a radix sort, which is linear in the number of rows.
+    if number_of_groups <= 1 << 16:
+        return np.argsort(group_ids.astype(np.uint16), kind='stable')
+    return np.argsort(group_ids, kind='stable')
+
+
+def _order_by_group_and_value(group_ids: np.ndarray, values: np.ndarray, number_of_groups: int) -> np.ndarray:
+    # Sorting the values, then stably by group, is faster than np.lexsort on both keys.
+    order = np.argsort(values)
+    return order[_order_by_group(group_ids[order], number_of_groups)]
@@ -1,83 +1,486 @@
 import numpy as np
+import pandas as pd
 from datetime import  date
+from collections.abc import Callable
 
-from src.esql.execution.grouped_row import GroupedRow
-from src.esql.execution.error import RuntimeError
-from src.esql.parser.util import find_group_in_such_that_section
-from src.esql.parser.types import ParsedSelectClause, ParsedWhereClause, ParsedSuchThatClause, ParsedHavingClause, AggregatesDict, LogicalOperator
+from .grouped_row import GroupedRow
+from .error import RuntimeError
+from .encoding import EncodedTable
+from .grouping import compute_group_ids, first_row_of_each_group
+from .aggregates import AggregateState, WeightedCountState, WeightedAvgState, aggregate_key, create_aggregate_state
+from .index import InvertedIndex, find_posting_list
+from .predicates import PredicateCache, missing_value_satisfies
+from .statistics import TableStatistics
+from .correlation import split_emf_conditions, correlate
+from .scheduler import schedule_passes
+from .rollup import map_groups_to_grouping_set, regroup_aggregate_states
+from .sampling import DEFAULT_CONFIDENCE, confidence_interval_values
+from .cancellation import CancellationToken, CANCELLATION_CHECK_INTERVAL, AGGREGATION_CHECK_INTERVAL
+from ..parser.util import find_group_in_such_that_section, find_aggregates_in_such_that_section, find_aggregates_in_having_clause
+from ..parser.types import ParsedSelectClause, ParsedWhereClause, ParsedSuchThatClause, ParsedSuchThatSection, SimpleGroupCondition, ParsedHavingClause, AggregatesDict, GlobalAggregate, GroupAggregate, LogicalOperator
 
 
-def build_grouped_table(parsed_select_clause: ParsedSelectClause, groups: list[str] | None, parsed_where_clause: ParsedWhereClause | None, parsed_such_that_clause: ParsedSuchThatClause, parsed_having_clause: ParsedHavingClause, aggregates: AggregatesDict, datatable: list[list[int | str | bool | date]], column_indices: dict[str, int]):
+# States of sampled queries that can estimate their standard errors.
+WEIGHTED_STATES = (WeightedCountState, WeightedAvgState)
+
+# Below this fraction of the table, conditions are evaluated on the selected rows instead of the whole table.
+SPARSE_ROWS_FRACTION = 0.25
+
+
+def build_grouped_table(parsed_select_clause: ParsedSelectClause, groups: list[str] | None, parsed_where_clause: ParsedWhereClause | None, parsed_such_that_clause: ParsedSuchThatClause, parsed_having_clause: ParsedHavingClause, aggregates: AggregatesDict, encoded_table: EncodedTable, indexes: dict[str, InvertedIndex] | None = None, statistics: TableStatistics | None = None, cancellation_token: CancellationToken | None = None, weights: np.ndarray | None = None, confidence: float = DEFAULT_CONFIDENCE) -> list[GroupedRow]:
+    '''
+    Group the rows, compute the aggregates of every group and return the groups that satisfy
+    the HAVING clause. With the weights of a sampled table, sums, counts and averages are
+    estimates for the whole table and get confidence interval bounds as extra aggregates.
+    '''
     grouping_attributes = parsed_select_clause['grouping_attributes']
-    global_aggregates = aggregates['global_scope']
-    group_aggregates = aggregates['group_specific']
 
-    filtered_datatable = datatable
+    # The group id of every row is computed once and reused by every pass below.
+    group_ids, number_of_groups = compute_group_ids(encoded_table, grouping_attributes, statistics)
+    aggregate_states = {
+        aggregate_key(aggregate): create_aggregate_state(
+            function=aggregate['function'],
+            number_of_groups=number_of_groups,
+            dtype=encoded_table.columns[aggregate['column']].dtype,
+            weighted=weights is not None
+        )
+        for aggregate in aggregates['global_scope'] + aggregates['group_specific']
+    }
+
+    # Predicates shared by the WHERE clause and the grouping variables are evaluated once.
+    predicate_cache = PredicateCache(encoded_table, cancellation_token, statistics)
+    # EMF conditions are joined with the groups by hashing, the rest of a section selects rows.
+    sections = {
+        find_group_in_such_that_section(section): section
+        for section in parsed_such_that_clause or []
+    }
+    split_sections = {group: split_emf_conditions(section) for group, section in sections.items()}
+    local_conditions = [local_condition for _, local_condition in split_sections.values()]
+    for condition in [parsed_where_clause, *local_conditions]:
+        if condition:
+            predicate_cache.register(condition)
+
+    filtered_row_ids = np.arange(len(group_ids), dtype=np.int64)
+    filtered_row_mask = None
     if parsed_where_clause:
-        filtered_datatable = [datatable_row for datatable_row in datatable 
+        filtered_row_ids = _select_rows(
+            condition=parsed_where_clause,
+            encoded_table=encoded_table,
+            predicate_cache=predicate_cache,
+            row_ids=filtered_row_ids,
+            row_mask=None,
+            indexes=indexes,
+            cancellation_token=cancellation_token
+        )
+        filtered_row_mask = np.zeros(len(group_ids), dtype=bool)
+        filtered_row_mask[filtered_row_ids] = True
+
+    # Aggregates become available to the SUCH THAT conditions once their pass is complete.
+    aggregate_values = {}
+    predicate_cache.group_ids = group_ids
+    predicate_cache.aggregate_values = aggregate_values
+    passes = schedule_passes(groups or [], sections)
+    group_row_ids_by_group = None
+    standard_errors = {}
+
+    def compute_aggregates(keys: set[str], row_ids: np.ndarray, row_mask: np.ndarray | None) -> None:
+        # row_ids can exclude the rows of groups that were already removed, but rows of any
+        # group can be correlated with a group by EMF conditions, so those always use every row.
+        nonlocal group_row_ids_by_group
+        _update_aggregate_states(
+            aggregate_states=aggregate_states,
+            aggregates=[aggregate for aggregate in aggregates['global_scope'] if aggregate_key(aggregate) in keys],
+            row_ids=row_ids,
+            group_ids=group_ids,
+            encoded_table=encoded_table,
+            weights=weights,
+            cancellation_token=cancellation_token
+        )
+        aggregate_values.update({
+            aggregate_key(aggregate): aggregate_states[aggregate_key(aggregate)].finalize()
+            for aggregate in aggregates['global_scope'] if aggregate_key(aggregate) in keys
+        })
+        for scheduled_groups in passes:
+            for group in scheduled_groups:
+                group_aggregates = [
+                    aggregate for aggregate in aggregates['group_specific']
+                    if aggregate['group'] == group and aggregate_key(aggregate) in keys
+                ]
+                if group not in split_sections or not group_aggregates:
+                    continue
+                if cancellation_token is not None:
+                    cancellation_token.raise_if_cancelled()
+                emf_conditions, local_condition = split_sections[group]
+                section_row_ids, section_row_mask = (filtered_row_ids, filtered_row_mask) if emf_conditions else (row_ids, row_mask)
+                group_row_ids = section_row_ids
+                if local_condition:
+                    group_row_ids = _select_rows(
+                        condition=local_condition,
+                        encoded_table=encoded_table,
+                        predicate_cache=predicate_cache,
+                        row_ids=section_row_ids,
+                        row_mask=section_row_mask,
+                        indexes=indexes,
+                        cancellation_token=cancellation_token
+                    )
+                if not emf_conditions:
+                    _update_aggregate_states(
+                        aggregate_states=aggregate_states,
+                        aggregates=group_aggregates,
+                        row_ids=group_row_ids,
+                        group_ids=group_ids,
+                        encoded_table=encoded_table,
+                        weights=weights,
+                        cancellation_token=cancellation_token
+                    )
+                    aggregate_values.update({
+                        aggregate_key(aggregate): aggregate_states[aggregate_key(aggregate)].finalize()
+                        for aggregate in group_aggregates
+                    })
+                    continue
+                if group_row_ids_by_group is None:
+                    group_row_ids_by_group = first_row_of_each_group(group_ids)
+                correlated_values, correlated_standard_errors = _compute_correlated_aggregates(
+                    emf_conditions=emf_conditions,
+                    aggregates=group_aggregates,
+                    row_ids=group_row_ids,
+                    group_row_ids=group_row_ids_by_group,
+                    encoded_table=encoded_table,
+                    weights=weights,
+                    cancellation_token=cancellation_token
+                )
+                aggregate_values.update(correlated_values)
+                standard_errors.update(correlated_standard_errors)
+        # Groups without a SUCH THAT section keep their empty aggregates.
+        for key in keys:
+            if key not in aggregate_values:
+                aggregate_values[key] = aggregate_states[key].finalize()
+            if key not in standard_errors and isinstance(aggregate_states[key], WEIGHTED_STATES):
+                standard_errors[key] = aggregate_states[key].standard_errors()
+
+    # Only groups with a row that passed the WHERE clause exist, in order of first appearance.
+    # Renumbering them by first appearance among these rows finds them in linear time.
+    present_group_codes, output_group_ids = pd.factorize(group_ids[filtered_row_ids])
+    output_group_ids = output_group_ids.astype(np.int64)
+    first_row_ids = filtered_row_ids[first_row_of_each_group(present_group_codes)]
+
+    if 'grouping_sets' in parsed_select_clause:
+        compute_aggregates(set(aggregate_states), filtered_row_ids, filtered_row_mask)
+        return _build_grouping_sets(
+            grouping_sets=parsed_select_clause['grouping_sets'],
+            parsed_having_clause=parsed_having_clause,
+            aggregates=aggregates,
+            aggregate_states=aggregate_states,
+            group_ids=group_ids,
+            output_group_ids=output_group_ids,
+            first_row_ids=first_row_ids,
+            encoded_table=encoded_table,
+            weighted=weights is not None,
+            confidence=confidence
+        )
+
+    if not parsed_having_clause:
+        compute_aggregates(set(aggregate_states), filtered_row_ids, filtered_row_mask)
+    else:
+        # The aggregates HAVING needs are computed first. The other aggregates, including the
+        # passes of grouping variables that HAVING does not need, only visit the rows of the
+        # groups that satisfy it.
+        having_keys = _find_aggregates_needed_by_having_clause(parsed_having_clause, sections)
+        compute_aggregates(having_keys, filtered_row_ids, filtered_row_mask)
+        having_mask = _evaluate_having_clause(
+            condition=parsed_having_clause,
+            aggregate_values=aggregate_values
+        )
+        keep = having_mask[output_group_ids]
+        output_group_ids = output_group_ids[keep]
+        first_row_ids = first_row_ids[keep]
+
+        remaining_keys = set(aggregate_states) - having_keys
+        if remaining_keys:
+            surviving_row_ids = filtered_row_ids[having_mask[group_ids[filtered_row_ids]]]
+            surviving_row_mask = np.zeros(len(group_ids), dtype=bool)
+            surviving_row_mask[surviving_row_ids] = True
+            compute_aggregates(remaining_keys, surviving_row_ids, surviving_row_mask)
+
+    if weights is not None:
+        aggregate_values.update(confidence_interval_values(aggregate_values, standard_errors, confidence))
+    return _materialize_grouped_rows(
+        grouping_attributes=grouping_attributes,
+        aggregates=aggregates,
+        aggregate_values=aggregate_values,
+        output_group_ids=output_group_ids,
+        first_row_ids=first_row_ids,
+        encoded_table=encoded_table
+    )
+
+
+def filter_rows(parsed_where_clause: ParsedWhereClause | ParsedSuchThatSection, encoded_table: EncodedTable, indexes: dict[str, InvertedIndex] | None = None, statistics: TableStatistics | None = None, cancellation_token: CancellationToken | None = None) -> np.ndarray:
+    '''
+    Return the sorted ids of the rows that satisfy a WHERE clause or SUCH THAT section.
+    '''
+    predicate_cache = PredicateCache(encoded_table, cancellation_token, statistics)
+    predicate_cache.register(parsed_where_clause)
+    number_of_rows = len(encoded_table.columns[encoded_table.column_names[0]]) if encoded_table.column_names else 0
+    return _select_rows(
+        condition=parsed_where_clause,
+        encoded_table=encoded_table,
+        predicate_cache=predicate_cache,
+        row_ids=np.arange(number_of_rows, dtype=np.int64),
+        row_mask=None,
+        indexes=indexes,
+        cancellation_token=cancellation_token
+    )
+
+
+def build_aggregate_states(parsed_select_clause: ParsedSelectClause, parsed_where_clause: ParsedWhereClause | None, parsed_such_that_clause: ParsedSuchThatClause | None, aggregates: AggregatesDict, encoded_table: EncodedTable, statistics: TableStatistics | None = None, cancellation_token: CancellationToken | None = None) -> tuple[np.ndarray, dict[str, AggregateState]]:
+    '''
+    Compute the aggregate states of the groups of the rows that satisfy the WHERE clause,
+    without finalizing them. Only SUCH THAT sections that select rows by themselves are
+    supported, since the states of other sections depend on the whole group.
+    Returns the first row of every group and the states, both indexed by group id.
+    '''
+    row_ids = filter_rows(parsed_where_clause, encoded_table, None, statistics, cancellation_token) if parsed_where_clause else None
+    filtered_table = encoded_table if row_ids is None else encoded_table.take(row_ids)
+    group_ids, number_of_groups = compute_group_ids(filtered_table, parsed_select_clause['grouping_attributes'])
+    aggregate_states = {
+        aggregate_key(aggregate): create_aggregate_state(
+            function=aggregate['function'],
+            number_of_groups=number_of_groups,
+            dtype=encoded_table.columns[aggregate['column']].dtype
+        )
+        for aggregate in aggregates['global_scope'] + aggregates['group_specific']
+    }
+    _update_aggregate_states(
+        aggregate_states=aggregate_states,
+        aggregates=aggregates['global_scope'],
+        row_ids=np.arange(len(group_ids), dtype=np.int64),
+        group_ids=group_ids,
+        encoded_table=filtered_table,
+        cancellation_token=cancellation_token
+    )
+    for section in parsed_such_that_clause or []:
+        group = find_group_in_such_that_section(section)
+        group_aggregates = [aggregate for aggregate in aggregates['group_specific'] if aggregate['group'] == group]
+        if not group_aggregates:
+            continue
+        _update_aggregate_states(
+            aggregate_states=aggregate_states,
+            aggregates=group_aggregates,
+            row_ids=filter_rows(section, filtered_table, cancellation_token=cancellation_token),
+            group_ids=group_ids,
+            encoded_table=filtered_table,
+            cancellation_token=cancellation_token
+        )
+
+    first_row_ids = first_row_of_each_group(group_ids)
+    return (first_row_ids if row_ids is None else row_ids[first_row_ids]), aggregate_states
+
+
+def build_grouped_table_from_states(parsed_having_clause: ParsedHavingClause | None, aggregates: AggregatesDict, aggregate_states: dict[str, AggregateState], grouping_attributes: list[str], encoded_table: EncodedTable) -> list[GroupedRow]:
+    '''
+    Finalize the aggregate states and return the groups that satisfy the HAVING clause.
+    Row i of encoded_table holds the grouping attributes of group i.
+    '''
+    aggregate_values = {key: state.finalize() for key, state in aggregate_states.items()}
+    output_group_ids = np.arange(len(encoded_table.columns[grouping_attributes[0]]), dtype=np.int64)
+    if parsed_having_clause:
+        output_group_ids = output_group_ids[_evaluate_having_clause(
+            condition=parsed_having_clause,
+            aggregate_values=aggregate_values
+        )]
+    return _materialize_grouped_rows(
+        grouping_attributes=grouping_attributes,
+        aggregates=aggregates,
+        aggregate_values=aggregate_values,
+        output_group_ids=output_group_ids,
+        first_row_ids=output_group_ids,
+        encoded_table=encoded_table
+    )
+
+
+def _build_grouping_sets(grouping_sets: list[list[str]], parsed_having_clause: ParsedHavingClause | None, aggregates: AggregatesDict, aggregate_states: dict[str, AggregateState], group_ids: np.ndarray, output_group_ids: np.ndarray, first_row_ids: np.ndarray, encoded_table: EncodedTable, weighted: bool, confidence: float) -> list[GroupedRow]:
+    '''
+    Return the groups of every grouping set of a ROLLUP, CUBE or GROUPING SETS query, one
+    grouping set after the other. The rows were aggregated once by all the grouping attributes,
+    and every grouping set merges the states of those groups. The attributes that are not in
+    a grouping set are missing from its groups.
+    '''
+    group_row_ids = first_row_of_each_group(group_ids)
+    grouped_table = []
+    for grouping_set in grouping_sets:
+        group_map, number_of_groups = map_groups_to_grouping_set(encoded_table, group_row_ids, grouping_set)
+        set_states = regroup_aggregate_states(aggregate_states, group_map, number_of_groups)
+        set_values = {key: state.finalize() for key, state in set_states.items()}
+        if weighted:
+            standard_errors = {key: state.standard_errors() for key, state in set_states.items() if isinstance(state, WEIGHTED_STATES)}
+            set_values.update(confidence_interval_values(set_values, standard_errors, confidence))
+
+        # The groups of the grouping set, in order of first appearance of their finest groups.
+        set_group_codes, set_output_group_ids = pd.factorize(group_map[output_group_ids])
+        set_output_group_ids = set_output_group_ids.astype(np.int64)
+        set_first_row_ids = first_row_ids[first_row_of_each_group(set_group_codes)]
+        if parsed_having_clause:
+            keep = _evaluate_having_clause(
+                condition=parsed_having_clause,
+                aggregate_values=set_values
+            )[set_output_group_ids]
+            set_output_group_ids = set_output_group_ids[keep]
+            set_first_row_ids = set_first_row_ids[keep]
+
+        grouped_table.extend(_materialize_grouped_rows(
+            grouping_attributes=grouping_set,
+            aggregates=aggregates,
+            aggregate_values=set_values,
+            output_group_ids=set_output_group_ids,
+            first_row_ids=set_first_row_ids,
+            encoded_table=encoded_table
+        ))
+    return grouped_table
+
+
+def _select_rows(condition: ParsedWhereClause | ParsedSuchThatSection, encoded_table: EncodedTable, predicate_cache: PredicateCache, row_ids: np.ndarray, row_mask: np.ndarray | None, indexes: dict[str, InvertedIndex] | None, cancellation_token: CancellationToken | None) -> np.ndarray:
+    '''
+    Return the sorted ids of the rows in row_ids that satisfy the condition, with an inverted
+    index when one applies and with the masks of the predicate cache otherwise. row_mask
+    marks the same rows over the whole table, or is None when row_ids contains every row.
+    '''
+    posting_list = find_posting_list(condition, indexes)
+    if posting_list is None:
+        if row_mask is not None and len(row_ids) < SPARSE_ROWS_FRACTION * len(row_mask):
+            return row_ids[predicate_cache.evaluate_rows(condition, row_ids)]
+        mask = predicate_cache.mask(condition)
+        if row_mask is not None:
+            mask = mask & row_mask
+        return np.flatnonzero(mask)
+
+    candidate_row_ids, exact = posting_list
+    if row_mask is not None:
+        candidate_row_ids = candidate_row_ids[row_mask[candidate_row_ids]]
+    if exact:
+        return candidate_row_ids
+    if find_aggregates_in_such_that_section(condition):
+        # Comparisons with aggregates need the group of each row, which only the masks have.
+        return candidate_row_ids[predicate_cache.evaluate_rows(condition, candidate_row_ids)]
+
+    datatable = encoded_table.rows()
+    column_indices = encoded_table.column_indices
+    return np.fromiter(
+        (row_id for row_id in _scan(candidate_row_ids.tolist(), cancellation_token)
             if _evaluate_condition(
-                condition=parsed_where_clause,
-                row=datatable_row,
+                condition=condition,
+                row=datatable[row_id],
                 column_indices=column_indices
             )
-        ]
-
-    grouped_rows = {}
-    for datatable_row in filtered_datatable:
-        grouping_attribute_combination = tuple(datatable_row[column_indices[attribute]] for attribute in grouping_attributes)
-        if grouping_attribute_combination in grouped_rows:
-            grouped_row = grouped_rows.get(grouping_attribute_combination)
-            for aggregate in global_aggregates:
-                grouped_row.update_data_map(aggregate, datatable_row)
-        else:
-            grouped_row = GroupedRow(
-                grouping_attributes=grouping_attributes,
-                aggregates=aggregates,
-                initial_row=datatable_row,
-                column_indices=column_indices
-            )
-            grouped_rows[grouping_attribute_combination] = grouped_row 
-    
-    if parsed_such_that_clause: 
-        for group in groups:
-            group_such_that_section = next(
-                (such_that_section 
-                for such_that_section in parsed_such_that_clause 
-                if find_group_in_such_that_section(such_that_section) == group),
-                None
-            )
-            if not group_such_that_section:
-                continue
-            for datatable_row in filtered_datatable:
-                if _evaluate_condition(
-                    condition=group_such_that_section,
-                    row=datatable_row,
-                    column_indices=column_indices
-                ):
-                    grouping_attribute_combination = tuple(datatable_row[column_indices[attribute]] for attribute in grouping_attributes)
-                    grouped_row = grouped_rows.get(grouping_attribute_combination)
-                    if grouped_row:
-                        for aggregate in group_aggregates:
-                            if aggregate['group'] == group:
-                                grouped_row.update_data_map(
-                                    aggregate=aggregate,
-                                    row=datatable_row
-                                )
-
-    grouped_table = list(grouped_rows.values())
-    for grouped_row in grouped_table:
-        grouped_row.convert_avg_in_data_map()
-    
-    if parsed_having_clause:
-        grouped_table = [grouped_row for grouped_row in grouped_table
-            if _evaluate_having_clause(
-                condition=parsed_having_clause,
-                data_map=grouped_row.data_map
+        ),
+        dtype=np.int64
+    )
+
+
+def _compute_correlated_aggregates(emf_conditions: list[SimpleGroupCondition], aggregates: list[GroupAggregate], row_ids: np.ndarray, group_row_ids: np.ndarray, encoded_table: EncodedTable, weights: np.ndarray | None = None, cancellation_token: CancellationToken | None = None) -> tuple[dict[str, tuple[np.ndarray, np.ndarray]], dict[str, np.ndarray]]:
+    '''
+    Compute the aggregates of a grouping variable with EMF conditions by hashing rows and
+    groups on the compared columns, and the standard errors when the rows are weighted.
+    '''
+    row_keys, group_keys, number_of_keys = correlate(encoded_table, emf_conditions, row_ids, group_row_ids)
+    key_states = {
+        aggregate_key(aggregate): create_aggregate_state(
+            function=aggregate['function'],
+            number_of_groups=number_of_keys,
+            dtype=encoded_table.columns[aggregate['column']].dtype,
+            weighted=weights is not None
+        )
+        for aggregate in aggregates
+    }
+    matched = row_keys >= 0
+    keys_by_row = np.full(len(encoded_table.columns[encoded_table.column_names[0]]), -1, dtype=np.int64)
+    keys_by_row[row_ids[matched]] = row_keys[matched]
+    _update_aggregate_states(
+        aggregate_states=key_states,
+        aggregates=aggregates,
+        row_ids=row_ids[matched],
+        group_ids=keys_by_row,
+        encoded_table=encoded_table,
+        weights=weights,
+        cancellation_token=cancellation_token
+    )
+
+    group_matched = group_keys >= 0
+    safe_group_keys = np.where(group_matched, group_keys, 0)
+    correlated_values = {}
+    correlated_standard_errors = {}
+    for key, state in key_states.items():
+        values, has_value = state.finalize()
+        if number_of_keys == 0:
+            correlated_values[key] = (np.zeros(len(group_keys), dtype=values.dtype), np.zeros(len(group_keys), dtype=bool))
+            if isinstance(state, WEIGHTED_STATES):
+                correlated_standard_errors[key] = np.zeros(len(group_keys), dtype=np.float64)
+            continue
+        correlated_values[key] = (values[safe_group_keys], has_value[safe_group_keys] & group_matched)
+        if isinstance(state, WEIGHTED_STATES):
+            correlated_standard_errors[key] = state.standard_errors()[safe_group_keys]
+    return correlated_values, correlated_standard_errors
+
+
+def _update_aggregate_states(aggregate_states: dict[str, AggregateState], aggregates: list[GlobalAggregate | GroupAggregate], row_ids: np.ndarray, group_ids: np.ndarray, encoded_table: EncodedTable, weights: np.ndarray | None = None, cancellation_token: CancellationToken | None = None) -> None:
+    # The same aggregate can be listed more than once (e.g. in SELECT and HAVING), but it is only updated once per pass.
+    updated_keys = set()
+    for aggregate in aggregates:
+        key = aggregate_key(aggregate)
+        if key in updated_keys:
+            continue
+        updated_keys.add(key)
+        column = aggregate['column']
+        valid_row_ids = row_ids[encoded_table.is_valid(column)[row_ids]]
+        # Sketches are built from hashes of the values, which are the same in every chunk of the data.
+        values = encoded_table.value_hashes(column) if aggregate['function'] == 'approx_count_distinct' else encoded_table.columns[column]
+        state = aggregate_states[key]
+        chunk_size = max(len(valid_row_ids), 1)
+        if cancellation_token is not None and state.chunked_updates:
+            chunk_size = min(chunk_size, AGGREGATION_CHECK_INTERVAL)
+        for start in range(0, max(len(valid_row_ids), 1), chunk_size):
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
+            chunk_row_ids = valid_row_ids[start:start + chunk_size]
+            state.update(
+                group_ids=group_ids[chunk_row_ids],
+                values=values[chunk_row_ids],
+                weights=None if weights is None else weights[chunk_row_ids]
             )
-        ]
+
+
+def _materialize_grouped_rows(grouping_attributes: list[str], aggregates: AggregatesDict, aggregate_values: dict[str, tuple[np.ndarray, np.ndarray]], output_group_ids: np.ndarray, first_row_ids: np.ndarray, encoded_table: EncodedTable) -> list[GroupedRow]:
+    attribute_values = {
+        attribute: encoded_table.row_values(attribute, first_row_ids)
+        for attribute in grouping_attributes
+    }
+    output_values = {
+        key: (values[output_group_ids].tolist(), has_value[output_group_ids].tolist())
+        for key, (values, has_value) in aggregate_values.items()
+    }
+    grouped_table = []
+    for position in range(len(first_row_ids)):
+        data_map = {attribute: values[position] for attribute, values in attribute_values.items()}
+        for key, (values, has_value) in output_values.items():
+            if has_value[position]:
+                data_map[key] = values[position]
+        grouped_table.append(GroupedRow.from_data_map(
+            grouping_attributes=grouping_attributes,
+            aggregates=aggregates,
+            data_map=data_map
+        ))
     return grouped_table
 
 
+def _scan(datatable: list[list[int | str | bool | date]], cancellation_token: CancellationToken | None):
+    if cancellation_token is None:
+        yield from datatable
+        return
+    for row_number, datatable_row in enumerate(datatable):
+        if row_number % CANCELLATION_CHECK_INTERVAL == 0:
+            cancellation_token.raise_if_cancelled()
+        yield datatable_row
+
+
 ###############################################################################
 # Evaluation
 ###############################################################################
@@ -87,9 +490,11 @@ def _evaluate_condition(condition: dict, row: list, column_indices: dict[str, in
         column = condition.get('column')
         condition_value = condition.get('value')
         column_index = column_indices.get(column)
-        if not column_index:
+        if column_index is None:
             raise RuntimeError(f"Column '{column}' not found in datatable")
         actual_value = row[column_index]
+        if actual_value is None:
+            return missing_value_satisfies(operator)
         return _evaluate_actual_vs_expected_value(
             actual_value=actual_value,
             operator=operator,
@@ -118,39 +523,55 @@ def _evaluate_condition(condition: dict, row: list, column_indices: dict[str, in
         raise RuntimeError(f"Unknown logical operator: {operator}")
 
 
-def _evaluate_having_clause(condition: ParsedHavingClause, data_map: dict[str, str | int | bool | date]) -> bool:
+def _find_aggregates_needed_by_having_clause(condition: ParsedHavingClause, sections: dict[str, ParsedSuchThatSection]) -> set[str]:
+    '''
+    The keys of the aggregates in the HAVING clause, and of the aggregates that the SUCH THAT
+    sections of their grouping variables compare with, transitively.
+    '''
+    needed_keys = set()
+    pending = find_aggregates_in_having_clause(condition)
+    while pending:
+        aggregate = pending.pop()
+        key = aggregate_key(aggregate)
+        if key in needed_keys:
+            continue
+        needed_keys.add(key)
+        if 'group' in aggregate and aggregate['group'] in sections:
+            pending.extend(find_aggregates_in_such_that_section(sections[aggregate['group']]))
+    return needed_keys
+
+
+def _evaluate_having_clause(condition: ParsedHavingClause, aggregate_values: dict[str, tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    '''
+    Evaluate the HAVING clause for every group at once and return a mask indexed by group id.
+    Groups without a value for an aggregate never satisfy a comparison on it.
+    '''
     operator = condition.get('operator')
     if operator == LogicalOperator.NOT:
-        return not _evaluate_having_clause(
+        return ~_evaluate_having_clause(
             condition=condition.get('condition'),
-            data_map=data_map
+            aggregate_values=aggregate_values
         )
 
     if 'conditions' in condition:
+        masks = [_evaluate_having_clause(
+            condition=sub_condition,
+            aggregate_values=aggregate_values
+        ) for sub_condition in condition['conditions']]
         if operator == LogicalOperator.AND:
-            return all(_evaluate_having_clause(
-                condition=and_condition,
-                data_map=data_map
-            ) for and_condition in condition['conditions'])
+            return np.logical_and.reduce(masks)
         elif operator == LogicalOperator.OR:
-            return any(_evaluate_having_clause(
-                condition=or_condition, 
-                data_map=data_map
-            ) for or_condition in condition['conditions'])
+            return np.logical_or.reduce(masks)
         else:
             raise RuntimeError(f"Unknown logical operator in HAVING clause: '{operator}'")
 
     condition_aggregate = condition.get('aggregate')
-    if 'function' in condition_aggregate:
-        if 'group' in condition_aggregate:
-            aggregate_key = f"{condition_aggregate['group']}.{condition_aggregate['column']}.{condition_aggregate['function']}"
-        else:
-            aggregate_key = f"{condition_aggregate['column']}.{condition_aggregate['function']}"
-    else:
+    if 'function' not in condition_aggregate:
         raise RuntimeError(f"Could not recognize the condition in the HAVING clause: '{condition}'")
     
-    return _evaluate_actual_vs_expected_value(
-        actual_value=data_map.get(aggregate_key),
+    values, has_value = aggregate_values[aggregate_key(condition_aggregate)]
+    return has_value & _evaluate_actual_vs_expected_value(
+        actual_value=values,
         operator=operator,
         condition_value=condition.get('value')
     )
@@ -170,7 +591,7 @@ def _evaluate_actual_vs_expected_value(actual_value: str | int | bool | date, op
     elif operator == '!=':
         return actual_value != condition_value
     else:
-        raise RuntimeError(f"Unknown operator in condition: '{condition}'")
+        raise RuntimeError(f"Unknown operator in condition: '{operator}'")
 
 
 ###############################################################################
@@ -192,15 +613,24 @@ def project_select_attributes(parsed_select_clause: ParsedSelectClause, grouped_
 
 
 def order_by_sort(projected_table: list[dict[str, str | int | bool | date]], order_by: int, grouping_attributes: list[str]) -> list[dict[str, str | int | bool | date]]:
-    if order_by > 0:
-        grouping_attribute_sort_keys = tuple(grouping_attributes[:order_by])
-        projected_table.sort(key=lambda row: tuple(row.get(grouping_attribute) for grouping_attribute in grouping_attribute_sort_keys))
-    elif order_by < 0:
-        grouping_attribute_sort_keys = tuple(grouping_attributes[:abs(order_by)])
-        projected_table.sort(key=lambda row: tuple(row.get(grouping_attribute) for grouping_attribute in grouping_attribute_sort_keys), reverse=True)
+    # Missing grouping attributes (of the coarser grouping sets) sort after every value.
+    if order_by != 0:
+        projected_table.sort(key=order_by_key(order_by, grouping_attributes), reverse=order_by < 0)
     return projected_table
 
 
+def order_by_key(order_by: int, grouping_attributes: list[str]) -> Callable[[dict], tuple]:
+    '''
+    The key by which order_by_sort orders the projected rows, in reverse for a negative order_by.
+    '''
+    grouping_attribute_sort_keys = tuple(grouping_attributes[:abs(order_by)])
+    return lambda row: tuple(_sort_key(row.get(grouping_attribute)) for grouping_attribute in grouping_attribute_sort_keys)
+
+
+def _sort_key(value: str | int | bool | date | None) -> tuple[bool, str | int | bool | date | None]:
+    return (value is None, value)
+
+
 
 
 
@@ -0,0 +1,31 @@
+import threading
+
+from .error import QueryCancelledError
+
+
+# Number of rows a scan processes between cancellation checks.
+CANCELLATION_CHECK_INTERVAL = 4096
+
+# Number of rows an aggregate update folds between cancellation checks. Every update call
+# has a fixed cost, so aggregates check less often than scans.
+AGGREGATION_CHECK_INTERVAL = 64 * CANCELLATION_CHECK_INTERVAL
+
+
+class CancellationToken:
+    '''
+    Shared flag that lets another thread stop a running query. Scans check it every
+    CANCELLATION_CHECK_INTERVAL rows and aggregate updates every AGGREGATION_CHECK_INTERVAL rows.
+    '''
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise QueryCancelledError()
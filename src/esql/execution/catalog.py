@@ -0,0 +1,57 @@
+import threading
+import pandas as pd
+
+from .error import RuntimeError
+from .encoding import EncodedTable
+from .index import InvertedIndex
+from .statistics import TableStatistics, ZONE_MAP_BLOCK_SIZE
+
+
+class DatasetCatalog:
+    '''
+    Structures that are built once per dataset and reused by every query on it.
+
+    The encoded table and the column statistics are created on first use. Inverted
+    indexes are optional and only exist for the columns passed to create_index().
+    '''
+    def __init__(self, data: pd.DataFrame, zone_map_block_size: int = ZONE_MAP_BLOCK_SIZE):
+        self.data = data
+        self.zone_map_block_size = zone_map_block_size
+        self._encoded_table: EncodedTable | None = None
+        self._statistics: TableStatistics | None = None
+        self._indexes: dict[str, InvertedIndex] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def encoded_table(self) -> EncodedTable:
+        if self._encoded_table is None:
+            with self._lock:
+                if self._encoded_table is None:
+                    self._encoded_table = EncodedTable(self.data)
+        return self._encoded_table
+
+    @property
+    def statistics(self) -> TableStatistics:
+        if self._statistics is None:
+            encoded_table = self.encoded_table
+            with self._lock:
+                if self._statistics is None:
+                    self._statistics = TableStatistics(encoded_table, self.zone_map_block_size)
+        return self._statistics
+
+    def create_index(self, column: str) -> InvertedIndex:
+        if column not in self.data.columns:
+            raise RuntimeError(f"Column '{column}' not found in datatable")
+        if column not in self._indexes:
+            index = InvertedIndex(self.encoded_table.columns[column], self.encoded_table.is_valid(column))
+            with self._lock:
+                self._indexes.setdefault(column, index)
+        return self._indexes[column]
+
+    def drop_index(self, column: str) -> None:
+        with self._lock:
+            self._indexes.pop(column, None)
+
+    @property
+    def indexes(self) -> dict[str, InvertedIndex]:
+        return dict(self._indexes)
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from .encoding import EncodedTable
+from ..parser.types import ParsedSuchThatSection, SimpleGroupCondition, LogicalOperator
+
+
+def split_emf_conditions(section: ParsedSuchThatSection) -> tuple[list[SimpleGroupCondition], ParsedSuchThatSection | None]:
+    '''
+    Split a SUCH THAT section into its EMF conditions, which compare a column with a
+    grouping attribute of the current group, and the rest of the section, which can still
+    compare with aggregates. The parser only allows EMF conditions that are combined with
+    the rest of the section by 'and'.
+    '''
+    if 'column' in section:
+        return ([section], None) if section.get('is_emf') and 'attribute' in section['value'] else ([], section)
+    if section['operator'] != LogicalOperator.AND:
+        return [], section
+
+    emf_conditions = []
+    local_conditions = []
+    for condition in section['conditions']:
+        condition_emf_conditions, local_condition = split_emf_conditions(condition)
+        emf_conditions.extend(condition_emf_conditions)
+        if local_condition is not None:
+            local_conditions.append(local_condition)
+    if not local_conditions:
+        return emf_conditions, None
+    if len(local_conditions) == 1:
+        return emf_conditions, local_conditions[0]
+    return emf_conditions, {**section, 'conditions': local_conditions}
+
+
+def correlate(encoded_table: EncodedTable, emf_conditions: list[SimpleGroupCondition], row_ids: np.ndarray, group_row_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray, int]:
+    '''
+    Hash join the rows with the groups on the EMF conditions. Returns the keys of the rows,
+    the keys of the groups (read from group_row_ids) and the number of keys. Rows and groups
+    with a missing compared value get the key -1 and match nothing.
+    '''
+    number_of_rows = len(row_ids)
+    keys = np.zeros(number_of_rows + len(group_row_ids), dtype=np.int64)
+    valid = np.ones(len(keys), dtype=bool)
+    number_of_keys = 1
+    for condition in emf_conditions:
+        column = condition['column']
+        attribute = condition['value']['attribute']
+        row_values, row_valid = _comparable_values(encoded_table, column, attribute, row_ids)
+        group_values, group_valid = _comparable_values(encoded_table, attribute, column, group_row_ids)
+        offset = condition['value']['offset']
+        if offset:
+            group_values = group_values + offset
+        codes, uniques = pd.factorize(np.concatenate([row_values, group_values]))
+        valid &= np.concatenate([row_valid, group_valid]) & (codes >= 0)
+        # The keys are renumbered after every condition, so they stay dense and never overflow.
+        keys, key_uniques = pd.factorize(keys * max(len(uniques), 1) + np.maximum(codes, 0))
+        number_of_keys = len(key_uniques)
+    keys = np.where(valid, keys, -1).astype(np.int64)
+    return keys[:number_of_rows], keys[number_of_rows:], number_of_keys
+
+
+def _comparable_values(encoded_table: EncodedTable, column: str, other_column: str, row_ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Codes can only be compared within the same column, otherwise encoded values are decoded.
+    values = encoded_table.columns[column][row_ids]
+    valid = encoded_table.is_valid(column)[row_ids]
+    if encoded_table.is_encoded(column) and column != other_column:
+        values = encoded_table.decode(column, values)
+    elif not encoded_table.is_encoded(column) and encoded_table.is_encoded(other_column):
+        values = values.astype(object)
+    return values, valid
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from ..parser.types import ParsedWhereClause, ParsedSuchThatClause, ParsedSuchThatSection
+
+
+# String columns whose number of distinct values is at most this share of the rows are dictionary encoded.
+DICTIONARY_ENCODING_MAX_CARDINALITY_RATIO = 0.5
+
+# Code given to condition values that do not appear in a column's dictionary. No row has this code.
+MISSING_VALUE_CODE = -2
+
+# Day number of missing dates, the same as NaT in datetime64[D].
+MISSING_DAY = np.iinfo(np.int64).min
+
+
+class EncodedTable:
+    '''
+    The datatable with string columns replaced by codes of a sorted dictionary, dates by day
+    numbers and nullable columns by numpy arrays with a validity mask (see is_valid()).
+    Missing codes are -1 and missing dates MISSING_DAY. Values are decoded in the result.
+    '''
+    def __init__(self, data: pd.DataFrame):
+        self.column_names: list[str] = data.columns.tolist()
+        self.column_indices: dict[str, int] = { column: index for index, column in enumerate(self.column_names) }
+        self.dictionaries: dict[str, np.ndarray] = {}
+        self.columns: dict[str, np.ndarray] = {}
+        self.date_columns: set[str] = set()
+        self.masked_columns: set[str] = set()
+        self._validity: dict[str, np.ndarray] = {}
+        self._hashes: dict[str, np.ndarray] = {}
+        self._rows: list[list] | None = None
+        for column in self.column_names:
+            masked = _masked_values(data[column])
+            if masked is not None:
+                self.columns[column], self._validity[column] = masked
+                self.masked_columns.add(column)
+                continue
+            days = _day_numbers(data[column])
+            if days is not None:
+                self.columns[column] = days
+                self.date_columns.add(column)
+                continue
+            encoded = _dictionary_encode(data[column])
+            if encoded is None:
+                self.columns[column] = data[column].to_numpy()
+            else:
+                codes, dictionary = encoded
+                self.columns[column] = codes
+                self.dictionaries[column] = dictionary
+
+    def take(self, row_ids: np.ndarray) -> 'EncodedTable':
+        '''
+        A table of some of the rows, which keeps the dictionaries of this table so that its
+        codes and its results decode the same way.
+        '''
+        table = EncodedTable.__new__(EncodedTable)
+        table.column_names = self.column_names
+        table.column_indices = self.column_indices
+        table.dictionaries = self.dictionaries
+        table.date_columns = self.date_columns
+        table.masked_columns = self.masked_columns
+        table.columns = {column: values[row_ids] for column, values in self.columns.items()}
+        table._validity = {column: valid[row_ids] for column, valid in self._validity.items()}
+        table._hashes = {column: hashes[row_ids] for column, hashes in self._hashes.items()}
+        table._rows = None
+        return table
+
+    def is_encoded(self, column: str) -> bool:
+        return column in self.dictionaries
+
+    def is_valid(self, column: str) -> np.ndarray:
+        '''
+        Mask of the rows whose value in the column is not missing.
+        '''
+        if column not in self._validity:
+            values = self.columns[column]
+            if self.is_encoded(column):
+                valid = values >= 0
+            elif column in self.date_columns:
+                valid = values != MISSING_DAY
+            elif values.dtype.kind == 'f':
+                valid = ~np.isnan(values)
+            elif values.dtype == object:
+                valid = ~pd.isna(values)
+            else:
+                valid = np.ones(len(values), dtype=bool)
+            self._validity[column] = valid
+        return self._validity[column]
+
+    def value_hashes(self, column: str) -> np.ndarray:
+        '''
+        A 64 bit hash of the value of every row in the column. Encoded columns hash their
+        dictionary once, so the hashes are those of the strings and do not depend on the codes.
+        '''
+        if column not in self._hashes:
+            values = self.columns[column]
+            if self.is_encoded(column):
+                dictionary_hashes = pd.util.hash_array(self.dictionaries[column])
+                self._hashes[column] = dictionary_hashes[np.maximum(values, 0)]
+            else:
+                self._hashes[column] = pd.util.hash_array(values)
+        return self._hashes[column]
+
+    def rows(self) -> list[list]:
+        '''
+        The table as a list of rows for the row-at-a-time evaluation. Missing values in
+        encoded columns are None so that they never equal a code.
+        '''
+        if self._rows is None:
+            row_columns = [self.row_values(column) for column in self.column_names]
+            self._rows = [list(row) for row in zip(*row_columns)]
+        return self._rows
+
+    def row_values(self, column: str, row_ids: np.ndarray | None = None) -> list:
+        values = self.columns[column] if row_ids is None else self.columns[column][row_ids]
+        if self.is_encoded(column):
+            return [None if code < 0 else code for code in values.tolist()]
+        if column in self.date_columns:
+            return [None if day == MISSING_DAY else day for day in values.tolist()]
+        if column in self.masked_columns:
+            valid = self.is_valid(column) if row_ids is None else self.is_valid(column)[row_ids]
+            return [value if is_valid else None for value, is_valid in zip(values.tolist(), valid.tolist())]
+        return values.tolist()
+
+    def encode_value(self, column: str, value: str) -> int:
+        dictionary = self.dictionaries[column]
+        position = int(np.searchsorted(dictionary, value))
+        if position < len(dictionary) and dictionary[position] == value:
+            return position
+        return MISSING_VALUE_CODE
+
+    def encode_condition(self, condition: ParsedWhereClause | ParsedSuchThatSection | None) -> ParsedWhereClause | ParsedSuchThatSection | None:
+        '''
+        Return a copy of a WHERE condition or SUCH THAT section whose string values on
+        encoded columns are replaced by codes, and whose dates are replaced by day numbers.
+        Strings are only compared for equality, so their codes are compared the same way.
+        '''
+        if condition is None:
+            return None
+        if 'conditions' in condition:
+            return {**condition, 'conditions': [self.encode_condition(c) for c in condition['conditions']]}
+        if 'condition' in condition:
+            return {**condition, 'condition': self.encode_condition(condition['condition'])}
+        column = condition.get('column')
+        if column in self.date_columns and isinstance(condition.get('value'), date):
+            return {**condition, 'value': day_number(condition['value'])}
+        if not self.is_encoded(column) or not isinstance(condition.get('value'), str):
+            return condition
+        return {**condition, 'value': self.encode_value(column, condition['value'])}
+
+    def encode_such_that_clause(self, such_that_clause: ParsedSuchThatClause | None) -> ParsedSuchThatClause | None:
+        if such_that_clause is None:
+            return None
+        return [self.encode_condition(section) for section in such_that_clause]
+
+    def decode(self, column: str, codes: pd.Series | np.ndarray) -> np.ndarray:
+        codes = pd.to_numeric(pd.Series(codes)).fillna(-1).to_numpy(dtype=np.int64)
+        dictionary = self.dictionaries[column]
+        decoded = np.empty(len(codes), dtype=object)
+        valid = codes >= 0
+        decoded[valid] = dictionary[codes[valid]]
+        decoded[~valid] = None
+        return decoded
+
+    def decode_days(self, days: pd.Series | np.ndarray) -> np.ndarray:
+        days = pd.to_numeric(pd.Series(days)).to_numpy()
+        valid = ~np.isnan(days) & (days != MISSING_DAY) if days.dtype.kind == 'f' else days != MISSING_DAY
+        decoded = np.empty(len(days), dtype=object)
+        decoded[valid] = days[valid].astype(np.int64).astype('datetime64[D]').astype(object)
+        decoded[~valid] = None
+        return decoded
+
+    def decode_result(self, result: pd.DataFrame) -> pd.DataFrame:
+        for column in result.columns:
+            if self.is_encoded(column):
+                result[column] = self.decode(column, result[column])
+            elif column in self.date_columns:
+                result[column] = self.decode_days(result[column])
+        return result
+
+
+def day_number(value: date) -> int:
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+def _masked_values(series: pd.Series) -> tuple[np.ndarray, np.ndarray] | None:
+    if not isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        return None
+    valid = series.notna().to_numpy()
+    fill_value = False if isinstance(series.array, pd.arrays.BooleanArray) else 0
+    return series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=fill_value), valid
+
+
+def _day_numbers(series: pd.Series) -> np.ndarray | None:
+    # Columns of datetime.date objects, as the accessor leaves them, become day numbers.
+    if series.dtype != object or pd.api.types.infer_dtype(series, skipna=True) != 'date':
+        return None
+    try:
+        days = pd.to_datetime(series).to_numpy().astype('datetime64[D]')
+    except (pd.errors.OutOfBoundsDatetime, OverflowError):
+        # pandas only converts dates within the range of nanosecond timestamps.
+        days = series.to_numpy().astype('datetime64[D]')
+    return days.view(np.int64)
+
+
+def _dictionary_encode(series: pd.Series) -> tuple[np.ndarray, np.ndarray] | None:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = np.asarray(series.cat.categories, dtype=object)
+        order = np.argsort(categories, kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        category_codes = series.cat.codes.to_numpy().astype(np.int64)
+        codes = np.full(len(category_codes), -1, dtype=np.int64)
+        valid = category_codes >= 0
+        codes[valid] = rank[category_codes[valid]]
+        return codes, categories[order]
+
+    if not isinstance(series.dtype, pd.StringDtype) or len(series) == 0:
+        return None
+    codes, uniques = pd.factorize(series, sort=True)
+    if len(uniques) > DICTIONARY_ENCODING_MAX_CARDINALITY_RATIO * len(series):
+        return None
+    return codes.astype(np.int64), np.asarray(uniques, dtype=object)
@@ -4,4 +4,12 @@ class RuntimeError(Exception):
         super().__init__(self.message)
 
     def __str__(self):
-        return f"{self.message}"
\ No newline at end of file
+        return f"{self.message}"
+
+class QueryCancelledError(Exception):
+    def __init__(self, message: str = "Query was cancelled"):
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message}"
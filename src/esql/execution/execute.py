@@ -1,36 +1,255 @@
+import heapq
+import itertools
+import numpy as np
 import pandas as pd
+from collections.abc import Iterator
 
-from src.esql.parser.types import ParsedQuery
-from src.esql.execution import algorithms
+from ..parser.types import ParsedQuery, ParsedSelectClause, ParsedWhereClause, ParsedSuchThatClause
+from . import algorithms
+from .aggregates import aggregate_key
+from .catalog import DatasetCatalog
+from .encoding import EncodedTable
+from .grouping import compute_group_ids, first_row_of_each_group
+from .index import InvertedIndex
+from .spill import STREAM_PARTITION_GROUPS, SpillDirectory, parse_memory_limit, estimate_query_memory, count_partitions, find_partitioning_attributes, partition_rows
+from .statistics import TableStatistics
+from .sampling import SampleSpec, DEFAULT_CONFIDENCE, ESTIMATED_FUNCTIONS, CI_LOW_SUFFIX, CI_HIGH_SUFFIX, draw_sample
+from .planner import order_condition, order_such_that_clause
+from .cancellation import CancellationToken
+from .error import RuntimeError
 
 
-def execute(parsed_query: ParsedQuery, decimal_places: int) -> pd.DataFrame:
-    pd_datatable = parsed_query['data']
-    columns = pd_datatable.columns.tolist()
-    column_indices = { column: index for index, column in enumerate(columns) }
-    datatable = pd_datatable.values.tolist()
+# 'jit' compiles a kernel per query shape with Numba, and runs the default engine when Numba
+# is not installed or the query has parts that kernels do not handle.
+ENGINES = ['default', 'jit']
 
+# Column of the partitioned results that holds the first row of every group in the whole
+# table, by which the groups of all the partitions are put back in the order of execute().
+FIRST_ROW_COLUMN = '__first_row__'
+
+
+def execute(parsed_query: ParsedQuery, decimal_places: int, cancellation_token: CancellationToken | None = None, catalog: DatasetCatalog | None = None, approximate: SampleSpec | None = None, memory_limit: int | str | None = None, engine: str = 'default') -> pd.DataFrame:
+    if engine not in ENGINES:
+        raise RuntimeError(f"Unknown engine: '{engine}'")
+    # The catalog must describe the data the query was parsed against.
+    catalog = catalog or DatasetCatalog(parsed_query['data'])
+    if engine == 'jit' and approximate is None and memory_limit is None:
+        from .jit import execute_jit
+        compiled_result = execute_jit(parsed_query, decimal_places, catalog, cancellation_token)
+        if compiled_result is not None:
+            return compiled_result
+
+    encoded_table = catalog.encoded_table
+    statistics = catalog.statistics
+    indexes = catalog.indexes
+    parsed_select_clause = parsed_query['select']
+    weights = None
+    if approximate is not None:
+        # The same plan runs on the sample. Zone maps and indexes refer to the positions of
+        # the rows in the whole table, so the sample gets its own statistics and no indexes.
+        row_ids, weights = draw_sample(encoded_table, approximate, parsed_select_clause['grouping_attributes'], statistics)
+        encoded_table = encoded_table.take(row_ids)
+        statistics = TableStatistics(encoded_table, catalog.zone_map_block_size)
+        indexes = None
+        parsed_select_clause = _with_confidence_intervals(parsed_select_clause)
+
+    # Conditions are encoded first, so that their values can be compared with the statistics of the codes.
+    parsed_where_clause = order_condition(encoded_table.encode_condition(parsed_query['where']), statistics)
+    parsed_such_that_clause = order_such_that_clause(encoded_table.encode_such_that_clause(parsed_query['such_that']), statistics)
+
+    confidence = approximate.confidence if approximate is not None else DEFAULT_CONFIDENCE
+    if memory_limit is not None:
+        partitioned_result = _execute_partitioned(parsed_query, parsed_select_clause, parsed_where_clause, parsed_such_that_clause, encoded_table, indexes, statistics, weights, confidence, decimal_places, cancellation_token, parse_memory_limit(memory_limit))
+        if partitioned_result is not None:
+            return partitioned_result
+
+    projected_table = _project_grouped_table(parsed_query, parsed_select_clause, parsed_where_clause, parsed_such_that_clause, encoded_table, indexes, statistics, weights, confidence, decimal_places, cancellation_token)
+    
+    # Encoded grouping attributes are still codes here. The dictionaries are sorted,
+    # so ordering by the codes gives the same order as ordering by the strings.
+    ordered_table = algorithms.order_by_sort(
+        projected_table=projected_table,
+        order_by=parsed_query['order_by'],
+        grouping_attributes=parsed_query['select']['grouping_attributes']
+    )
+    
+    return encoded_table.decode_result(pd.DataFrame(ordered_table))
+
+
+def iter_execute(parsed_query: ParsedQuery, decimal_places: int, batch_size: int, cancellation_token: CancellationToken | None = None, catalog: DatasetCatalog | None = None, memory_limit: int | str | None = None) -> Iterator[pd.DataFrame]:
+    '''
+    Run a query and yield its result in DataFrames of at most batch_size rows, computing one
+    hash partition of the groups at a time. With ORDER BY, the partitions are spilled as
+    sorted runs and merged.
+    '''
+    catalog = catalog or DatasetCatalog(parsed_query['data'])
+    encoded_table = catalog.encoded_table
+    statistics = catalog.statistics
+    parsed_select_clause = parsed_query['select']
+    grouping_attributes = parsed_select_clause['grouping_attributes']
+    order_by = parsed_query['order_by']
+
+    number_of_groups = statistics.estimate_group_count(grouping_attributes)
+    number_of_partitions = count_partitions(number_of_groups, max(batch_size, STREAM_PARTITION_GROUPS))
+    if memory_limit is not None:
+        estimated_memory = estimate_query_memory(statistics.row_count, number_of_groups, len(parsed_select_clause['select_items_in_order']))
+        number_of_partitions = max(number_of_partitions, count_partitions(estimated_memory, parse_memory_limit(memory_limit)))
+    partitioning_attributes = find_partitioning_attributes(parsed_select_clause, parsed_query['such_that'])
+    if number_of_partitions == 1 or not partitioning_attributes:
+        result = execute(parsed_query, decimal_places, cancellation_token=cancellation_token, catalog=catalog)
+        for start in range(0, len(result), batch_size):
+            yield result.iloc[start:start + batch_size].reset_index(drop=True)
+        return
+
+    parsed_where_clause = order_condition(encoded_table.encode_condition(parsed_query['where']), statistics)
+    parsed_such_that_clause = order_such_that_clause(encoded_table.encode_such_that_clause(parsed_query['such_that']), statistics)
+    if parsed_where_clause:
+        row_ids = algorithms.filter_rows(parsed_where_clause, encoded_table, catalog.indexes, statistics, cancellation_token)
+    else:
+        row_ids = np.arange(statistics.row_count, dtype=np.int64)
+
+    with SpillDirectory() as spill_directory:
+        runs = []
+        for partition_row_ids in partition_rows(encoded_table, partitioning_attributes, row_ids, number_of_partitions):
+            if len(partition_row_ids) == 0:
+                continue
+            partition_table = encoded_table.take(partition_row_ids)
+            projected_table = _project_grouped_table(
+                parsed_query, parsed_select_clause, None, parsed_such_that_clause,
+                partition_table, None, None, None,
+                DEFAULT_CONFIDENCE, decimal_places, cancellation_token
+            )
+            if order_by == 0:
+                yield from _decoded_batches(iter(projected_table), batch_size, encoded_table)
+            else:
+                _add_first_row_ids(projected_table, partition_table, partition_row_ids, grouping_attributes)
+                projected_table.sort(key=_ordered_rows_key(order_by, grouping_attributes), reverse=order_by < 0)
+                runs.append(spill_directory.spill_rows(projected_table, batch_size))
+
+        if runs:
+            merged_rows = heapq.merge(
+                *(spill_directory.read_rows(run) for run in runs),
+                key=_ordered_rows_key(order_by, grouping_attributes),
+                reverse=order_by < 0
+            )
+            yield from _decoded_batches(merged_rows, batch_size, encoded_table)
+
+
+def _decoded_batches(rows: Iterator[dict], batch_size: int, encoded_table: EncodedTable) -> Iterator[pd.DataFrame]:
+    while batch := list(itertools.islice(rows, batch_size)):
+        yield encoded_table.decode_result(pd.DataFrame(batch).drop(columns=FIRST_ROW_COLUMN, errors='ignore'))
+
+
+def _add_first_row_ids(projected_table: list[dict], partition_table: EncodedTable, partition_row_ids: np.ndarray, grouping_attributes: list[str]) -> list[dict]:
+    # A partition holds every row of its groups, so the first row of a group in the partition is its first row in the table.
+    group_ids, _ = compute_group_ids(partition_table, grouping_attributes)
+    first_row_ids = first_row_of_each_group(group_ids)
+    group_values = zip(*(partition_table.row_values(attribute, first_row_ids) for attribute in grouping_attributes))
+    first_rows = {
+        tuple(_group_key(value) for value in values): row_id
+        for values, row_id in zip(group_values, partition_row_ids[first_row_ids].tolist())
+    }
+    for row in projected_table:
+        row[FIRST_ROW_COLUMN] = first_rows[tuple(_group_key(row.get(attribute)) for attribute in grouping_attributes)]
+    return projected_table
+
+
+def _group_key(value):
+    # NaN is not equal to itself, so it cannot be looked up in a dict.
+    return None if value != value else value
+
+
+def _ordered_rows_key(order_by: int, grouping_attributes: list[str]):
+    # Groups that tie on the ORDER BY attributes keep the order of their first rows, also in reverse.
+    order_key = algorithms.order_by_key(order_by, grouping_attributes)
+    direction = -1 if order_by < 0 else 1
+    return lambda row: (order_key(row), direction * row[FIRST_ROW_COLUMN])
+
+
+def _project_grouped_table(parsed_query: ParsedQuery, parsed_select_clause: ParsedSelectClause, parsed_where_clause: ParsedWhereClause | None, parsed_such_that_clause: ParsedSuchThatClause | None, encoded_table: EncodedTable, indexes: dict[str, InvertedIndex] | None, statistics: TableStatistics | None, weights: np.ndarray | None, confidence: float, decimal_places: int, cancellation_token: CancellationToken | None) -> list[dict]:
     grouped_table = algorithms.build_grouped_table(
-        parsed_select_clause=parsed_query['select'], 
+        parsed_select_clause=parsed_select_clause, 
         groups=parsed_query['over'], 
-        parsed_where_clause=parsed_query['where'], 
-        parsed_such_that_clause=parsed_query['such_that'], 
+        parsed_where_clause=parsed_where_clause, 
+        parsed_such_that_clause=parsed_such_that_clause, 
         parsed_having_clause=parsed_query['having'], 
         aggregates=parsed_query['aggregates'], 
-        datatable=datatable, 
-        column_indices=column_indices
+        encoded_table=encoded_table,
+        indexes=indexes,
+        statistics=statistics,
+        cancellation_token=cancellation_token,
+        weights=weights,
+        confidence=confidence
     )
-    
-    projected_table = algorithms.project_select_attributes(
-        parsed_select_clause=parsed_query['select'],
+    return algorithms.project_select_attributes(
+        parsed_select_clause=parsed_select_clause,
         grouped_table=grouped_table,
         decimal_places=decimal_places
     )
-    
-    ordered_table = algorithms.order_by_sort(
-        projected_table=projected_table,
-        order_by=parsed_query['order_by'],
-        grouping_attributes=parsed_query['select']['grouping_attributes']
+
+
+def _execute_partitioned(parsed_query: ParsedQuery, parsed_select_clause: ParsedSelectClause, parsed_where_clause: ParsedWhereClause | None, parsed_such_that_clause: ParsedSuchThatClause | None, encoded_table: EncodedTable, indexes: dict[str, InvertedIndex] | None, statistics: TableStatistics, weights: np.ndarray | None, confidence: float, decimal_places: int, cancellation_token: CancellationToken | None, memory_limit: int) -> pd.DataFrame | None:
+    '''
+    Run a query one hash partition of its groups at a time, spilling every partition's
+    result. Returns None when the query fits in the memory limit or cannot be partitioned.
+    '''
+    partitioning_attributes = find_partitioning_attributes(parsed_select_clause, parsed_such_that_clause)
+    grouping_attributes = parsed_select_clause['grouping_attributes']
+    estimated_memory = estimate_query_memory(
+        number_of_rows=statistics.row_count,
+        number_of_groups=statistics.estimate_group_count(grouping_attributes),
+        number_of_select_items=len(parsed_select_clause['select_items_in_order'])
     )
-    
-    return pd.DataFrame(ordered_table)
\ No newline at end of file
+    number_of_partitions = count_partitions(estimated_memory, memory_limit)
+    if number_of_partitions == 1 or not partitioning_attributes:
+        return None
+
+    if parsed_where_clause:
+        row_ids = algorithms.filter_rows(parsed_where_clause, encoded_table, indexes, statistics, cancellation_token)
+    else:
+        row_ids = np.arange(statistics.row_count, dtype=np.int64)
+    with SpillDirectory() as spill_directory:
+        for partition_row_ids in partition_rows(encoded_table, partitioning_attributes, row_ids, number_of_partitions):
+            if len(partition_row_ids) == 0:
+                continue
+            # Zone maps and indexes refer to the positions of the rows in the whole table.
+            partition_table = encoded_table.take(partition_row_ids)
+            projected_table = _project_grouped_table(
+                parsed_query, parsed_select_clause, None, parsed_such_that_clause,
+                partition_table, None, None,
+                None if weights is None else weights[partition_row_ids],
+                confidence, decimal_places, cancellation_token
+            )
+            spill_directory.spill(pd.DataFrame(_add_first_row_ids(projected_table, partition_table, partition_row_ids, grouping_attributes)))
+        result = spill_directory.read()
+    return encoded_table.decode_result(_order_result(result, parsed_query['order_by'], grouping_attributes))
+
+
+def _order_result(result: pd.DataFrame, order_by: int, grouping_attributes: list[str]) -> pd.DataFrame:
+    # The same order as algorithms.order_by_sort after execute(), with missing values last
+    # (first in reverse) and the groups that tie in the order of their first rows.
+    if FIRST_ROW_COLUMN not in result:
+        return result
+    ordering_attributes = grouping_attributes[:abs(order_by)]
+    return result.sort_values(
+        by=[*ordering_attributes, FIRST_ROW_COLUMN],
+        ascending=[order_by > 0] * len(ordering_attributes) + [True],
+        kind='stable',
+        na_position='last' if order_by >= 0 else 'first',
+        ignore_index=True
+    ).drop(columns=FIRST_ROW_COLUMN)
+
+
+def _with_confidence_intervals(parsed_select_clause: ParsedSelectClause) -> ParsedSelectClause:
+    # Every estimated aggregate in the SELECT clause is followed by the bounds of its interval.
+    estimated_keys = {
+        aggregate_key(aggregate)
+        for aggregate in parsed_select_clause['aggregates']['global_scope'] + parsed_select_clause['aggregates']['group_specific']
+        if aggregate['function'] in ESTIMATED_FUNCTIONS
+    }
+    select_items = []
+    for select_item in parsed_select_clause['select_items_in_order']:
+        select_items.append(select_item)
+        if select_item in estimated_keys:
+            select_items.extend([select_item + CI_LOW_SUFFIX, select_item + CI_HIGH_SUFFIX])
+    return {**parsed_select_clause, 'select_items_in_order': select_items}
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from ..parser.types import ParsedQuery, ParsedWhereClause, ParsedSuchThatSection
+from ..parser.util import find_group_in_such_that_section, find_aggregates_in_such_that_section
+from . import algorithms
+from .execute import execute
+from .catalog import DatasetCatalog
+from .encoding import EncodedTable
+from .grouping import compute_group_ids, first_row_of_each_group
+from .aggregates import AggregateState, aggregate_key, create_aggregate_state
+from .correlation import split_emf_conditions
+from .planner import order_condition
+from .cancellation import CancellationToken
+
+
+def execute_fused(parsed_queries: list[ParsedQuery], decimal_places: list[int], catalog: DatasetCatalog, cancellation_token: CancellationToken | None = None) -> list[pd.DataFrame]:
+    '''
+    Execute several queries over the same dataset and return their results in order. Queries
+    that can be fused share their WHERE clauses, groupings and aggregates, and the others
+    only share the catalog.
+    '''
+    scans = SharedScans(catalog, cancellation_token)
+    results = []
+    for parsed_query, query_decimal_places in zip(parsed_queries, decimal_places):
+        if not can_fuse(parsed_query):
+            results.append(execute(parsed_query, query_decimal_places, cancellation_token=cancellation_token, catalog=catalog))
+        else:
+            results.append(scans.execute(parsed_query, query_decimal_places))
+    return results
+
+
+def can_fuse(parsed_query: ParsedQuery) -> bool:
+    # EMF conditions and comparisons with aggregates depend on the other aggregates of the
+    # query, and grouping sets regroup the states, so those queries are not fused.
+    if 'grouping_sets' in parsed_query['select']:
+        return False
+    for section in parsed_query['such_that'] or []:
+        emf_conditions, _ = split_emf_conditions(section)
+        if emf_conditions or find_aggregates_in_such_that_section(section):
+            return False
+    return True
+
+
+class SharedScans:
+    '''
+    The filtered rows, group ids and aggregate states of the queries executed so far,
+    keyed by the conditions and grouping attributes they were computed for.
+    '''
+    def __init__(self, catalog: DatasetCatalog, cancellation_token: CancellationToken | None = None):
+        self.catalog = catalog
+        self.cancellation_token = cancellation_token
+        self._row_ids: dict[str, np.ndarray] = {}
+        self._groups: dict[tuple, tuple[EncodedTable, np.ndarray, int, np.ndarray]] = {}
+        self._section_row_ids: dict[tuple, np.ndarray] = {}
+        self._states: dict[tuple, AggregateState] = {}
+
+    def execute(self, parsed_query: ParsedQuery, decimal_places: int) -> pd.DataFrame:
+        encoded_table = self.catalog.encoded_table
+        parsed_select_clause = parsed_query['select']
+        grouping_attributes = parsed_select_clause['grouping_attributes']
+        parsed_where_clause = encoded_table.encode_condition(parsed_query['where'])
+        sections = {
+            find_group_in_such_that_section(section): section
+            for section in encoded_table.encode_such_that_clause(parsed_query['such_that']) or []
+        }
+
+        scan_key = (repr(parsed_where_clause), tuple(grouping_attributes))
+        filtered_table, group_ids, number_of_groups, first_row_ids = self._group(scan_key, parsed_where_clause, grouping_attributes)
+        aggregate_states = {}
+        for aggregate in parsed_query['aggregates']['global_scope'] + parsed_query['aggregates']['group_specific']:
+            section = sections.get(aggregate['group']) if 'group' in aggregate else None
+            selection_key = _section_key(section) if 'group' in aggregate else None
+            state_key = (scan_key, selection_key, aggregate['column'], aggregate['function'])
+            if state_key not in self._states:
+                state = create_aggregate_state(
+                    function=aggregate['function'],
+                    number_of_groups=number_of_groups,
+                    dtype=encoded_table.columns[aggregate['column']].dtype
+                )
+                algorithms._update_aggregate_states(
+                    aggregate_states={aggregate_key(aggregate): state},
+                    aggregates=[aggregate],
+                    row_ids=self._selected_row_ids(scan_key, selection_key, section, filtered_table, 'group' in aggregate),
+                    group_ids=group_ids,
+                    encoded_table=filtered_table,
+                    cancellation_token=self.cancellation_token
+                )
+                self._states[state_key] = state
+            aggregate_states[aggregate_key(aggregate)] = self._states[state_key]
+
+        grouped_table = algorithms.build_grouped_table_from_states(
+            parsed_having_clause=parsed_query['having'],
+            aggregates=parsed_query['aggregates'],
+            aggregate_states=aggregate_states,
+            grouping_attributes=grouping_attributes,
+            encoded_table=encoded_table.take(first_row_ids)
+        )
+        projected_table = algorithms.project_select_attributes(
+            parsed_select_clause=parsed_select_clause,
+            grouped_table=grouped_table,
+            decimal_places=decimal_places
+        )
+        ordered_table = algorithms.order_by_sort(
+            projected_table=projected_table,
+            order_by=parsed_query['order_by'],
+            grouping_attributes=grouping_attributes
+        )
+        return encoded_table.decode_result(pd.DataFrame(ordered_table))
+
+    def _group(self, scan_key: tuple, parsed_where_clause: ParsedWhereClause | None, grouping_attributes: list[str]) -> tuple[EncodedTable, np.ndarray, int, np.ndarray]:
+        # Returns the filtered table, the group id of its rows, the number of groups and the first row of every group in the whole table.
+        if scan_key not in self._groups:
+            where_key = scan_key[0]
+            if where_key not in self._row_ids:
+                self._row_ids[where_key] = self._filter(parsed_where_clause)
+            row_ids = self._row_ids[where_key]
+            filtered_table = self.catalog.encoded_table.take(row_ids)
+            group_ids, number_of_groups = compute_group_ids(filtered_table, grouping_attributes)
+            self._groups[scan_key] = (filtered_table, group_ids, number_of_groups, row_ids[first_row_of_each_group(group_ids)])
+        return self._groups[scan_key]
+
+    def _filter(self, parsed_where_clause: ParsedWhereClause | None) -> np.ndarray:
+        statistics = self.catalog.statistics
+        if not parsed_where_clause:
+            return np.arange(statistics.row_count, dtype=np.int64)
+        return algorithms.filter_rows(order_condition(parsed_where_clause, statistics), self.catalog.encoded_table, self.catalog.indexes, statistics, self.cancellation_token)
+
+    def _selected_row_ids(self, scan_key: tuple, selection_key: str | None, section: ParsedSuchThatSection | None, filtered_table: EncodedTable, is_group_specific: bool) -> np.ndarray:
+        # Positions in the filtered table of the rows an aggregate is computed over.
+        if (scan_key, selection_key) not in self._section_row_ids:
+            number_of_rows = len(self._row_ids[scan_key[0]])
+            if not is_group_specific:
+                row_ids = np.arange(number_of_rows, dtype=np.int64)
+            elif section is None:
+                row_ids = np.zeros(0, dtype=np.int64)
+            else:
+                row_ids = algorithms.filter_rows(section, filtered_table, cancellation_token=self.cancellation_token)
+            self._section_row_ids[(scan_key, selection_key)] = row_ids
+        return self._section_row_ids[(scan_key, selection_key)]
+
+
+def _section_key(section: ParsedSuchThatSection | None) -> str:
+    # Sections with the same conditions select the same rows, whatever their grouping variable.
+    def without_groups(condition):
+        if isinstance(condition, dict):
+            return {key: without_groups(value) for key, value in condition.items() if key != 'group'}
+        if isinstance(condition, list):
+            return [without_groups(value) for value in condition]
+        return condition
+    return repr(without_groups(section))
@@ -1,12 +1,15 @@
 import math
-import numpy as np
+import pandas as pd
 from datetime import date
-from src.esql.parser.types import AggregatesDict, GlobalAggregate, GroupAggregate
+from ..parser.types import AggregatesDict
+from ..parser.util import parse_percentile_function
+from .aggregates import aggregate_key
 
 class GroupedRow:
     '''
     Each GroupedRow represents one unique combination of grouping attribute values
-    and stores the computed aggregate values in a data map.
+    and stores the computed aggregate values in a data map, normally built from the
+    final values of the aggregate states with from_data_map().
     '''
     def __init__(self, grouping_attributes: list[str], aggregates: AggregatesDict , initial_row: list[str | int | bool| date], column_indices: dict[str, int]):
         self.grouping_attributes = grouping_attributes
@@ -15,6 +18,16 @@ class GroupedRow:
         self._column_indices = column_indices
         self._data_map = self._build_data_map()
 
+    @classmethod
+    def from_data_map(cls, grouping_attributes: list[str], aggregates: AggregatesDict, data_map: dict[str, str | int | bool | date]) -> 'GroupedRow':
+        grouped_row = cls.__new__(cls)
+        grouped_row.grouping_attributes = grouping_attributes
+        grouped_row.aggregates = aggregates
+        grouped_row._initial_row = None
+        grouped_row._column_indices = None
+        grouped_row._data_map = data_map
+        return grouped_row
+
     def _build_data_map(self) -> dict[str, str | int | bool | date]:
         data_map = {}
         for attribute in self.grouping_attributes:
@@ -24,66 +37,17 @@ class GroupedRow:
             column = aggregate['column']
             function = aggregate['function']
             index = self._column_indices[column]
-            value = self._initial_row[index] or np.nan
-            if math.isnan(value):
+            value = self._initial_row[index]
+            if _is_missing(value):
                 continue
-            aggregate_key = self._aggregate_key(aggregate)
-            if function in ['sum', 'min', 'max']:
-                data_map[aggregate_key] = value
-            elif function == 'count':
-                data_map[aggregate_key] = 1
-            elif funtion == 'avg':
-                data_map[aggregate_key] = {'sum': value, 'count': 1}
+            if function in ['sum', 'min', 'max', 'avg'] or parse_percentile_function(function) is not None:
+                data_map[aggregate_key(aggregate)] = value
+            elif function in ['count', 'count_distinct', 'approx_count_distinct']:
+                data_map[aggregate_key(aggregate)] = 1
+            elif function in ['var_pop', 'stddev_pop']:
+                data_map[aggregate_key(aggregate)] = 0.0
         return data_map
 
-    def update_data_map(self, aggregate: GlobalAggregate | GroupAggregate, row: list[str | int | bool| date]) -> None:
-        column = aggregate['column']
-        function = aggregate['function']
-        index = self._column_indices[column]
-        value = row[index] or np.nan
-        if math.isnan(value):
-            return
-        aggregate_key = self._aggregate_key(aggregate)
-        if aggregate_key not in self._data_map:
-            if function in ['sum', 'min', 'max']:
-                self._data_map[aggregate_key] = value
-            elif function == 'count':
-                self._data_map[aggregate_key] = 1
-            elif function == 'avg':
-                self._data_map[aggregate_key] = {'sum': value, 'count': 1}
-        else:
-            if function == 'sum':
-                self._data_map[aggregate_key] += value
-            elif function == 'min':
-                if value < self._data_map[aggregate_key]:
-                    self._data_map[aggregate_key] = value
-            elif function == 'max':
-                if value > self._data_map[aggregate_key]:
-                    self._data_map[aggregate_key] = value
-            elif function == 'count':
-                self._data_map[aggregate_key] += 1
-            elif function == 'avg':
-                values = self._data_map[aggregate_key]
-                new_sum = values['sum'] + value
-                new_count = values['count'] + 1
-                self._data_map[aggregate_key] = {'sum': new_sum, 'count': new_count}
-
-    # This must be called on all GroupedRows after they have been filtered by the WHERE and SUCH THAT clauses
-    def convert_avg_in_data_map(self) -> None:
-        for aggregate in self.aggregates['global_scope'] + self.aggregates['group_specific']:
-            if aggregate['function'] == 'avg':
-                aggregate_key = self._aggregate_key(aggregate)
-                if self._data_map.get(aggregate_key):
-                    _sum, _count = self._data_map[aggregate_key]['sum'], self._data_map[aggregate_key]['count']
-                    _avg = _sum/_count
-                    self._data_map[aggregate_key] = _avg
-
-    def _aggregate_key(self, aggregate: GlobalAggregate | GroupAggregate) -> str:
-        if 'group' in aggregate:
-            return f"{aggregate['group']}.{aggregate['column']}.{aggregate['function']}"
-        else:
-            return f"{aggregate['column']}.{aggregate['function']}"
-
     @property
     def data_map(self):
         return self._data_map
@@ -94,3 +58,9 @@ class GroupedRow:
     def __repr__(self):
         return self.__str__()
 
+
+def _is_missing(value: str | int | bool | date | None) -> bool:
+    # Encoded string columns use codes starting at 0, so falsy values are not missing.
+    if value is None or value is pd.NA:
+        return True
+    return isinstance(value, float) and math.isnan(value)
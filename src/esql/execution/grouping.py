@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from .encoding import EncodedTable
+from .statistics import TableStatistics
+
+
+# Largest packed key value, so that mixed radix keys always fit in an int64.
+MAX_PACKED_KEY = np.iinfo(np.int64).max
+
+
+def compute_group_ids(encoded_table: EncodedTable, grouping_attributes: list[str], statistics: TableStatistics | None = None) -> tuple[np.ndarray, int]:
+    '''
+    Compute the group id of every row once, for all the grouping attributes together.
+    The codes of the attributes are combined by mixed radix and rehashed before they would
+    overflow. Group ids are dense and in order of first appearance.
+    '''
+    number_of_rows = len(encoded_table.columns[grouping_attributes[0]]) if grouping_attributes else 0
+    packed_keys = np.zeros(number_of_rows, dtype=np.int64)
+    radix = 1
+    for attribute in grouping_attributes:
+        codes, cardinality = _dense_codes(encoded_table, attribute, statistics)
+        if radix > MAX_PACKED_KEY // max(cardinality, 1):
+            packed_keys, uniques = pd.factorize(packed_keys)
+            packed_keys = packed_keys.astype(np.int64)
+            radix = max(len(uniques), 1)
+        packed_keys = packed_keys * cardinality + codes
+        radix *= max(cardinality, 1)
+
+    size_hint = statistics.estimate_group_count(grouping_attributes) if statistics is not None else None
+    group_ids, uniques = pd.factorize(packed_keys, size_hint=size_hint)
+    return group_ids.astype(np.int64), len(uniques)
+
+
+def first_row_of_each_group(group_ids: np.ndarray) -> np.ndarray:
+    '''
+    The id of the first row of every group, indexed by group id. Group ids are numbered in
+    order of first appearance, so a row starts a group exactly when its id is larger than
+    every id before it.
+    '''
+    if len(group_ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.empty(len(group_ids), dtype=bool)
+    starts[0] = True
+    starts[1:] = group_ids[1:] > np.maximum.accumulate(group_ids)[:-1]
+    return np.flatnonzero(starts)
+
+
+def _dense_codes(encoded_table: EncodedTable, attribute: str, statistics: TableStatistics | None) -> tuple[np.ndarray, int]:
+    values = encoded_table.columns[attribute]
+    if encoded_table.is_encoded(attribute):
+        # Missing values (-1) get their own code after the dictionary.
+        cardinality = len(encoded_table.dictionaries[attribute])
+        codes = np.where(values < 0, cardinality, values)
+        return codes.astype(np.int64), cardinality + 1
+    size_hint = statistics.estimate_group_count([attribute]) if statistics is not None else None
+    codes, uniques = pd.factorize(values, use_na_sentinel=False, size_hint=size_hint)
+    if attribute in encoded_table.masked_columns:
+        # The filled in values of missing rows must not join the group of that value.
+        valid = encoded_table.is_valid(attribute)
+        return np.where(valid, codes, len(uniques)).astype(np.int64), len(uniques) + 1
+    return codes.astype(np.int64), len(uniques)
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from ..parser.types import ParsedWhereClause, ParsedSuchThatSection, LogicalOperator
+
+
+class InvertedIndex:
+    '''
+    Maps every value of a column to the sorted array of the row ids that hold it. Rows with
+    a missing value are not indexed.
+    '''
+    def __init__(self, values: np.ndarray, valid: np.ndarray | None = None):
+        row_ids = np.arange(len(values), dtype=np.int64) if valid is None else np.flatnonzero(valid)
+        codes, uniques = pd.factorize(values if valid is None else values[valid])
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        value_codes = np.arange(len(uniques))
+        self._row_ids = row_ids[order]
+        self._starts = np.searchsorted(sorted_codes, value_codes, side='left')
+        self._ends = np.searchsorted(sorted_codes, value_codes, side='right')
+        self._positions = { value: position for position, value in enumerate(uniques.tolist()) }
+
+    def lookup(self, value: int | float | str | bool | date) -> np.ndarray:
+        position = self._positions.get(value)
+        if position is None:
+            return np.empty(0, dtype=np.int64)
+        return self._row_ids[self._starts[position]:self._ends[position]]
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+
+def find_posting_list(condition: ParsedWhereClause | ParsedSuchThatSection, indexes: dict[str, InvertedIndex]) -> tuple[np.ndarray, bool] | None:
+    '''
+    Find the rows that can satisfy a condition using the inverted indexes. Returns the sorted
+    candidate row ids and whether they are exactly the matching rows, or None if no index applies.
+    '''
+    if not indexes:
+        return None
+    operator = condition.get('operator')
+    if 'column' in condition:
+        index = indexes.get(condition['column'])
+        if index is None or operator not in ['=', '=='] or condition.get('is_emf'):
+            return None
+        return index.lookup(condition['value']), True
+
+    if operator == LogicalOperator.OR:
+        posting_lists = [find_posting_list(or_condition, indexes) for or_condition in condition['conditions']]
+        if any(posting_list is None for posting_list in posting_lists):
+            return None
+        row_ids = np.unique(np.concatenate([row_ids for row_ids, _ in posting_lists]))
+        return row_ids, all(exact for _, exact in posting_lists)
+
+    if operator == LogicalOperator.AND:
+        posting_lists = [find_posting_list(and_condition, indexes) for and_condition in condition['conditions']]
+        found = [posting_list for posting_list in posting_lists if posting_list is not None]
+        if not found:
+            return None
+        found.sort(key=lambda posting_list: len(posting_list[0]))
+        row_ids = found[0][0]
+        for other_row_ids, _ in found[1:]:
+            row_ids = np.intersect1d(row_ids, other_row_ids, assume_unique=True)
+        return row_ids, len(found) == len(posting_lists) and all(exact for _, exact in found)
+
+    return None
@@ -0,0 +1,250 @@
+import threading
+import importlib.util
+import numpy as np
+import pandas as pd
+from collections.abc import Callable
+
+from ..parser.types import LogicalOperator, ParsedQuery, ParsedWhereClause, ParsedSuchThatSection
+from ..parser.util import find_group_in_such_that_section
+from . import algorithms
+from .catalog import DatasetCatalog
+from .encoding import EncodedTable
+from .grouping import compute_group_ids
+from .aggregates import AggregateState, aggregate_key, create_aggregate_state
+from .predicates import COMPARISON_OPERATORS, missing_value_satisfies
+from .fusion import can_fuse
+from .cancellation import CancellationToken
+
+
+# Aggregates whose state is a count and at most one accumulator per group, which a kernel updates row by row.
+KERNEL_FUNCTIONS = {'count', 'sum', 'avg', 'min', 'max'}
+
+# Kernels compiled so far, keyed by their source, which only depends on the shape of the plan.
+_KERNELS: dict[str, Callable] = {}
+_KERNELS_LOCK = threading.Lock()
+
+
+def numba_available() -> bool:
+    return importlib.util.find_spec('numba') is not None
+
+
+def execute_jit(parsed_query: ParsedQuery, decimal_places: int, catalog: DatasetCatalog, cancellation_token: CancellationToken | None = None) -> pd.DataFrame | None:
+    '''
+    Execute a query with a kernel compiled by Numba in one pass over the rows, or return None
+    if Numba is not installed or the query cannot be compiled.
+    '''
+    encoded_table = catalog.encoded_table
+    if not numba_available() or not can_compile(parsed_query, encoded_table):
+        return None
+    if cancellation_token is not None:
+        cancellation_token.raise_if_cancelled()
+
+    grouping_attributes = parsed_query['select']['grouping_attributes']
+    group_ids, number_of_groups = compute_group_ids(encoded_table, grouping_attributes, catalog.statistics)
+    plan = KernelPlan(parsed_query, encoded_table, number_of_groups)
+    kernel = compile_kernel(plan.source)
+    dense_ids = np.full(number_of_groups, -1, dtype=np.int64)
+    first_row_ids = np.zeros(number_of_groups, dtype=np.int64)
+    number_of_present_groups = kernel(group_ids.astype(np.int64, copy=False), dense_ids, first_row_ids, *plan.arguments)
+
+    aggregate_states = {key: _truncate(state, number_of_present_groups) for key, state in plan.aggregate_states.items()}
+    grouped_table = algorithms.build_grouped_table_from_states(
+        parsed_having_clause=parsed_query['having'],
+        aggregates=parsed_query['aggregates'],
+        aggregate_states=aggregate_states,
+        grouping_attributes=grouping_attributes,
+        encoded_table=encoded_table.take(first_row_ids[:number_of_present_groups])
+    )
+    projected_table = algorithms.project_select_attributes(
+        parsed_select_clause=parsed_query['select'],
+        grouped_table=grouped_table,
+        decimal_places=decimal_places
+    )
+    ordered_table = algorithms.order_by_sort(
+        projected_table=projected_table,
+        order_by=parsed_query['order_by'],
+        grouping_attributes=grouping_attributes
+    )
+    return encoded_table.decode_result(pd.DataFrame(ordered_table))
+
+
+def can_compile(parsed_query: ParsedQuery, encoded_table: EncodedTable) -> bool:
+    # Kernels only handle the queries that fusion handles, with aggregates of a fixed size
+    # and comparisons of numeric columns (or codes, or day numbers) with constants.
+    if not can_fuse(parsed_query):
+        return False
+    aggregates = parsed_query['aggregates']['global_scope'] + parsed_query['aggregates']['group_specific']
+    for aggregate in aggregates:
+        if aggregate['function'] not in KERNEL_FUNCTIONS:
+            return False
+        if aggregate['function'] != 'count' and not _is_kernel_column(encoded_table, aggregate['column']):
+            return False
+    conditions = [encoded_table.encode_condition(parsed_query['where'])]
+    conditions += encoded_table.encode_such_that_clause(parsed_query['such_that']) or []
+    return all(_is_kernel_condition(condition, encoded_table) for condition in conditions if condition)
+
+
+def compile_kernel(source: str) -> Callable:
+    with _KERNELS_LOCK:
+        if source not in _KERNELS:
+            import numba
+            _KERNELS[source] = numba.njit(nogil=True)(define_kernel(source))
+        return _KERNELS[source]
+
+
+def define_kernel(source: str) -> Callable:
+    '''
+    The kernel of the source as a plain Python function, which is what Numba compiles.
+    '''
+    namespace = {}
+    exec(compile(source, '<esql-kernel>', 'exec'), namespace)
+    return namespace['kernel']
+
+
+class KernelPlan:
+    '''
+    The source of the kernel of a query and the arguments it is called with after the
+    group ids, dense ids and first rows: the value and validity arrays of the columns,
+    the constants of the conditions, and the count and accumulator arrays of the states.
+    '''
+    def __init__(self, parsed_query: ParsedQuery, encoded_table: EncodedTable, number_of_groups: int):
+        self.encoded_table = encoded_table
+        self.parameters: list[str] = []
+        self.arguments: list = []
+        self._columns: dict[str, int] = {}
+        self._number_of_constants = 0
+        self.aggregate_states: dict[str, AggregateState] = {}
+
+        where_clause = encoded_table.encode_condition(parsed_query['where'])
+        sections = {
+            find_group_in_such_that_section(section): section
+            for section in encoded_table.encode_such_that_clause(parsed_query['such_that']) or []
+        }
+        body = []
+        if where_clause:
+            body += [f"        if not {self._condition(where_clause)}:", "            continue"]
+        body += [
+            "        group = dense_ids[group_ids[row]]",
+            "        if group < 0:",
+            "            group = number_of_groups",
+            "            dense_ids[group_ids[row]] = group",
+            "            first_row_ids[group] = row",
+            "            number_of_groups += 1"
+        ]
+        for aggregate in parsed_query['aggregates']['global_scope']:
+            body += self._update(aggregate, number_of_groups, "        ")
+        for group, section in sections.items():
+            group_aggregates = [aggregate for aggregate in parsed_query['aggregates']['group_specific'] if aggregate['group'] == group]
+            if group_aggregates:
+                body.append(f"        if {self._condition(section)}:")
+                for aggregate in group_aggregates:
+                    body += self._update(aggregate, number_of_groups, "            ")
+        # Grouping variables without a SUCH THAT section select no rows.
+        for aggregate in parsed_query['aggregates']['group_specific']:
+            if aggregate_key(aggregate) not in self.aggregate_states:
+                self._state(aggregate, number_of_groups)
+
+        self.source = "\n".join([
+            f"def kernel({', '.join(['group_ids', 'dense_ids', 'first_row_ids', *self.parameters])}):",
+            "    number_of_groups = 0",
+            "    for row in range(group_ids.shape[0]):",
+            *body,
+            "    return number_of_groups",
+            ""
+        ])
+
+    def _column(self, column: str, with_values: bool = True) -> int:
+        # Every column is passed once, with its values only when the kernel reads them.
+        if column not in self._columns:
+            index = len(self._columns)
+            self._columns[column] = index
+            self.parameters += [f"values_{index}", f"valid_{index}"]
+            self.arguments += [None, self.encoded_table.is_valid(column)]
+        index = self._columns[column]
+        if with_values:
+            position = self.parameters.index(f"values_{index}")
+            self.arguments[position] = self.encoded_table.columns[column]
+        return index
+
+    def _constant(self, value: int | float | bool) -> str:
+        name = f"constant_{self._number_of_constants}"
+        self._number_of_constants += 1
+        self.parameters.append(name)
+        self.arguments.append(value)
+        return name
+
+    def _condition(self, condition: ParsedWhereClause | ParsedSuchThatSection) -> str:
+        operator = condition['operator']
+        if 'column' in condition:
+            index = self._column(condition['column'])
+            constant = self._constant(condition['value'])
+            comparison = f"values_{index}[row] {'==' if operator == '=' else operator} {constant}"
+            if missing_value_satisfies(operator):
+                return f"(not valid_{index}[row] or {comparison})"
+            return f"(valid_{index}[row] and {comparison})"
+        if operator == LogicalOperator.NOT:
+            return f"(not {self._condition(condition['condition'])})"
+        return "(" + f" {operator.value} ".join(self._condition(sub_condition) for sub_condition in condition['conditions']) + ")"
+
+    def _update(self, aggregate: dict, number_of_groups: int, indent: str) -> list[str]:
+        key = aggregate_key(aggregate)
+        if key in self.aggregate_states:
+            return []
+        function = aggregate['function']
+        index = self._column(aggregate['column'], with_values=function != 'count')
+        state_index = len(self.aggregate_states)
+        state = self._state(aggregate, number_of_groups)
+        self.parameters.append(f"counts_{state_index}")
+        self.arguments.append(state.counts)
+        lines = [
+            f"{indent}if valid_{index}[row]:",
+            f"{indent}    counts_{state_index}[group] += 1"
+        ]
+        if function == 'count':
+            return lines
+        self.parameters.append(f"accumulator_{state_index}")
+        self.arguments.append(state.values if function in ['min', 'max'] else state.sums)
+        value = f"values_{index}[row]"
+        if function in ['sum', 'avg']:
+            return lines + [f"{indent}    accumulator_{state_index}[group] += {value}"]
+        return lines + [
+            f"{indent}    if {value} {'<' if function == 'min' else '>'} accumulator_{state_index}[group]:",
+            f"{indent}        accumulator_{state_index}[group] = {value}"
+        ]
+
+    def _state(self, aggregate: dict, number_of_groups: int) -> AggregateState:
+        state = create_aggregate_state(
+            function=aggregate['function'],
+            number_of_groups=number_of_groups,
+            dtype=self.encoded_table.columns[aggregate['column']].dtype
+        )
+        self.aggregate_states[aggregate_key(aggregate)] = state
+        return state
+
+
+def _truncate(state: AggregateState, number_of_groups: int) -> AggregateState:
+    # The states are allocated for every group of the table, and the kernel fills the first
+    # number_of_groups of them, which are the groups with a row that satisfies WHERE.
+    state.number_of_groups = number_of_groups
+    state.counts = state.counts[:number_of_groups]
+    for accumulator in ['sums', 'values']:
+        if hasattr(state, accumulator):
+            setattr(state, accumulator, getattr(state, accumulator)[:number_of_groups])
+    return state
+
+
+def _is_kernel_column(encoded_table: EncodedTable, column: str) -> bool:
+    return column in encoded_table.columns and encoded_table.columns[column].dtype.kind in 'biuf'
+
+
+def _is_kernel_condition(condition: ParsedWhereClause | ParsedSuchThatSection, encoded_table: EncodedTable) -> bool:
+    if 'conditions' in condition:
+        return all(_is_kernel_condition(sub_condition, encoded_table) for sub_condition in condition['conditions'])
+    if 'condition' in condition:
+        return _is_kernel_condition(condition['condition'], encoded_table)
+    value = condition['value']
+    return (
+        condition['operator'] in COMPARISON_OPERATORS
+        and _is_kernel_column(encoded_table, condition['column'])
+        and isinstance(value, (int, float, bool, np.integer, np.floating, np.bool_))
+    )
@@ -0,0 +1,94 @@
+from .statistics import TableStatistics, ColumnStatistics
+from .predicates import COMPARISON_OPERATORS
+from ..parser.types import ParsedWhereClause, ParsedSuchThatSection, ParsedSuchThatClause, LogicalOperator
+
+
+# Selectivity assumed for predicates the statistics cannot estimate.
+DEFAULT_SELECTIVITY = 1 / 3
+
+# Lower bound used when ranking predicates, so that certain predicates still get a finite rank.
+MIN_PROBABILITY = 1e-6
+
+
+def order_condition(condition: ParsedWhereClause | ParsedSuchThatSection | None, statistics: TableStatistics) -> ParsedWhereClause | ParsedSuchThatSection | None:
+    '''
+    Return a copy of a condition whose operands are in evaluation order: by cost / (1 - selectivity)
+    for 'and' and by cost / selectivity for 'or'.
+    '''
+    if condition is None:
+        return None
+    return _order(condition, statistics)[0]
+
+
+def order_such_that_clause(such_that_clause: ParsedSuchThatClause | None, statistics: TableStatistics) -> ParsedSuchThatClause | None:
+    if such_that_clause is None:
+        return None
+    return [order_condition(section, statistics) for section in such_that_clause]
+
+
+def estimate_selectivity(condition: ParsedWhereClause | ParsedSuchThatSection, statistics: TableStatistics) -> float:
+    '''
+    Estimate the share of rows that satisfy a condition, assuming independent predicates.
+    '''
+    return _order(condition, statistics)[1]
+
+
+def _order(condition: ParsedWhereClause | ParsedSuchThatSection, statistics: TableStatistics) -> tuple[ParsedWhereClause | ParsedSuchThatSection, float, int]:
+    '''
+    Return the ordered condition along with its estimated selectivity and cost, where
+    the cost is the number of comparisons needed to evaluate it.
+    '''
+    operator = condition.get('operator')
+    if 'column' in condition:
+        return condition, _estimate_comparison(condition, statistics.column(condition['column'])), 1
+
+    if operator == LogicalOperator.NOT:
+        ordered, selectivity, cost = _order(condition['condition'], statistics)
+        return {**condition, 'condition': ordered}, 1 - selectivity, cost
+
+    operands = [_order(sub_condition, statistics) for sub_condition in condition['conditions']]
+    cost = sum(operand_cost for _, _, operand_cost in operands)
+    if operator == LogicalOperator.AND:
+        operands.sort(key=lambda operand: operand[2] / max(1 - operand[1], MIN_PROBABILITY))
+        selectivity = 1.0
+        for _, operand_selectivity, _ in operands:
+            selectivity *= operand_selectivity
+    else:
+        operands.sort(key=lambda operand: operand[2] / max(operand[1], MIN_PROBABILITY))
+        rejected = 1.0
+        for _, operand_selectivity, _ in operands:
+            rejected *= 1 - operand_selectivity
+        selectivity = 1 - rejected
+    return {**condition, 'conditions': [ordered for ordered, _, _ in operands]}, selectivity, cost
+
+
+def _estimate_comparison(condition: ParsedWhereClause | ParsedSuchThatSection, statistics: ColumnStatistics | None) -> float:
+    operator = condition['operator']
+    if condition.get('is_emf') or statistics is None or statistics.row_count == 0 or operator not in COMPARISON_OPERATORS:
+        return DEFAULT_SELECTIVITY
+    value = condition['value']
+    valid_share = statistics.valid_count / statistics.row_count
+
+    if statistics.frequencies is not None:
+        try:
+            matching = sum(
+                count for column_value, count in statistics.frequencies.items()
+                if COMPARISON_OPERATORS['=' if operator == '!=' else operator](column_value, value)
+            )
+        except TypeError:
+            return DEFAULT_SELECTIVITY
+        selectivity = matching / statistics.row_count
+        return 1 - selectivity if operator == '!=' else selectivity
+
+    if operator in ['=', '==', '!=']:
+        selectivity = valid_share / max(statistics.distinct_count, 1)
+        return 1 - selectivity if operator == '!=' else selectivity
+
+    if statistics.minimum is None or not isinstance(value, (int, float)) or isinstance(value, bool):
+        return DEFAULT_SELECTIVITY
+    value_range = statistics.maximum - statistics.minimum
+    if value_range <= 0:
+        return valid_share if COMPARISON_OPERATORS[operator](statistics.minimum, value) else 0.0
+    below = min(max((value - statistics.minimum) / value_range, 0.0), 1.0)
+    return valid_share * (below if operator in ['<', '<='] else 1 - below)
+
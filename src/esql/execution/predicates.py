@@ -0,0 +1,202 @@
+import operator as operators
+import numpy as np
+
+from .error import RuntimeError
+from .encoding import EncodedTable
+from .cancellation import CancellationToken
+from .statistics import TableStatistics, BLOCK_NONE, BLOCK_SOME, BLOCK_ALL
+from .aggregates import aggregate_key
+from ..parser.types import ParsedWhereClause, ParsedSuchThatSection, GlobalAggregate, GroupAggregate, LogicalOperator
+
+
+COMPARISON_OPERATORS = {
+    '=': operators.eq,
+    '==': operators.eq,
+    '!=': operators.ne,
+    '>': operators.gt,
+    '<': operators.lt,
+    '>=': operators.ge,
+    '<=': operators.le
+}
+
+
+def missing_value_satisfies(operator: str) -> bool:
+    # The rule for missing values in every evaluator: they only satisfy '!='.
+    return operator == '!='
+
+
+class PredicateCache:
+    '''
+    Evaluates WHERE conditions and SUCH THAT sections as boolean masks, one column at a time.
+    Every distinct predicate is evaluated once per query and shared by the WHERE clause and
+    the grouping variables. 'and' and 'or' short-circuit, and zone maps decide whole blocks.
+    '''
+    def __init__(self, encoded_table: EncodedTable, cancellation_token: CancellationToken | None = None, statistics: TableStatistics | None = None):
+        self.encoded_table = encoded_table
+        self.cancellation_token = cancellation_token
+        self.statistics = statistics
+        self.group_ids: np.ndarray | None = None
+        self.aggregate_values: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._masks: dict[tuple, np.ndarray] = {}
+        self._occurrences: dict[tuple, int] = {}
+
+    def register(self, condition: ParsedWhereClause | ParsedSuchThatSection) -> None:
+        '''
+        Count the predicates of a condition that will be evaluated by this query.
+        '''
+        key = predicate_key(condition)
+        self._occurrences[key] = self._occurrences.get(key, 0) + 1
+        if 'conditions' in condition:
+            for sub_condition in condition['conditions']:
+                self.register(sub_condition)
+        elif 'condition' in condition:
+            self.register(condition['condition'])
+
+    def mask(self, condition: ParsedWhereClause | ParsedSuchThatSection) -> np.ndarray:
+        key = predicate_key(condition)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._evaluate(condition, None)
+            self._masks[key] = mask
+        return mask
+
+    def evaluate_rows(self, condition: ParsedWhereClause | ParsedSuchThatSection, row_ids: np.ndarray) -> np.ndarray:
+        '''
+        Evaluate a condition on some rows only, without caching the result. Masks that are
+        cached or shared are still used.
+        '''
+        return self._operand_mask(condition, row_ids)
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def _evaluate(self, condition: ParsedWhereClause | ParsedSuchThatSection, row_ids: np.ndarray | None) -> np.ndarray:
+        '''
+        Evaluate a condition on the given rows, or on every row when row_ids is None.
+        '''
+        operator = condition.get('operator')
+        if 'column' in condition:
+            if self.cancellation_token is not None:
+                self.cancellation_token.raise_if_cancelled()
+            return self._evaluate_comparison(condition['column'], operator, condition['value'], row_ids)
+        if operator == LogicalOperator.NOT:
+            return ~self._operand_mask(condition['condition'], row_ids)
+        if operator not in [LogicalOperator.AND, LogicalOperator.OR]:
+            raise RuntimeError(f"Unknown logical operator: {operator}")
+
+        # An 'and' is decided for a row once an operand is false, an 'or' once one is true.
+        deciding_value = operator == LogicalOperator.OR
+        number_of_rows = self._number_of_rows(row_ids)
+        result = np.full(number_of_rows, not deciding_value, dtype=bool)
+        open_positions = None
+        for sub_condition in condition['conditions']:
+            if open_positions is None:
+                operand_mask = self._operand_mask(sub_condition, row_ids)
+                decided = operand_mask == deciding_value
+                result[decided] = deciding_value
+                open_positions = np.flatnonzero(~decided)
+            else:
+                if len(open_positions) == 0:
+                    break
+                open_row_ids = open_positions if row_ids is None else row_ids[open_positions]
+                operand_mask = self._operand_mask(sub_condition, open_row_ids)
+                decided = operand_mask == deciding_value
+                result[open_positions[decided]] = deciding_value
+                open_positions = open_positions[~decided]
+        return result
+
+    def _operand_mask(self, condition: ParsedWhereClause | ParsedSuchThatSection, row_ids: np.ndarray | None) -> np.ndarray:
+        key = predicate_key(condition)
+        if row_ids is None or self._occurrences.get(key, 0) > 1:
+            mask = self.mask(condition)
+            return mask if row_ids is None else mask[row_ids]
+        mask = self._masks.get(key)
+        if mask is not None:
+            return mask[row_ids]
+        return self._evaluate(condition, row_ids)
+
+    def _number_of_rows(self, row_ids: np.ndarray | None) -> int:
+        if row_ids is not None:
+            return len(row_ids)
+        column_names = self.encoded_table.column_names
+        return len(self.encoded_table.columns[column_names[0]]) if column_names else 0
+
+    def _evaluate_comparison(self, column: str, operator: str, value: int | float | str | bool, row_ids: np.ndarray | None) -> np.ndarray:
+        if column not in self.encoded_table.columns:
+            raise RuntimeError(f"Column '{column}' not found in datatable")
+        if operator not in COMPARISON_OPERATORS:
+            raise RuntimeError(f"Unknown operator in condition: '{operator}'")
+        if isinstance(value, dict):
+            return self._compare_with_aggregate(column, operator, value, row_ids)
+
+        zone_map = self.statistics.zone_map(column) if self.statistics is not None else None
+        if zone_map is None:
+            return self._compare(column, operator, value, row_ids)
+        block_states = zone_map.classify(operator, value)
+        if (block_states == BLOCK_SOME).all():
+            return self._compare(column, operator, value, row_ids)
+
+        if row_ids is not None:
+            row_states = block_states[row_ids // zone_map.block_size]
+            mask = row_states == BLOCK_ALL
+            compared = np.flatnonzero(row_states == BLOCK_SOME)
+            mask[compared] = self._compare(column, operator, value, row_ids[compared])
+            return mask
+
+        mask = np.zeros(self._number_of_rows(None), dtype=bool)
+        for state, start, end in zip(block_states.tolist(), zone_map.starts.tolist(), zone_map.ends.tolist()):
+            if state == BLOCK_ALL:
+                mask[start:end] = True
+            elif state == BLOCK_SOME:
+                mask[start:end] = self._compare(column, operator, value, slice(start, end))
+        return mask
+
+    def _compare_with_aggregate(self, column: str, operator: str, aggregate: GlobalAggregate | GroupAggregate, row_ids: np.ndarray | None) -> np.ndarray:
+        key = aggregate_key(aggregate)
+        if key not in self.aggregate_values or self.group_ids is None:
+            raise RuntimeError(f"Aggregate '{key}' is compared with before it is computed")
+        aggregate_values, has_value = self.aggregate_values[key]
+        group_ids = self.group_ids if row_ids is None else self.group_ids[row_ids]
+        values = self.encoded_table.columns[column]
+        valid = self.encoded_table.is_valid(column)
+        if row_ids is not None:
+            values = values[row_ids]
+            valid = valid[row_ids]
+        mask = valid & has_value[group_ids]
+        mask[mask] = COMPARISON_OPERATORS[operator](values[mask], aggregate_values[group_ids[mask]])
+        return mask
+
+    def _compare(self, column: str, operator: str, value: int | float | str | bool, rows: np.ndarray | slice | None) -> np.ndarray:
+        values = self.encoded_table.columns[column]
+        valid = self.encoded_table.is_valid(column)
+        if rows is not None:
+            values = values[rows]
+            valid = valid[rows]
+        compare = COMPARISON_OPERATORS[operator]
+        mask = np.full(len(values), missing_value_satisfies(operator), dtype=bool)
+        if valid.all():
+            mask[:] = compare(values, value)
+        else:
+            mask[valid] = compare(values[valid], value)
+        return mask
+
+
+def predicate_key(condition: ParsedWhereClause | ParsedSuchThatSection) -> tuple:
+    '''
+    A hashable key that is equal for conditions that select the same rows, regardless of
+    the grouping variable they belong to.
+    '''
+    operator = condition.get('operator')
+    if 'column' in condition:
+        value = condition['value']
+        if isinstance(value, dict) and 'function' in value:
+            return ('=' if operator == '==' else operator, condition['column'], ('aggregate', aggregate_key(value)))
+        return ('=' if operator == '==' else operator, condition['column'], _hashable(value))
+    if operator == LogicalOperator.NOT:
+        return (operator.value, predicate_key(condition['condition']))
+    return (operator.value, frozenset(predicate_key(sub_condition) for sub_condition in condition['conditions']))
+
+
+def _hashable(value: int | float | str | bool) -> tuple:
+    # True == 1 and 1 == 1.0 hash alike, but they are kept apart by their type.
+    return (type(value).__name__, value)
@@ -0,0 +1,26 @@
+import numpy as np
+
+from .encoding import EncodedTable
+from .grouping import compute_group_ids
+from .aggregates import AggregateState
+
+
+def map_groups_to_grouping_set(encoded_table: EncodedTable, group_row_ids: np.ndarray, grouping_set: list[str]) -> tuple[np.ndarray, int]:
+    '''
+    Map every group of the finest grouping set to its group in a coarser grouping set, from
+    one row of each group (group_row_ids). Returns the map and the number of coarser groups.
+    '''
+    if not grouping_set:
+        return np.zeros(len(group_row_ids), dtype=np.int64), 1
+    return compute_group_ids(encoded_table.take(group_row_ids), grouping_set)
+
+
+def regroup_aggregate_states(aggregate_states: dict[str, AggregateState], group_map: np.ndarray, number_of_groups: int) -> dict[str, AggregateState]:
+    '''
+    The aggregate states of a coarser grouping set, merged from the states of the finest
+    one without visiting the rows again.
+    '''
+    return {
+        key: state.regroup(group_map, number_of_groups)
+        for key, state in aggregate_states.items()
+    }
@@ -0,0 +1,75 @@
+import numpy as np
+from beartype import beartype
+from beartype.vale import Is
+from typing import Annotated
+from statistics import NormalDist
+
+from .encoding import EncodedTable
+from .grouping import compute_group_ids
+from .statistics import TableStatistics
+
+
+# Smallest number of rows sampled from every group of a stratified sample, when the group has them.
+DEFAULT_MIN_ROWS_PER_STRATUM = 30
+
+DEFAULT_CONFIDENCE = 0.95
+
+# Suffixes of the result columns with the bounds of an approximate aggregate.
+CI_LOW_SUFFIX = '.ci_low'
+CI_HIGH_SUFFIX = '.ci_high'
+
+# Only these aggregates are scaled up from a sample and get confidence intervals.
+ESTIMATED_FUNCTIONS = ('sum', 'count', 'avg')
+
+Fraction = Annotated[float, Is[lambda x: 0 < x <= 1]]
+Confidence = Annotated[float, Is[lambda x: 0 < x < 1]]
+NonNegativeInt = Annotated[int, Is[lambda x: x >= 0]]
+
+
+class SampleSpec:
+    '''
+    How an approximate query samples the datatable: every row with probability fraction, or
+    stratified by the grouping attributes so that every group gets min_rows_per_stratum rows.
+    '''
+    @beartype
+    def __init__(self, fraction: Fraction, seed: int | None = None, stratified: bool = False, min_rows_per_stratum: NonNegativeInt = DEFAULT_MIN_ROWS_PER_STRATUM, confidence: Confidence = DEFAULT_CONFIDENCE):
+        self.fraction = fraction
+        self.seed = seed
+        self.stratified = stratified
+        self.min_rows_per_stratum = min_rows_per_stratum
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"SampleSpec(fraction={self.fraction}, seed={self.seed}, stratified={self.stratified}, min_rows_per_stratum={self.min_rows_per_stratum}, confidence={self.confidence})"
+
+
+def draw_sample(encoded_table: EncodedTable, sample_spec: SampleSpec, grouping_attributes: list[str], statistics: TableStatistics | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Return the sorted ids of the sampled rows and their weights, the inverse of the
+    probability with which each of them was sampled.
+    '''
+    number_of_rows = len(encoded_table.columns[encoded_table.column_names[0]]) if encoded_table.column_names else 0
+    probabilities = np.full(number_of_rows, sample_spec.fraction, dtype=np.float64)
+    if sample_spec.stratified and grouping_attributes:
+        group_ids, number_of_groups = compute_group_ids(encoded_table, grouping_attributes, statistics)
+        group_sizes = np.bincount(group_ids, minlength=number_of_groups)
+        group_probabilities = np.minimum(1.0, np.maximum(sample_spec.fraction, sample_spec.min_rows_per_stratum / np.maximum(group_sizes, 1)))
+        probabilities = group_probabilities[group_ids]
+
+    random = np.random.default_rng(sample_spec.seed)
+    row_ids = np.flatnonzero(random.random(number_of_rows) < probabilities)
+    return row_ids, 1.0 / probabilities[row_ids]
+
+
+def confidence_interval_values(estimates: dict[str, tuple[np.ndarray, np.ndarray]], standard_errors: dict[str, np.ndarray], confidence: float) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    '''
+    The bounds of the normal confidence interval of every estimated aggregate, keyed by the
+    aggregate key with CI_LOW_SUFFIX or CI_HIGH_SUFFIX.
+    '''
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    bounds = {}
+    for key, standard_error in standard_errors.items():
+        values, has_value = estimates[key]
+        bounds[key + CI_LOW_SUFFIX] = (values - z * standard_error, has_value)
+        bounds[key + CI_HIGH_SUFFIX] = (values + z * standard_error, has_value)
+    return bounds
@@ -0,0 +1,31 @@
+from .error import RuntimeError
+from ..parser.util import find_group_dependencies
+from ..parser.types import ParsedSuchThatSection
+
+
+def schedule_passes(groups: list[str], sections: dict[str, ParsedSuchThatSection]) -> list[list[str]]:
+    '''
+    Order the grouping variables into passes, every variable in the first pass after the
+    variables whose aggregates it compares with, in the order of the OVER clause.
+    '''
+    dependencies = {
+        group: find_group_dependencies(sections[group]) if group in sections else set()
+        for group in groups
+    }
+    levels: dict[str, int] = {}
+    remaining = list(groups)
+    while remaining:
+        scheduled = [
+            group for group in remaining
+            if all(dependency in levels for dependency in dependencies[group] if dependency in dependencies)
+        ]
+        if not scheduled:
+            raise RuntimeError(f"Circular dependency between groups: {', '.join(remaining)}")
+        for group in scheduled:
+            levels[group] = 1 + max((levels[dependency] for dependency in dependencies[group] if dependency in levels), default=-1)
+        remaining = [group for group in remaining if group not in levels]
+
+    passes = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for group in groups:
+        passes[levels[group]].append(group)
+    return passes
@@ -0,0 +1,160 @@
+import os
+import re
+import math
+import pickle
+import tempfile
+import warnings
+import numpy as np
+import pandas as pd
+from collections.abc import Iterator
+
+from .error import RuntimeError
+from .encoding import EncodedTable
+from .correlation import split_emf_conditions
+from ..parser.types import ParsedSelectClause, ParsedSuchThatClause
+
+
+MEMORY_UNITS = {
+    '': 1,
+    'b': 1,
+    'kb': 10 ** 3,
+    'mb': 10 ** 6,
+    'gb': 10 ** 9,
+    'tb': 10 ** 12,
+    'kib': 1 << 10,
+    'mib': 1 << 20,
+    'gib': 1 << 30,
+    'tib': 1 << 40
+}
+
+# Rough working memory of a query for every selected row (row ids, group ids and masks),
+# and for every group (aggregate states and the Python objects of its result row).
+ROW_BYTES = 32
+GROUP_BYTES = 256
+SELECT_ITEM_BYTES = 96
+
+# Most partitions a query is split into, however small its memory limit.
+MAX_PARTITIONS = 4096
+
+# Groups of every partition when a result is streamed, unless a memory limit requires fewer.
+STREAM_PARTITION_GROUPS = 1 << 16
+
+# Odd 64 bit constant that combines the hashes of the partitioning attributes.
+HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def parse_memory_limit(memory_limit: int | str) -> int:
+    '''
+    The number of bytes of a memory limit given as bytes or as a string like '4GB' or
+    '512 MiB'. KB, MB, GB and TB are powers of 1000, KiB, MiB, GiB and TiB powers of 1024.
+    '''
+    if isinstance(memory_limit, int):
+        number_of_bytes = memory_limit
+    else:
+        match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]*)\s*$", memory_limit.lower())
+        if not match or match.group(2) not in MEMORY_UNITS:
+            raise RuntimeError(f"Invalid memory limit: '{memory_limit}'")
+        number_of_bytes = int(float(match.group(1)) * MEMORY_UNITS[match.group(2)])
+    if number_of_bytes <= 0:
+        raise RuntimeError(f"Memory limit must be greater than zero: '{memory_limit}'")
+    return number_of_bytes
+
+
+def estimate_query_memory(number_of_rows: int, number_of_groups: int, number_of_select_items: int) -> int:
+    return number_of_rows * ROW_BYTES + number_of_groups * (GROUP_BYTES + number_of_select_items * SELECT_ITEM_BYTES)
+
+
+def count_partitions(estimated_memory: int, memory_limit: int) -> int:
+    return min(MAX_PARTITIONS, max(1, math.ceil(estimated_memory / memory_limit)))
+
+
+def find_partitioning_attributes(parsed_select_clause: ParsedSelectClause, parsed_such_that_clause: ParsedSuchThatClause | None) -> list[str]:
+    '''
+    The grouping attributes that every SUCH THAT section with EMF conditions compares with
+    itself ('x.cust = cust'), or an empty list when the query cannot be partitioned.
+    '''
+    if 'grouping_sets' in parsed_select_clause:
+        return []
+    attributes = list(parsed_select_clause['grouping_attributes'])
+    for section in parsed_such_that_clause or []:
+        emf_conditions, _ = split_emf_conditions(section)
+        if emf_conditions:
+            compared_with_itself = {
+                condition['column'] for condition in emf_conditions
+                if condition['column'] == condition['value']['attribute'] and not condition['value']['offset']
+            }
+            attributes = [attribute for attribute in attributes if attribute in compared_with_itself]
+    return attributes
+
+
+def partition_rows(encoded_table: EncodedTable, attributes: list[str], row_ids: np.ndarray, number_of_partitions: int) -> list[np.ndarray]:
+    '''
+    Split the rows into partitions by a hash of their values in the attributes, so that
+    all the rows with the same values are in the same partition. Returns the sorted row
+    ids of every partition.
+    '''
+    hashes = np.zeros(len(row_ids), dtype=np.uint64)
+    for attribute in attributes:
+        hashes = hashes * HASH_MULTIPLIER ^ pd.util.hash_array(encoded_table.columns[attribute][row_ids])
+    partition_ids = (hashes % np.uint64(number_of_partitions)).astype(np.int64)
+    order = np.argsort(partition_ids, kind='stable')
+    ends = np.cumsum(np.bincount(partition_ids, minlength=number_of_partitions))
+    return np.split(row_ids[order], ends[:-1])
+
+
+class SpillDirectory:
+    '''
+    A temporary directory holding the results of the partitions of a query, one file per
+    partition, so that only one partition is in memory while it is computed. Sorted runs
+    of rows are spilled in chunks instead, so that they can be merged while only one
+    chunk of every run is in memory. The files are deleted when the directory is closed.
+    '''
+    def __init__(self):
+        self._directory = tempfile.TemporaryDirectory(prefix='esql-spill-')
+        self._paths: list[str] = []
+        self._runs: list[list[str]] = []
+
+    def spill(self, result: pd.DataFrame) -> None:
+        path = os.path.join(self._directory.name, f"partition-{len(self._paths)}.pkl")
+        result.to_pickle(path)
+        self._paths.append(path)
+
+    def spill_rows(self, rows: list[dict], chunk_size: int) -> list[str]:
+        '''
+        Spill a run of rows in chunks of chunk_size rows, which read_rows() reads back
+        one chunk at a time. Returns the paths of the chunks.
+        '''
+        paths = []
+        for start in range(0, len(rows), chunk_size):
+            path = os.path.join(self._directory.name, f"run-{len(self._runs)}-{len(paths)}.pkl")
+            with open(path, 'wb') as file:
+                pickle.dump(rows[start:start + chunk_size], file, protocol=pickle.HIGHEST_PROTOCOL)
+            paths.append(path)
+        self._runs.append(paths)
+        return paths
+
+    def read_rows(self, paths: list[str]) -> Iterator[dict]:
+        for path in paths:
+            with open(path, 'rb') as file:
+                rows = pickle.load(file)
+            os.remove(path)
+            yield from rows
+
+    def read(self) -> pd.DataFrame:
+        results = [pd.read_pickle(path) for path in self._paths]
+        if not results:
+            return pd.DataFrame()
+        # A partition whose groups all miss an aggregate has an object column of None,
+        # which must not turn the numbers of the other partitions into objects.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            return pd.concat(results, ignore_index=True).infer_objects()
+
+    def close(self) -> None:
+        self._directory.cleanup()
+
+    def __enter__(self) -> 'SpillDirectory':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,180 @@
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from .encoding import EncodedTable
+
+
+# Value frequencies are only kept for columns with at most this many distinct values.
+MAX_TRACKED_VALUES = 1024
+
+# Number of rows summarized by each entry of a zone map.
+ZONE_MAP_BLOCK_SIZE = 65536
+
+# What a zone map knows about the rows of a block that satisfy a comparison.
+BLOCK_NONE = 0
+BLOCK_SOME = 1
+BLOCK_ALL = 2
+
+
+class ColumnStatistics:
+    '''
+    Cheap statistics of one column, on the codes of encoded columns, used to estimate how many
+    rows a predicate selects. frequencies is None for columns with many distinct values.
+    '''
+    def __init__(self, values: np.ndarray, valid: np.ndarray):
+        self.row_count = len(values)
+        self.valid_count = int(valid.sum())
+        self.null_count = self.row_count - self.valid_count
+        valid_values = values[valid]
+        counts = pd.Series(valid_values).value_counts(sort=False)
+        self.distinct_count = len(counts)
+        self.frequencies: dict | None = None
+        if self.distinct_count <= MAX_TRACKED_VALUES:
+            self.frequencies = dict(zip(counts.index.tolist(), counts.tolist()))
+        self.minimum = None
+        self.maximum = None
+        if self.valid_count and values.dtype.kind in 'biuf':
+            self.minimum = valid_values.min().item()
+            self.maximum = valid_values.max().item()
+
+
+class ZoneMap:
+    '''
+    The minimum, maximum and number of missing values of every block of block_size rows
+    of a column. classify() tells from these alone which blocks cannot contain a row that
+    satisfies a comparison and which blocks only contain such rows, so that those blocks
+    do not have to be scanned.
+    '''
+    def __init__(self, values: np.ndarray, valid: np.ndarray, block_size: int):
+        self.block_size = block_size
+        self.starts = np.arange(0, len(values), block_size)
+        self.ends = np.minimum(self.starts + block_size, len(values))
+        self.null_counts = np.add.reduceat((~valid).astype(np.int64), self.starts) if len(values) else np.zeros(0, dtype=np.int64)
+        self.has_values = self.null_counts < self.ends - self.starts
+        self.minimums, self.maximums = _block_ranges(values, valid, self.starts, self.ends, self.has_values)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def classify(self, operator: str, value: int | float | str | bool | date) -> np.ndarray:
+        '''
+        Return BLOCK_NONE, BLOCK_SOME or BLOCK_ALL for every block. Missing values
+        follow predicates.missing_value_satisfies(), as they do when the rows are compared.
+        '''
+        states = np.full(len(self), BLOCK_SOME, dtype=np.int8)
+        minimums, maximums, has_values = self.minimums, self.maximums, self.has_values
+        no_nulls = self.null_counts == 0
+        try:
+            single_value = has_values & (minimums == value) & (maximums == value)
+            outside = has_values & ((minimums > value) | (maximums < value))
+            if operator in ['=', '==']:
+                none, every = ~has_values | outside, no_nulls & single_value
+            elif operator == '!=':
+                none, every = no_nulls & single_value, ~has_values | outside
+            elif operator == '<':
+                none, every = ~has_values | (minimums >= value), no_nulls & (maximums < value)
+            elif operator == '<=':
+                none, every = ~has_values | (minimums > value), no_nulls & (maximums <= value)
+            elif operator == '>':
+                none, every = ~has_values | (maximums <= value), no_nulls & (minimums > value)
+            elif operator == '>=':
+                none, every = ~has_values | (maximums < value), no_nulls & (minimums >= value)
+            else:
+                return states
+        except TypeError:
+            return states
+        states[np.asarray(none, dtype=bool)] = BLOCK_NONE
+        states[np.asarray(every, dtype=bool)] = BLOCK_ALL
+        return states
+
+
+class TableStatistics:
+    '''
+    Column statistics and zone maps of an encoded table, collected lazily the first time
+    a column is used.
+    '''
+    def __init__(self, encoded_table: EncodedTable, block_size: int = ZONE_MAP_BLOCK_SIZE):
+        self.encoded_table = encoded_table
+        self.block_size = block_size
+        self._columns: dict[str, ColumnStatistics] = {}
+        self._zone_maps: dict[str, ZoneMap | None] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def row_count(self) -> int:
+        if not self.encoded_table.column_names:
+            return 0
+        return len(self.encoded_table.columns[self.encoded_table.column_names[0]])
+
+    def column(self, column: str) -> ColumnStatistics | None:
+        if column not in self.encoded_table.columns:
+            return None
+        if column not in self._columns:
+            statistics = ColumnStatistics(
+                values=self.encoded_table.columns[column],
+                valid=self.encoded_table.is_valid(column)
+            )
+            with self._lock:
+                self._columns.setdefault(column, statistics)
+        return self._columns[column]
+
+    def zone_map(self, column: str) -> ZoneMap | None:
+        '''
+        The zone map of a column, or None if its values cannot be ordered.
+        '''
+        if column not in self.encoded_table.columns:
+            return None
+        if column not in self._zone_maps:
+            values = self.encoded_table.columns[column]
+            zone_map = None
+            if values.dtype.kind in 'biuf' or values.dtype == object:
+                try:
+                    zone_map = ZoneMap(values, self.encoded_table.is_valid(column), self.block_size)
+                except TypeError:
+                    zone_map = None
+            with self._lock:
+                self._zone_maps.setdefault(column, zone_map)
+        return self._zone_maps[column]
+
+    def estimate_group_count(self, columns: list[str]) -> int:
+        '''
+        Upper bound of the number of distinct combinations of the columns, used to
+        pre-size the hash tables that number the groups.
+        '''
+        estimate = 1
+        for column in columns:
+            statistics = self.column(column)
+            if statistics is None:
+                return self.row_count
+            estimate *= statistics.distinct_count + (1 if statistics.null_count else 0)
+            if estimate >= self.row_count:
+                return self.row_count
+        return estimate
+
+
+def _block_ranges(values: np.ndarray, valid: np.ndarray, starts: np.ndarray, ends: np.ndarray, has_values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if len(values) == 0:
+        return values[:0], values[:0]
+    if values.dtype.kind == 'f':
+        # fmin and fmax skip NaN, blocks without any value are masked by has_values.
+        return np.fmin.reduceat(values, starts), np.fmax.reduceat(values, starts)
+    if values.dtype.kind in 'biu':
+        values = values.astype(np.int64)
+        largest, smallest = np.iinfo(np.int64).max, np.iinfo(np.int64).min
+        return (
+            np.minimum.reduceat(np.where(valid, values, largest), starts),
+            np.maximum.reduceat(np.where(valid, values, smallest), starts)
+        )
+
+    minimums = np.empty(len(starts), dtype=object)
+    maximums = np.empty(len(starts), dtype=object)
+    placeholder = values[valid][0] if has_values.any() else None
+    for block, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        block_values = values[start:end][valid[start:end]]
+        if len(block_values):
+            minimums[block], maximums[block] = min(block_values), max(block_values)
+        else:
+            minimums[block] = maximums[block] = placeholder
+    return minimums, maximums
@@ -0,0 +1,58 @@
+from typing import TYPE_CHECKING
+
+from .parser.parse import _prepare_query
+from .parser.types import ParsedQuery
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .execution.catalog import DatasetCatalog
+
+
+class LazyQuery:
+    '''
+    A query that has been parsed against a DataFrame but not executed.
+
+    Lazy queries are executed with collect(), which runs the queries over the same
+    DataFrame together, so that they share their filters, groups and aggregates.
+    '''
+    def __init__(self, query: str, parsed_query: ParsedQuery, decimal_places: int, catalog: 'DatasetCatalog'):
+        self.query = query
+        self.parsed_query = parsed_query
+        self.decimal_places = decimal_places
+        self.catalog = catalog
+
+    def collect(self) -> 'pd.DataFrame':
+        return collect(self)[0]
+
+    def __repr__(self) -> str:
+        return f"LazyQuery({self.query!r})"
+
+
+def collect(*queries: LazyQuery) -> list['pd.DataFrame']:
+    '''
+    Execute lazy queries and return their results in the same order. Queries over the
+    same DataFrame are executed together, and a query that is given more than once is
+    only executed once.
+    '''
+    from .execution.fusion import execute_fused
+
+    results: list['pd.DataFrame | None'] = [None] * len(queries)
+    positions_by_catalog: dict[int, list[int]] = {}
+    for position, query in enumerate(queries):
+        positions_by_catalog.setdefault(id(query.catalog), []).append(position)
+
+    for positions in positions_by_catalog.values():
+        distinct_queries: dict[tuple[str, int], list[int]] = {}
+        for position in positions:
+            key = (_prepare_query(queries[position].query), queries[position].decimal_places)
+            distinct_queries.setdefault(key, []).append(position)
+        first_positions = [same_positions[0] for same_positions in distinct_queries.values()]
+        fused_results = execute_fused(
+            parsed_queries=[queries[position].parsed_query for position in first_positions],
+            decimal_places=[queries[position].decimal_places for position in first_positions],
+            catalog=queries[positions[0]].catalog
+        )
+        for same_positions, result in zip(distinct_queries.values(), fused_results):
+            for number, position in enumerate(same_positions):
+                results[position] = result if number == 0 else result.copy()
+    return results
@@ -0,0 +1,56 @@
+import re
+
+
+# Columns are described by numpy or pandas dtypes when a query is parsed against a
+# DataFrame, and by dtype names ('int64', 'string', 'date', ...) when it is parsed against
+# a schema, which the checks below tell apart without importing pandas. Dates are
+# datetime.date objects, so they are object columns, as in the DataFrames of the accessor.
+INTEGER_DTYPE_PATTERN = r"u?int(8|16|32|64)?|U?Int(8|16|32|64)"
+FLOAT_DTYPE_PATTERN = r"float(16|32|64)?|Float(32|64)|double"
+BOOL_DTYPE_NAMES = {'bool', 'boolean'}
+OBJECT_DTYPE_NAMES = {'object', 'date', 'O'}
+STRING_DTYPE_NAMES = {'string', 'str', 'category'}
+
+
+def is_bool_dtype(dtype) -> bool:
+    if isinstance(dtype, str):
+        return dtype in BOOL_DTYPE_NAMES
+    from pandas.api.types import is_bool_dtype
+    return is_bool_dtype(dtype)
+
+
+def is_numeric_dtype(dtype) -> bool:
+    # Like pandas, booleans are numeric.
+    if isinstance(dtype, str):
+        return is_real_numeric_dtype(dtype) or is_bool_dtype(dtype)
+    from pandas.api.types import is_numeric_dtype
+    return is_numeric_dtype(dtype)
+
+
+def is_real_numeric_dtype(dtype) -> bool:
+    if isinstance(dtype, str):
+        return re.fullmatch(INTEGER_DTYPE_PATTERN, dtype) is not None or re.fullmatch(FLOAT_DTYPE_PATTERN, dtype) is not None
+    from pandas.api.types import is_any_real_numeric_dtype
+    return is_any_real_numeric_dtype(dtype)
+
+
+def is_object_dtype(dtype) -> bool:
+    if isinstance(dtype, str):
+        return dtype in OBJECT_DTYPE_NAMES
+    from pandas.api.types import is_object_dtype
+    return is_object_dtype(dtype)
+
+
+def is_text_dtype(dtype) -> bool:
+    # Strings, categories of strings, and object columns.
+    if isinstance(dtype, str):
+        return dtype in STRING_DTYPE_NAMES or dtype in OBJECT_DTYPE_NAMES
+    from pandas import CategoricalDtype
+    from pandas.api.types import is_string_dtype
+    return is_string_dtype(dtype) or isinstance(dtype, CategoricalDtype)
+
+
+def is_dtype_name(dtype) -> bool:
+    return isinstance(dtype, str) and (
+        is_bool_dtype(dtype) or is_real_numeric_dtype(dtype) or is_object_dtype(dtype) or dtype in STRING_DTYPE_NAMES
+    )
@@ -12,6 +12,8 @@ class ParsingErrorType(Enum):
     CLAUSE_ORDER = "CLAUSE ORDER"
     MISSING_CLAUSE = "MISSING CLAUSE"
 
+    SCHEMA = "SCHEMA"
+
 
 class ParsingError(Exception):
     def __init__(self, error_type: ParsingErrorType, message: str):
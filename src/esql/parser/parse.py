@@ -1,15 +1,38 @@
 import re
-import pandas as pd
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
 
-from src.esql.parser.types import ParsedQuery
-from src.esql.parser.util import get_keyword_clauses, parse_over_clause, parse_select_clause, parse_where_clause, parse_such_that_clause, parse_having_clause, parse_order_by_clause
+from . import dtypes
+from .error import ParsingError, ParsingErrorType
+from .types import ParsedQuery
+from .util import find_aggregates_in_such_that_section, get_keyword_clauses, parse_over_clause, parse_select_clause, parse_where_clause, parse_such_that_clause, parse_having_clause, parse_order_by_clause, validate_grouping_sets
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def get_parsed_query(data: pd.DataFrame, query: str) -> ParsedQuery:
+
+def get_parsed_query(data: 'pd.DataFrame', query: str) -> ParsedQuery:
     prepared_query = _prepare_query(query)
     return _build_parsed_query(
         data=data, 
-        query=prepared_query
+        query=prepared_query,
+        column_dtypes=data.dtypes.to_dict()
+    )
+
+
+def parse_query(query: str, column_dtypes: Mapping[str, str]) -> ParsedQuery:
+    '''
+    Parse and validate a query against the columns of a dataset, given by the names of
+    their dtypes ('int64', 'float64', 'bool', 'string', 'category' or 'date'), without
+    importing pandas. The parsed query has no data, so it can be inspected but not executed.
+    '''
+    invalid_columns = [column for column, dtype in column_dtypes.items() if not dtypes.is_dtype_name(dtype)]
+    if invalid_columns:
+        raise ParsingError(ParsingErrorType.SCHEMA, f"Unknown dtypes for columns: {', '.join(invalid_columns)}")
+    return _build_parsed_query(
+        data=None,
+        query=_prepare_query(query),
+        column_dtypes=dict(column_dtypes)
     )
     
 
@@ -37,8 +60,7 @@ def _prepare_query(query: str) -> str:
     return ' '.join(query.split())
 
 
-def _build_parsed_query(data: pd.DataFrame, query: str) -> ParsedQuery:
-    column_dtypes = data.dtypes.to_dict()
+def _build_parsed_query(data: 'pd.DataFrame | None', query: str, column_dtypes: dict) -> ParsedQuery:
     keyword_clauses = get_keyword_clauses(query)
     
     parsed_over_clause = parse_over_clause(
@@ -59,17 +81,29 @@ def _build_parsed_query(data: pd.DataFrame, query: str) -> ParsedQuery:
     parsed_such_that_clauses = parse_such_that_clause(
         such_that_clause=keyword_clauses["SUCH THAT"],
         groups=parsed_over_clause,
-        column_dtypes=column_dtypes
+        column_dtypes=column_dtypes,
+        grouping_attributes=parsed_select_clause['grouping_attributes']
     )
     
+    validate_grouping_sets(parsed_select_clause, parsed_such_that_clauses)
+
     (parsed_having_clause, aggregates) = parse_having_clause(
         having_clause=keyword_clauses["HAVING"],
         groups=parsed_over_clause,
         column_dtypes=column_dtypes
     )
 
-    aggregates['global_scope'].extend(parsed_select_clause['aggregates']['global_scope'])
-    aggregates['group_specific'].extend(parsed_select_clause['aggregates']['group_specific'])
+    for scope in ['global_scope', 'group_specific']:
+        for aggregate in parsed_select_clause['aggregates'][scope]:
+            if aggregate not in aggregates[scope]:
+                aggregates[scope].append(aggregate)
+
+    # Aggregates compared with in the SUCH THAT clause are computed like any other aggregate.
+    for section in parsed_such_that_clauses or []:
+        for aggregate in find_aggregates_in_such_that_section(section):
+            scope = 'group_specific' if 'group' in aggregate else 'global_scope'
+            if aggregate not in aggregates[scope]:
+                aggregates[scope].append(aggregate)
 
     order_by_clause = parse_order_by_clause(
         order_by_clause=keyword_clauses["ORDER BY"],
@@ -1,7 +1,9 @@
-import pandas as pd
 from enum import Enum
 from datetime import date
-from typing import TypedDict, Union, Literal, List, Dict, Tuple
+from typing import TYPE_CHECKING, TypedDict, NotRequired, Union, Literal, List, Dict, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class GlobalAggregate(TypedDict):
@@ -27,11 +29,15 @@ class LogicalOperator(Enum):
     NOT = "not"
 
 
+class EMFReference(TypedDict):
+    attribute: str  # Grouping attribute of the current group.
+    offset: float   # Added to the attribute value, e.g. -1 for 'month - 1'.
+
 class SimpleCondition(TypedDict):
     column: str
     operator: str
-    value: Union[float, bool, str, date]
-    is_emf: bool  # EMF is when the comparison value is based on the entry value of the column.                      
+    value: Union[float, bool, str, date, EMFReference, GlobalAggregate, GroupAggregate]
+    is_emf: bool  # EMF is when the comparison value is based on the entry value of the column or on an aggregate of the group.                      
 
 class CompoundCondition(TypedDict):
     operator: Literal[LogicalOperator.AND, LogicalOperator.OR]
@@ -73,6 +79,7 @@ class ParsedSelectClause(TypedDict):
     grouping_attributes: List[str]
     aggregates: AggregatesDict
     select_items_in_order: List[str]
+    grouping_sets: NotRequired[List[List[str]]]    # Only for ROLLUP, CUBE and GROUPING SETS
 
 ParsedWhereClause = (
     SimpleCondition |
@@ -95,7 +102,8 @@ ParsedHavingClause = (
 )
 
 class ParsedQuery(TypedDict):
-    data: pd.DataFrame
+    # None for queries parsed against a schema, which cannot be executed.
+    data: 'pd.DataFrame | None'
     select: ParsedSelectClause
     over: List[str] | None
     where: ParsedWhereClause | None
@@ -1,10 +1,16 @@
+from __future__ import annotations
+
 import re
-import numpy as np
-import pandas as pd
+import itertools
 from datetime import datetime, date
+from typing import TYPE_CHECKING
+
+from . import dtypes
+from .error import ParsingError, ParsingErrorType
+from .types import EMFReference, ParsedSelectClause, GlobalAggregate, GroupAggregate, AggregatesDict, ParsedWhereClause, SimpleCondition, CompoundCondition, NotCondition, LogicalOperator, ParsedSuchThatClause, ParsedSuchThatSection, SimpleGroupCondition, CompoundGroupCondition, NotGroupCondition, ParsedHavingClause, CompoundAggregateCondition, NotAggregateCondition, GlobalAggregateCondition, GroupAggregateCondition
 
-from src.esql.parser.error import ParsingError, ParsingErrorType
-from src.esql.parser.types import ParsedSelectClause, GlobalAggregate, GroupAggregate, AggregatesDict, ParsedWhereClause, SimpleCondition, CompoundCondition, NotCondition, LogicalOperator, ParsedSuchThatClause, ParsedSuchThatSection, SimpleGroupCondition, CompoundGroupCondition, NotGroupCondition, ParsedHavingClause, CompoundAggregateCondition, NotAggregateCondition, GlobalAggregateCondition, GroupAggregateCondition
+if TYPE_CHECKING:
+    import numpy as np
 
 
 ###########################################################################
@@ -82,8 +88,22 @@ def parse_select_clause(select_clause: str, groups: list[str], column_dtypes: di
         global_scope=[],
         group_specific=[]
     )
-    
-    for item in (s.strip() for s in select_clause.split(',')):
+    # Every ROLLUP, CUBE or GROUPING SETS item multiplies the grouping sets by its own.
+    grouping_sets = None
+
+    for item in (s.strip() for s in _split_outside_parentheses(select_clause)):
+        item_grouping_sets = _parse_grouping_sets_item(item, column_dtypes)
+        if item_grouping_sets is not None:
+            grouping_sets = [
+                grouping_set + item_grouping_set
+                for grouping_set in grouping_sets or [[]]
+                for item_grouping_set in item_grouping_sets
+            ]
+            for attribute in (attribute for item_grouping_set in item_grouping_sets for attribute in item_grouping_set):
+                if attribute not in grouping_attributes:
+                    grouping_attributes.append(attribute)
+                    select_items_in_order.append(attribute)
+            continue
         if '.' in item:
             aggregate_result = _parse_aggregate(
                 aggregate=item, 
@@ -104,11 +124,67 @@ def parse_select_clause(select_clause: str, groups: list[str], column_dtypes: di
     if len(grouping_attributes) == 0:
         raise ParsingError(ParsingErrorType.SELECT_CLAUSE, f"No grouping attributes given: '{select_clause}'")
 
-    return ParsedSelectClause(
+    parsed_select_clause = ParsedSelectClause(
         grouping_attributes=grouping_attributes,
         aggregates=aggregates,
         select_items_in_order=select_items_in_order
     )
+    if grouping_sets is not None:
+        # Plain grouping attributes are part of every grouping set, in the order of the SELECT clause.
+        parsed_select_clause['grouping_sets'] = [
+            [attribute for attribute in grouping_attributes if attribute in grouping_set or attribute not in _grouping_set_attributes(grouping_sets)]
+            for grouping_set in grouping_sets
+        ]
+    return parsed_select_clause
+
+
+def _parse_grouping_sets_item(item: str, column_dtypes: dict[str, np.dtype]) -> list[list[str]] | None:
+    '''
+    Parse a ROLLUP(...), CUBE(...) or GROUPING SETS(...) item of the SELECT clause into its
+    grouping sets. Returns None for any other item.
+    '''
+    match = re.match(r"^(rollup|cube|grouping sets)\s*\((.*)\)$", item)
+    if not match:
+        return None
+    function, arguments = match.group(1), match.group(2).strip()
+    if function == 'grouping sets':
+        grouping_sets = []
+        for grouping_set in (s.strip() for s in _split_outside_parentheses(arguments)):
+            if _has_wrapping_parenthesis(grouping_set):
+                grouping_set = grouping_set[1:-1]
+            grouping_sets.append(_parse_grouping_set_attributes(grouping_set, item, column_dtypes))
+        return grouping_sets
+
+    attributes = _parse_grouping_set_attributes(arguments, item, column_dtypes)
+    if not attributes:
+        raise ParsingError(ParsingErrorType.SELECT_CLAUSE, f"No grouping attributes given: '{item}'")
+    if function == 'rollup':
+        return [attributes[:length] for length in range(len(attributes), -1, -1)]
+    return [list(subset) for length in range(len(attributes), -1, -1) for subset in itertools.combinations(attributes, length)]
+
+
+def _parse_grouping_set_attributes(grouping_set: str, item: str, column_dtypes: dict[str, np.dtype]) -> list[str]:
+    attributes = [attribute.strip() for attribute in grouping_set.split(',') if attribute.strip()]
+    for attribute in attributes:
+        if attribute not in column_dtypes:
+            raise ParsingError(ParsingErrorType.SELECT_CLAUSE, f"Invalid column: '{attribute}' in '{item}'")
+    return attributes
+
+
+def _grouping_set_attributes(grouping_sets: list[list[str]]) -> set[str]:
+    return {attribute for grouping_set in grouping_sets for attribute in grouping_set}
+
+
+def validate_grouping_sets(parsed_select_clause: ParsedSelectClause, parsed_such_that_clause: ParsedSuchThatClause | None) -> None:
+    '''
+    The coarser grouping sets are computed from the aggregates of the finest one, which only
+    holds when the rows of every grouping variable do not depend on the grouping set.
+    '''
+    if 'grouping_sets' not in parsed_select_clause:
+        return
+    for section in parsed_such_that_clause or []:
+        if _has_attribute_references(section) or find_aggregates_in_such_that_section(section):
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, "ROLLUP, CUBE and GROUPING SETS cannot be used with conditions on grouping attributes or aggregates")
 
 
 ###########################################################################
@@ -152,7 +228,7 @@ def _parse_simple_condition(condition: str, column_dtypes: dict[str, np.dtype])
     condition = condition.strip()
     split = _split_condition(condition)
     if not split:
-        if condition in column_dtypes and pd.api.types.is_bool_dtype(column_dtypes[condition]):
+        if condition in column_dtypes and dtypes.is_bool_dtype(column_dtypes[condition]):
             return SimpleCondition(
                 column=condition,
                 operator='=',
@@ -175,6 +251,8 @@ def _parse_simple_condition(condition: str, column_dtypes: dict[str, np.dtype])
         condition=condition,
         error_type=ParsingErrorType.WHERE_CLAUSE
     )
+    if is_emf:
+        raise ParsingError(ParsingErrorType.WHERE_CLAUSE, f"Conditions on the current group are only allowed in the SUCH THAT clause: '{condition}'")
 
     return SimpleCondition(
         column=column,
@@ -187,25 +265,31 @@ def _parse_simple_condition(condition: str, column_dtypes: dict[str, np.dtype])
 ###########################################################################
 # SUCH THAT Clause Parsing
 ###########################################################################
-def parse_such_that_clause(such_that_clause: str | None, groups: list[str], column_dtypes: dict[str, np.dtype]) -> ParsedSuchThatClause | None:
+def parse_such_that_clause(such_that_clause: str | None, groups: list[str], column_dtypes: dict[str, np.dtype], grouping_attributes: list[str] | None = None) -> ParsedSuchThatClause | None:
     if such_that_clause == None:
         return None
     parsed_such_that_clause = []
     such_that_sections = such_that_clause.split(',')
     for section in such_that_sections:
-        parsed_such_that_clause.append(
-            _parse_such_that_section(
-                section=section,
-                groups=groups,
-                column_dtypes=column_dtypes
-            )
+        parsed_section = _parse_such_that_section(
+            section=section,
+            groups=groups,
+            column_dtypes=column_dtypes
+        )
+        _validate_emf_conditions(
+            section=parsed_section,
+            grouping_attributes=grouping_attributes or [],
+            column_dtypes=column_dtypes,
+            top_level=True
         )
+        parsed_such_that_clause.append(parsed_section)
     groups_in_parsed_clause = set()
     for section in parsed_such_that_clause:
         group = find_group_in_such_that_section(section)
         if group in groups_in_parsed_clause:
             raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Multiple sections contain group '{group}'.")
         groups_in_parsed_clause.add(group)
+    _validate_group_dependencies(parsed_such_that_clause)
     return parsed_such_that_clause
 
 def find_group_in_such_that_section(group_condition: ParsedSuchThatSection):
@@ -216,6 +300,76 @@ def find_group_in_such_that_section(group_condition: ParsedSuchThatSection):
         return find_group_in_such_that_section(group_condition.get('condition') or group_condition.get('conditions')[0])
     return group
 
+def _validate_emf_conditions(section: ParsedSuchThatSection, grouping_attributes: list[str], column_dtypes: dict[str, np.dtype], top_level: bool) -> None:
+    '''
+    EMF conditions on grouping attributes are joined with the groups by hashing, so they
+    must be equalities with a grouping attribute that hold for the whole section, i.e.
+    combined only with 'and'. Conditions on aggregates compare each row with the aggregate
+    of its own group, so they cannot be used in the same section.
+    '''
+    if 'column' in section:
+        if not section['is_emf'] or 'function' in section['value']:
+            return
+        attribute = section['value']['attribute']
+        if attribute not in grouping_attributes:
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"'{attribute}' in condition on '{section['group']}.{section['column']}' is not a grouping attribute")
+        if not top_level:
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Conditions on grouping attributes can only be combined with 'and': '{section['group']}.{section['column']} = {attribute}'")
+        if not _have_comparable_dtypes(column_dtypes[section['column']], column_dtypes[attribute]) or \
+            section['value']['offset'] and not dtypes.is_numeric_dtype(column_dtypes[attribute]):
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"'{section['group']}.{section['column']}' cannot be compared with '{attribute}'")
+        return
+    if top_level and find_aggregates_in_such_that_section(section) and _has_attribute_references(section):
+        raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Conditions on aggregates and on grouping attributes cannot be used in the same section of group '{find_group_in_such_that_section(section)}'")
+    if 'conditions' in section:
+        for condition in section['conditions']:
+            _validate_emf_conditions(condition, grouping_attributes, column_dtypes, top_level and section['operator'] == LogicalOperator.AND)
+    else:
+        _validate_emf_conditions(section['condition'], grouping_attributes, column_dtypes, False)
+
+def _has_attribute_references(section: ParsedSuchThatSection) -> bool:
+    if 'column' in section:
+        return section['is_emf'] and 'attribute' in section['value']
+    if 'conditions' in section:
+        return any(_has_attribute_references(condition) for condition in section['conditions'])
+    return _has_attribute_references(section['condition'])
+
+def find_aggregates_in_such_that_section(section: ParsedSuchThatSection) -> list[GlobalAggregate | GroupAggregate]:
+    '''
+    The aggregates that the conditions of a section compare with.
+    '''
+    if 'column' in section:
+        return [section['value']] if section['is_emf'] and 'function' in section['value'] else []
+    if 'conditions' in section:
+        return [aggregate for condition in section['conditions'] for aggregate in find_aggregates_in_such_that_section(condition)]
+    return find_aggregates_in_such_that_section(section['condition'])
+
+def find_group_dependencies(section: ParsedSuchThatSection) -> set[str]:
+    '''
+    The groups whose aggregates must be computed before the rows of a section can be selected.
+    '''
+    return {aggregate['group'] for aggregate in find_aggregates_in_such_that_section(section) if 'group' in aggregate}
+
+def _validate_group_dependencies(parsed_such_that_clause: ParsedSuchThatClause) -> None:
+    dependencies = {
+        find_group_in_such_that_section(section): find_group_dependencies(section)
+        for section in parsed_such_that_clause
+    }
+    visiting, visited = set(), set()
+    def visit(group: str, path: list[str]) -> None:
+        if group in visited:
+            return
+        if group in visiting:
+            cycle = path[path.index(group):] + [group]
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Circular dependency between groups: {' -> '.join(cycle)}")
+        visiting.add(group)
+        for dependency in dependencies.get(group, set()):
+            visit(dependency, path + [group])
+        visiting.discard(group)
+        visited.add(group)
+    for group in dependencies:
+        visit(group, [])
+
 def _parse_such_that_section(section: str, groups: list[str], column_dtypes: dict[str, np.dtype]) -> ParsedSuchThatSection:
     section = section.strip()
     if _has_wrapping_parenthesis(section):
@@ -258,19 +412,22 @@ def _parse_such_that_section(section: str, groups: list[str], column_dtypes: dic
     if not group_found:
         raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"No valid group found in condition: '{section}'")
 
-    if any(other_group + '.' in section for other_group in groups if other_group != group_found):
+    # The value may refer to an aggregate of another group, so only the compared column is checked.
+    split = _split_condition(section)
+    compared_column = split[0] if split else section
+    if any(other_group + '.' in compared_column for other_group in groups if other_group != group_found):
         raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Multiple groups found in a clause: '{section}'\nEach comma seperated clause must contain only one group.")
     
-    return _parse_simple_group_condition(section, group_found, column_dtypes)
+    return _parse_simple_group_condition(section, group_found, groups, column_dtypes)
     
 
-def _parse_simple_group_condition(condition: str, group: str, column_dtypes: dict[str, np.dtype]) -> SimpleGroupCondition:
+def _parse_simple_group_condition(condition: str, group: str, groups: list[str], column_dtypes: dict[str, np.dtype]) -> SimpleGroupCondition:
     condition = condition.strip()
     split = _split_condition(condition)
     if not split:
         if condition.startswith(group + '.'):
             column = condition[len(group) + 1:].strip()
-            if column in column_dtypes and pd.api.types.is_bool_dtype(column_dtypes[column]):
+            if column in column_dtypes and dtypes.is_bool_dtype(column_dtypes[column]):
                 return SimpleGroupCondition(
                     group=group,
                     column=column,
@@ -289,6 +446,20 @@ def _parse_simple_group_condition(condition: str, group: str, column_dtypes: dic
     if operator and value == '':
         raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Missing value for condition: {condition}")
 
+    aggregate = _parse_aggregate_reference(value, groups, column_dtypes)
+    if aggregate is not None:
+        if aggregate.get('group') == group:
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"A group cannot depend on its own aggregates: '{condition}'")
+        if not dtypes.is_real_numeric_dtype(column_dtypes[column]):
+            raise ParsingError(ParsingErrorType.SUCH_THAT_CLAUSE, f"Only numeric columns can be compared with an aggregate: '{condition}'")
+        return SimpleGroupCondition(
+            group=group,
+            column=column,
+            operator=operator,
+            value=aggregate,
+            is_emf=True
+        )
+
     parsed_value, is_emf = _parse_condition_value(
         column_dtype=column_dtypes[column],
         operator=operator,
@@ -325,6 +496,17 @@ def parse_having_clause(having_clause: str | None, groups: list[str], column_dty
     )
 
 
+def find_aggregates_in_having_clause(condition: ParsedHavingClause) -> list[GlobalAggregate | GroupAggregate]:
+    '''
+    The aggregates that the conditions of a HAVING clause compare.
+    '''
+    if 'aggregate' in condition:
+        return [condition['aggregate']]
+    if 'conditions' in condition:
+        return [aggregate for sub_condition in condition['conditions'] for aggregate in find_aggregates_in_having_clause(sub_condition)]
+    return find_aggregates_in_having_clause(condition['condition'])
+
+
 def _parse_having_clause(having_clause: str, aggregates: AggregatesDict, groups: list[str], column_dtypes: dict[str, np.dtype]) -> tuple[ParsedHavingClause, AggregatesDict]:
     having_clause = having_clause.strip()
     if _has_wrapping_parenthesis(having_clause):
@@ -432,7 +614,9 @@ def parse_order_by_clause(order_by_clause: str | None, number_of_select_grouping
 # Aggregate and Value Parsing
 ###########################################################################
 def _parse_aggregate(aggregate: str, groups: list[str], column_dtypes: dict[str, np.dtype], error_type=ParsingErrorType.SELECT_CLAUSE or ParsingErrorType.HAVING_CLAUSE) -> GlobalAggregate | GroupAggregate:
-    AGGREGATE_FUNCTIONS = ['sum','avg','min', 'max', 'count']
+    AGGREGATE_FUNCTIONS = ['sum','avg','min', 'max', 'count', 'count_distinct', 'approx_count_distinct', 'var', 'stddev', 'var_pop', 'stddev_pop']
+    # Counting functions also accept non-numeric columns.
+    COUNT_FUNCTIONS = ['count', 'count_distinct', 'approx_count_distinct']
     parts = aggregate.split('.')
 
     # Format: column.aggregate_function
@@ -440,9 +624,9 @@ def _parse_aggregate(aggregate: str, groups: list[str], column_dtypes: dict[str,
         column, func = parts
         if column not in column_dtypes:
             raise ParsingError(error_type, f"Invalid aggregate column: '{aggregate}'")
-        elif func not in AGGREGATE_FUNCTIONS:
+        elif func not in AGGREGATE_FUNCTIONS and parse_percentile_function(func) is None:
             raise ParsingError(error_type, f"Invalid aggregate function: '{aggregate}'")
-        elif func != 'count' and not (pd.api.types.is_any_real_numeric_dtype(column_dtypes[column])):
+        elif func not in COUNT_FUNCTIONS and not (dtypes.is_real_numeric_dtype(column_dtypes[column])):
             raise ParsingError(error_type, f"Invalid aggregate. Column is not a numeric type: '{aggregate}'")
         return GlobalAggregate(
             column=column,
@@ -456,9 +640,9 @@ def _parse_aggregate(aggregate: str, groups: list[str], column_dtypes: dict[str,
             raise ParsingError(error_type, f"Invalid aggregate group: '{aggregate}'")
         elif column not in column_dtypes:
             raise ParsingError(error_type, f"Invalid aggregate column: '{aggregate}'")
-        elif func not in AGGREGATE_FUNCTIONS:
+        elif func not in AGGREGATE_FUNCTIONS and parse_percentile_function(func) is None:
             raise ParsingError(error_type, f"Invalid aggregate function: '{aggregate}'")
-        elif func != 'count' and not (pd.api.types.is_any_real_numeric_dtype(column_dtypes[column])):
+        elif func not in COUNT_FUNCTIONS and not (dtypes.is_real_numeric_dtype(column_dtypes[column])):
             raise ParsingError(error_type, f"Invalid aggregate. Column is not a numeric type: '{aggregate}'")
         return GroupAggregate(
             group=group,
@@ -469,19 +653,37 @@ def _parse_aggregate(aggregate: str, groups: list[str], column_dtypes: dict[str,
     raise ParsingError(error_type, f"Invalid aggregate: '{aggregate}'\nAggregate must be in the format 'column.function' or 'group.column.function'")
 
 
+def parse_percentile_function(function: str) -> tuple[float, bool] | None:
+    '''
+    Parse a percentile aggregate function (i.e. 'median', 'p95', 'approx_median' or
+    'approx_p95') into its quantile and whether it is approximate. Returns None for any
+    other function.
+    '''
+    match = re.match(r"^(approx_)?(median|p(\d{1,3}))$", function)
+    if not match or (match.group(3) is not None and int(match.group(3)) > 100):
+        return None
+    quantile = 0.5 if match.group(2) == 'median' else int(match.group(3)) / 100
+    return quantile, match.group(1) is not None
+
+
 def _parse_condition_value(column_dtype: np.dtype, operator: str, value: str, column_dtypes: dict[str, np.dtype], condition: str, error_type=ParsingErrorType.SELECT_CLAUSE or ParsingErrorType.SUCH_THAT_CLAUSE) -> tuple[float | bool | str | date, bool]:
     date_pattern = r"^['\"]\d{4}[-/]\d{1,2}[-/]\d{1,2}['\"]$"
     value = value.strip()
     
-    #TODO implement EMF parsing here
+    emf_reference = _parse_emf_condition_value(value, column_dtypes)
+    if emf_reference is not None:
+        if operator not in ['=', '==']:
+            raise ParsingError(error_type, f"Conditions on grouping attributes must use '=': '{condition}'")
+        return emf_reference, True
+
     if operator in ['>=', '<=', '>', '<']:
-        if re.match(date_pattern, value) and pd.api.types.is_object_dtype(column_dtype):
+        if re.match(date_pattern, value) and dtypes.is_object_dtype(column_dtype):
             try:
                 date_str = value[1:-1].replace('/', '-')
                 return datetime.strptime(date_str, "%Y-%m-%d").date(), False
             except ValueError:
                 raise ParsingError(error_type, f"Invalid date in condition: '{condition}'")
-        elif pd.api.types.is_numeric_dtype(column_dtype):
+        elif dtypes.is_numeric_dtype(column_dtype):
             try:
                 value = float(value)
                 return int(value) if value.is_integer() else value, False
@@ -490,18 +692,18 @@ def _parse_condition_value(column_dtype: np.dtype, operator: str, value: str, co
         raise ParsingError(error_type, f"Invalid column reference or value in condition: '{condition}'")
             
     elif operator in ['=', '==', '!=']:
-        if value.lower() in ['true', 'false'] and pd.api.types.is_bool_dtype(column_dtype):
+        if value.lower() in ['true', 'false'] and dtypes.is_bool_dtype(column_dtype):
             return value.lower() == 'true', False
-        elif re.match(date_pattern, value) and pd.api.types.is_object_dtype(column_dtype):
+        elif re.match(date_pattern, value) and dtypes.is_object_dtype(column_dtype):
             try:
                 date_str = value[1:-1].replace('/', '-')
                 return datetime.strptime(date_str, "%Y-%m-%d").date(), False
             except ValueError:
                 raise ParsingError(error_type, f"Invalid date in condition: '{condition}'")
         elif (value.startswith("'") and value.endswith("'") or value.startswith('"') and value.endswith('"')) \
-            and pd.api.types.is_string_dtype(column_dtype):
+            and dtypes.is_text_dtype(column_dtype):
             return value[1:-1], False
-        elif pd.api.types.is_numeric_dtype(column_dtype):
+        elif dtypes.is_numeric_dtype(column_dtype):
             try:
                 value = float(value)
                 return int(value) if value.is_integer() else value, False
@@ -512,10 +714,47 @@ def _parse_condition_value(column_dtype: np.dtype, operator: str, value: str, co
     raise ParsingError(error_type, f"Invalid operator in condition: '{condition}'")
 
 
-#TODO: Implement to handle parsing of EMF values
-# Should be able to handle numeric euquations (i.e col = col + 1) 
-def _parse_emf_condition_value(value: str): 
-    pass
+def _parse_emf_condition_value(value: str, column_dtypes: dict[str, np.dtype]) -> EMFReference | None:
+    '''
+    Parse a value that refers to a column of the current group, optionally plus or minus
+    a number (i.e. 'month' or 'month - 1'). Returns None for any other value.
+    '''
+    match = re.match(r"^([A-Za-z_]\w*)\s*(?:([+-])\s*(\d+(?:\.\d+)?))?$", value)
+    if not match or match.group(1) not in column_dtypes:
+        return None
+    offset = 0
+    if match.group(3):
+        offset = float(match.group(3))
+        offset = int(offset) if offset.is_integer() else offset
+        if match.group(2) == '-':
+            offset = -offset
+    return EMFReference(
+        attribute=match.group(1),
+        offset=offset
+    )
+
+
+def _parse_aggregate_reference(value: str, groups: list[str], column_dtypes: dict[str, np.dtype]) -> GlobalAggregate | GroupAggregate | None:
+    '''
+    Parse a value that refers to an aggregate of the current group (i.e. 'quant.avg' or
+    'x.quant.avg'). Returns None for any other value.
+    '''
+    value = value.strip()
+    if not re.match(r"^[A-Za-z_0-9]+(\.[A-Za-z_0-9]+){1,2}$", value) or re.match(r"^\d+\.\d+$", value):
+        return None
+    return _parse_aggregate(
+        aggregate=value,
+        groups=groups or [],
+        column_dtypes=column_dtypes,
+        error_type=ParsingErrorType.SUCH_THAT_CLAUSE
+    )
+
+
+def _have_comparable_dtypes(dtype: np.dtype, other_dtype: np.dtype) -> bool:
+    for is_kind in [dtypes.is_bool_dtype, dtypes.is_numeric_dtype, dtypes.is_object_dtype]:
+        if is_kind(dtype) or is_kind(other_dtype):
+            return is_kind(dtype) and is_kind(other_dtype)
+    return True
 
 
 ###########################################################################
@@ -569,6 +808,27 @@ def _has_wrapping_parenthesis(condition: str) -> bool:
     return paren_level == 0
 
 
+def _split_outside_parentheses(clause: str) -> list[str]:
+    # Split by the commas that are not inside parentheses or quotes.
+    parts = ['']
+    paren_level = 0
+    quote = None
+    for char in clause:
+        if quote is not None:
+            quote = None if char == quote else quote
+        elif char in ("'", '"'):
+            quote = char
+        elif char == '(':
+            paren_level += 1
+        elif char == ')':
+            paren_level -= 1
+        elif char == ',' and paren_level == 0:
+            parts.append('')
+            continue
+        parts[-1] += char
+    return parts
+
+
 def _split_by_logical_operator(condition: str, operator: LogicalOperator) -> list[str]:
     parts = []
     current = ''
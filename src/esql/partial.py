@@ -0,0 +1,254 @@
+import io
+import json
+import numpy as np
+import pandas as pd
+from collections.abc import Iterable
+
+from .accessor import _enforce_allowed_dtypes
+from .parser.parse import get_parsed_query
+from .parser.util import find_aggregates_in_such_that_section
+from .parser.types import ParsedQuery
+from .execution import algorithms
+from .execution.error import RuntimeError
+from .execution.catalog import DatasetCatalog
+from .execution.encoding import EncodedTable
+from .execution.grouping import compute_group_ids, first_row_of_each_group
+from .execution.aggregates import AggregateState, CountDistinctState, aggregate_key, create_aggregate_state
+from .execution.correlation import split_emf_conditions
+
+
+# Version of the serialized format. States of other versions cannot be loaded.
+FORMAT_VERSION = 1
+
+
+class PartialState:
+    '''
+    The aggregates of a query over part of a dataset, before they are finalized: the grouping
+    attributes of every group and the raw aggregate states. States merge with merge_states(),
+    become the result with finalize() and serialize to npz without pickling with to_bytes().
+    '''
+    def __init__(self, query: str, column_dtypes: dict[str, str], keys: dict[str, tuple[np.ndarray, np.ndarray]], states: dict[str, AggregateState], functions: dict[str, str]):
+        self.query = query
+        self.column_dtypes = column_dtypes
+        self.keys = keys
+        self.states = states
+        self.functions = functions
+
+    @property
+    def grouping_attributes(self) -> list[str]:
+        return list(self.keys)
+
+    @property
+    def number_of_groups(self) -> int:
+        return len(next(iter(self.keys.values()))[0])
+
+    def keys_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({attribute: _key_series(values, valid) for attribute, (values, valid) in self.keys.items()})
+
+    def to_bytes(self) -> bytes:
+        arrays = {
+            'meta': np.array(json.dumps({
+                'version': FORMAT_VERSION,
+                'query': self.query,
+                'column_dtypes': self.column_dtypes,
+                'grouping_attributes': self.grouping_attributes,
+                'functions': self.functions
+            }))
+        }
+        for attribute, (values, valid) in self.keys.items():
+            arrays[f"key/{attribute}/values"] = values
+            arrays[f"key/{attribute}/valid"] = valid
+        for key, state in self.states.items():
+            for name, value in vars(state).items():
+                arrays[f"state/{key}/{name}"] = np.asarray(value)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PartialState':
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            meta = json.loads(arrays['meta'].item())
+            if meta['version'] != FORMAT_VERSION:
+                raise RuntimeError(f"Unsupported partial state version: {meta['version']} (expected {FORMAT_VERSION})")
+            keys = {
+                attribute: (arrays[f"key/{attribute}/values"], arrays[f"key/{attribute}/valid"])
+                for attribute in meta['grouping_attributes']
+            }
+            number_of_groups = len(next(iter(keys.values()))[0])
+            states = {}
+            for key, function in meta['functions'].items():
+                state = create_aggregate_state(function, number_of_groups, np.dtype(np.float64))
+                prefix = f"state/{key}/"
+                for name in (name for name in arrays.files if name.startswith(prefix)):
+                    value = arrays[name]
+                    setattr(state, name[len(prefix):], value.item() if value.ndim == 0 else value)
+                states[key] = state
+        return cls(meta['query'], meta['column_dtypes'], keys, states, meta['functions'])
+
+
+def partial_aggregate(data: pd.DataFrame, query: str, catalog: DatasetCatalog | None = None, parsed_query: ParsedQuery | None = None) -> PartialState:
+    '''
+    Run the WHERE, grouping and SUCH THAT stages of a query over part of a dataset, with the
+    catalog of the data and the already parsed query when they are given.
+    '''
+    data = _enforce_allowed_dtypes(data) if catalog is None else catalog.data
+    parsed_query = parsed_query or get_parsed_query(data, query)
+    validate_partial_query(parsed_query)
+    catalog = catalog or DatasetCatalog(data)
+    encoded_table = catalog.encoded_table
+    first_row_ids, aggregate_states = algorithms.build_aggregate_states(
+        parsed_select_clause=parsed_query['select'],
+        parsed_where_clause=encoded_table.encode_condition(parsed_query['where']),
+        parsed_such_that_clause=encoded_table.encode_such_that_clause(parsed_query['such_that']),
+        aggregates=parsed_query['aggregates'],
+        encoded_table=encoded_table,
+        statistics=catalog.statistics
+    )
+    for key, state in aggregate_states.items():
+        if isinstance(state, CountDistinctState):
+            # Codes are only meaningful within this table, the states of other parts compare the values.
+            column = _aggregate_column(key)
+            values = encoded_table.decode(column, state.values) if encoded_table.is_encoded(column) else state.values
+            state.values = values.astype(str) if values.dtype == object else values
+
+    keys = {
+        attribute: _key_arrays(data[attribute].iloc[first_row_ids])
+        for attribute in parsed_query['select']['grouping_attributes']
+    }
+    return PartialState(
+        query=query,
+        column_dtypes={column: str(dtype) for column, dtype in data.dtypes.items()},
+        keys=keys,
+        states=aggregate_states,
+        functions={key: key.split('.')[-1] for key in aggregate_states}
+    )
+
+
+def merge_states(states: Iterable[PartialState]) -> PartialState:
+    '''
+    Merge the partial states of the same query over different parts of a dataset. Groups
+    with the same grouping attributes are combined, in order of first appearance.
+    '''
+    states = list(states)
+    if not states:
+        raise RuntimeError("No partial states to merge")
+    first_state = states[0]
+    for state in states[1:]:
+        if state.grouping_attributes != first_state.grouping_attributes or state.functions != first_state.functions:
+            raise RuntimeError("Partial states of different queries cannot be merged")
+
+    keys = {
+        attribute: (
+            np.concatenate([state.keys[attribute][0] for state in states]),
+            np.concatenate([state.keys[attribute][1] for state in states])
+        )
+        for attribute in first_state.grouping_attributes
+    }
+    key_table = EncodedTable(pd.DataFrame({attribute: _key_series(values, valid) for attribute, (values, valid) in keys.items()}))
+    group_ids, number_of_groups = compute_group_ids(key_table, first_state.grouping_attributes)
+
+    merged_states: dict[str, AggregateState] = {}
+    offset = 0
+    for state in states:
+        group_map = group_ids[offset:offset + state.number_of_groups]
+        offset += state.number_of_groups
+        for key, aggregate_state in state.states.items():
+            regrouped_state = aggregate_state.regroup(group_map, number_of_groups)
+            if key in merged_states:
+                merged_states[key].merge(regrouped_state)
+            else:
+                merged_states[key] = regrouped_state
+
+    first_row_ids = first_row_of_each_group(group_ids)
+    return PartialState(
+        query=first_state.query,
+        column_dtypes=first_state.column_dtypes,
+        keys={attribute: (values[first_row_ids], valid[first_row_ids]) for attribute, (values, valid) in keys.items()},
+        states=merged_states,
+        functions=first_state.functions
+    )
+
+
+def finalize(state: PartialState, query: str | None = None, decimal_places: int = 2, parsed_query: ParsedQuery | None = None) -> pd.DataFrame:
+    '''
+    Finalize the aggregates of a partial state and apply the HAVING, projection and
+    ORDER BY of the query, which is the query of the state by default.
+    '''
+    parsed_query = parsed_query or get_parsed_query(schema_frame(state.column_dtypes), state.query if query is None else query)
+    parsed_select_clause = parsed_query['select']
+    if parsed_select_clause['grouping_attributes'] != state.grouping_attributes:
+        raise RuntimeError(f"The query groups by {parsed_select_clause['grouping_attributes']}, the partial state by {state.grouping_attributes}")
+    aggregates = parsed_query['aggregates']['global_scope'] + parsed_query['aggregates']['group_specific']
+    missing_keys = [aggregate_key(aggregate) for aggregate in aggregates if aggregate_key(aggregate) not in state.states]
+    if missing_keys:
+        raise RuntimeError(f"Aggregates not in the partial state: {', '.join(missing_keys)}")
+
+    key_table = EncodedTable(state.keys_frame())
+    grouped_table = algorithms.build_grouped_table_from_states(
+        parsed_having_clause=parsed_query['having'],
+        aggregates=parsed_query['aggregates'],
+        aggregate_states=state.states,
+        grouping_attributes=state.grouping_attributes,
+        encoded_table=key_table
+    )
+    projected_table = algorithms.project_select_attributes(
+        parsed_select_clause=parsed_select_clause,
+        grouped_table=grouped_table,
+        decimal_places=decimal_places
+    )
+    ordered_table = algorithms.order_by_sort(
+        projected_table=projected_table,
+        order_by=parsed_query['order_by'],
+        grouping_attributes=parsed_select_clause['grouping_attributes']
+    )
+    return key_table.decode_result(pd.DataFrame(ordered_table))
+
+
+def schema_frame(column_dtypes: dict[str, str]) -> pd.DataFrame:
+    '''
+    An empty DataFrame with the given column dtypes, against which queries are parsed
+    without the data.
+    '''
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in column_dtypes.items()})
+
+
+def validate_partial_query(parsed_query: ParsedQuery) -> None:
+    '''
+    Raise a RuntimeError for queries whose aggregates cannot be computed part by part.
+    '''
+    if 'grouping_sets' in parsed_query['select']:
+        raise RuntimeError("ROLLUP, CUBE and GROUPING SETS cannot be computed as partial states")
+    for section in parsed_query['such_that'] or []:
+        emf_conditions, _ = split_emf_conditions(section)
+        if emf_conditions or find_aggregates_in_such_that_section(section):
+            raise RuntimeError("Partial states cannot be computed for SUCH THAT conditions on grouping attributes or aggregates")
+
+
+def _aggregate_column(key: str) -> str:
+    return key.split('.')[-2]
+
+
+def _key_arrays(series: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    # Strings become fixed width unicode and dates datetime64[D], so no array needs pickling.
+    valid = series.notna().to_numpy()
+    if pd.api.types.is_string_dtype(series.dtype) and series.dtype != object or isinstance(series.dtype, pd.CategoricalDtype):
+        return series.astype(object).where(valid, '').to_numpy().astype(str), valid
+    if series.dtype == object:
+        return pd.to_datetime(series).to_numpy().astype('datetime64[D]'), valid
+    if isinstance(series.array, (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)):
+        fill_value = False if isinstance(series.array, pd.arrays.BooleanArray) else 0
+        return series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=fill_value), valid
+    return series.to_numpy(), valid
+
+
+def _key_series(values: np.ndarray, valid: np.ndarray) -> pd.Series:
+    if values.dtype.kind == 'U':
+        return pd.Series(values, dtype='string').mask(~valid)
+    if values.dtype.kind == 'M':
+        dates = values.astype(object)
+        dates[~valid] = None
+        return pd.Series(dates, dtype=object)
+    if valid.all() or values.dtype.kind == 'f':
+        return pd.Series(values)
+    return pd.Series(pd.array(values, dtype='boolean' if values.dtype.kind == 'b' else 'Int64')).mask(~valid)
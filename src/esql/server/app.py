@@ -0,0 +1,169 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+from datetime import date
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, stream_with_context
+
+from ..parser.error import ParsingError
+from ..execution.error import RuntimeError
+from .error import DatasetNotFoundError
+from .registry import DatasetRegistry, QueryResult
+
+
+def create_app(registry: DatasetRegistry, workers: int = 4) -> Flask:
+    '''
+    Build the Flask application that serves ESQL queries over the datasets in the registry.
+
+    Queries are executed on a pool of `workers` threads, so at most that many queries
+    run at the same time regardless of how many requests the HTTP server accepts.
+    '''
+    app = Flask(__name__)
+    executor = ThreadPoolExecutor(
+        max_workers=workers,
+        thread_name_prefix="esql-worker"
+    )
+    app.extensions['esql'] = {
+        'registry': registry,
+        'executor': executor
+    }
+
+    @app.get("/health")
+    def health():
+        return {'status': 'ok', 'datasets': registry.names()}
+
+    @app.get("/datasets")
+    def list_datasets():
+        return {'datasets': [registry.get(name).describe() for name in registry.names()]}
+
+    @app.get("/datasets/<name>")
+    def describe_dataset(name: str):
+        return registry.get(name).describe()
+
+    @app.post("/datasets/<name>/query")
+    def query_dataset(name: str):
+        start = perf_counter()
+        body = request.get_json(silent=True) or {}
+        query = body.get('query')
+        decimal_places = body.get('decimal_places', 2)
+        output_format = request.args.get('format') or body.get('format') or _format_from_accept_header()
+        if not isinstance(query, str) or not query.strip():
+            return _error_response(400, "Request body must contain a 'query' string")
+        if not isinstance(decimal_places, int) or isinstance(decimal_places, bool) or decimal_places <= 0:
+            return _error_response(400, "'decimal_places' must be an integer greater than zero")
+        if output_format not in ('json', 'ndjson'):
+            return _error_response(400, f"Unknown format: '{output_format}'")
+
+        dataset = registry.get(name)
+        submitted = perf_counter()
+        future = executor.submit(_timed_query, dataset.query, query, decimal_places)
+        query_result, started = future.result()
+
+        timings = {
+            'queue_ms': _milliseconds(started - submitted),
+            'parse_ms': query_result['timings']['parse_ms'],
+            'execute_ms': query_result['timings']['execute_ms']
+        }
+        headers = {
+            'X-ESQL-Plan-Cached': str(query_result['plan_cached']).lower(),
+            'X-ESQL-Result-Cached': str(query_result['result_cached']).lower()
+        }
+
+        result = query_result['result']
+        if output_format == 'ndjson':
+            headers['Server-Timing'] = _server_timing_header(timings)
+            return Response(
+                stream_with_context(_ndjson_lines(result)),
+                mimetype='application/x-ndjson',
+                headers=headers
+            )
+
+        serialize_start = perf_counter()
+        rows = [_json_row(row) for row in result.itertuples(index=False, name=None)]
+        timings['serialize_ms'] = _milliseconds(perf_counter() - serialize_start)
+        timings['total_ms'] = _milliseconds(perf_counter() - start)
+        headers['Server-Timing'] = _server_timing_header(timings)
+        payload = {
+            'dataset': name,
+            'columns': [str(column) for column in result.columns],
+            'row_count': len(rows),
+            'rows': rows,
+            'timings': timings,
+            'cached': {
+                'plan': query_result['plan_cached'],
+                'result': query_result['result_cached']
+            }
+        }
+        return Response(
+            json.dumps(payload),
+            mimetype='application/json',
+            headers=headers
+        )
+
+    @app.errorhandler(DatasetNotFoundError)
+    def handle_dataset_not_found(error: DatasetNotFoundError):
+        return _error_response(404, str(error))
+
+    @app.errorhandler(ParsingError)
+    def handle_parsing_error(error: ParsingError):
+        return _error_response(400, str(error))
+
+    @app.errorhandler(RuntimeError)
+    def handle_runtime_error(error: RuntimeError):
+        return _error_response(422, str(error))
+
+    return app
+
+
+###############################################################################
+# Helpers
+###############################################################################
+def _timed_query(run_query, query: str, decimal_places: int) -> tuple[QueryResult, float]:
+    started = perf_counter()
+    return run_query(query, decimal_places), started
+
+
+def _format_from_accept_header() -> str:
+    if 'application/x-ndjson' in request.headers.get('Accept', ''):
+        return 'ndjson'
+    return 'json'
+
+
+def _ndjson_lines(result: pd.DataFrame):
+    columns = [str(column) for column in result.columns]
+    for row in result.itertuples(index=False, name=None):
+        yield json.dumps(dict(zip(columns, _json_row(row)))) + '\n'
+
+
+def _json_row(row: tuple) -> list:
+    return [_json_value(value) for value in row]
+
+
+def _json_value(value):
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _server_timing_header(timings: dict[str, float]) -> str:
+    return ', '.join(f"{name.removesuffix('_ms')};dur={duration}" for name, duration in timings.items())
+
+
+def _milliseconds(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _error_response(status: int, message: str) -> Response:
+    return Response(
+        json.dumps({'error': message}),
+        status=status,
+        mimetype='application/json'
+    )
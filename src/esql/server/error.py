@@ -0,0 +1,8 @@
+class DatasetNotFoundError(Exception):
+    def __init__(self, name: str):
+        self.name = name
+        self.message = f"Dataset '{name}' is not registered"
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message}"
@@ -0,0 +1,160 @@
+import os
+import glob
+import threading
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from typing import TypedDict
+
+from ..accessor import _enforce_allowed_dtypes
+from ..parser.parse import get_parsed_query, _prepare_query
+from ..parser.types import ParsedQuery
+from ..execution.error import RuntimeError
+from ..execution.execute import execute
+from ..execution.catalog import DatasetCatalog
+from .cache import LRUCache
+from .error import DatasetNotFoundError
+
+
+class QueryTimings(TypedDict):
+    parse_ms: float
+    execute_ms: float
+
+
+class QueryResult(TypedDict):
+    result: pd.DataFrame
+    timings: QueryTimings
+    plan_cached: bool
+    result_cached: bool
+
+
+class RegisteredDataset:
+    '''
+    A dataset that stays resident in the server process, with its parsed plans and results
+    cached by normalized query text. Cached results are returned as copies. Without copy,
+    the columns that already have an allowed dtype share their arrays with data.
+    '''
+    def __init__(self, name: str, data: pd.DataFrame, cache_size: int, copy: bool = True):
+        self.name = name
+        self.data = _enforce_allowed_dtypes(data, copy=copy)
+        self.catalog = DatasetCatalog(self.data)
+        self._plans = LRUCache(cache_size)
+        self._results = LRUCache(cache_size)
+
+    def query(self, query: str, decimal_places: int) -> QueryResult:
+        plan_key = _prepare_query(query)
+        result_key = (plan_key, decimal_places)
+
+        start = perf_counter()
+        cached_result = self._results.get(result_key)
+        if cached_result is not None:
+            return QueryResult(
+                result=cached_result.copy(),
+                timings=QueryTimings(parse_ms=0.0, execute_ms=_elapsed_ms(start)),
+                plan_cached=True,
+                result_cached=True
+            )
+
+        parsed_query: ParsedQuery | None = self._plans.get(plan_key)
+        plan_cached = parsed_query is not None
+        if not plan_cached:
+            parsed_query = get_parsed_query(self.data, query)
+            self._plans.put(plan_key, parsed_query)
+        parse_ms = _elapsed_ms(start)
+
+        start = perf_counter()
+        result = execute(parsed_query, decimal_places, catalog=self.catalog)
+        self._results.put(result_key, result)
+        return QueryResult(
+            result=result.copy(),
+            timings=QueryTimings(parse_ms=parse_ms, execute_ms=_elapsed_ms(start)),
+            plan_cached=plan_cached,
+            result_cached=False
+        )
+
+    def create_index(self, column: str) -> None:
+        self.catalog.create_index(column)
+
+    def describe(self) -> dict[str, str | int | list[str] | dict[str, str]]:
+        return {
+            'name': self.name,
+            'rows': len(self.data),
+            'columns': {column: str(dtype) for column, dtype in self.data.dtypes.items()},
+            'indexes': sorted(self.catalog.indexes)
+        }
+
+
+class DatasetRegistry:
+    '''
+    Holds every dataset served by the query service, keyed by name.
+    '''
+    def __init__(self, cache_size: int = 128):
+        self.cache_size = cache_size
+        self._datasets: dict[str, RegisteredDataset] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, data: pd.DataFrame, copy: bool = True) -> RegisteredDataset:
+        dataset = RegisteredDataset(
+            name=name,
+            data=data,
+            cache_size=self.cache_size,
+            copy=copy
+        )
+        with self._lock:
+            self._datasets[name] = dataset
+        return dataset
+
+    def load_csv(self, name: str, path: str, dtypes: dict[str, str] | None = None) -> RegisteredDataset:
+        '''
+        Load a CSV file once and register it.
+
+        dtypes maps column names to pandas dtypes that are enforced while reading.
+        The special dtype 'date' parses the column as a `yyyy-mm-dd` date.
+        '''
+        dtypes = dtypes or {}
+        date_columns = [column for column, dtype in dtypes.items() if dtype == 'date']
+        read_dtypes = {column: dtype for column, dtype in dtypes.items() if dtype != 'date'}
+        data = pd.read_csv(
+            path,
+            dtype=read_dtypes or None,
+            parse_dates=date_columns or False,
+            date_format="%Y-%m-%d" if date_columns else None
+        )
+        return self.register(name, data, copy=False)
+
+    def load_columns(self, name: str, directory: str) -> RegisteredDataset:
+        '''
+        Register a dataset stored as one `<column>.npy` file per column, which are memory
+        mapped rather than read. Columns are ordered by name, and string columns must be
+        saved as fixed width unicode arrays, since object arrays cannot be mapped. Numeric
+        and boolean columns stay mapped, while string columns are converted in memory.
+        '''
+        paths = sorted(glob.glob(os.path.join(directory, '*.npy')))
+        if not paths:
+            raise RuntimeError(f"No .npy column files found in '{directory}'")
+        columns = {
+            os.path.splitext(os.path.basename(path))[0]: np.load(path, mmap_mode='r')
+            for path in paths
+        }
+        return self.register(name, pd.DataFrame(columns, copy=False), copy=False)
+
+    def load(self, name: str, path: str, dtypes: dict[str, str] | None = None) -> RegisteredDataset:
+        '''
+        Load a directory of memory-mapped columns or a CSV file, depending on the path.
+        '''
+        if os.path.isdir(path):
+            return self.load_columns(name, path)
+        return self.load_csv(name, path, dtypes)
+
+    def get(self, name: str) -> RegisteredDataset:
+        dataset = self._datasets.get(name)
+        if dataset is None:
+            raise DatasetNotFoundError(name)
+        return dataset
+
+    def names(self) -> list[str]:
+        return sorted(self._datasets)
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((perf_counter() - start) * 1000, 3)
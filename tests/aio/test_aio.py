@@ -0,0 +1,111 @@
+import time
+import asyncio
+import threading
+import pytest
+import pandas as pd
+
+import src.esql.aio as aio
+from src.esql.aio import AsyncQueryExecutor
+from src.esql.accessor import ESQLAccessor
+from src.esql.parser.parse import get_parsed_query
+from src.esql.execution.execute import execute
+from src.esql.execution.catalog import DatasetCatalog
+from src.esql.execution.aggregates import SumState
+from src.esql.execution.cancellation import CancellationToken, AGGREGATION_CHECK_INTERVAL
+from src.esql.execution.error import QueryCancelledError
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.mark.timeout(10)
+def test_aquery_returns_the_same_result_as_query(sales_test_data: pd.DataFrame):
+    query = "SELECT prod, quant.sum, quant.max ORDER BY 1"
+    result = asyncio.run(sales_test_data.esql.aquery(query))
+    pd.testing.assert_frame_equal(result, sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_aquery_batch_returns_results_in_query_order(sales_test_data: pd.DataFrame):
+    queries = ["SELECT prod, quant.sum ORDER BY 1", "SELECT state, quant.count ORDER BY 1", "SELECT nope"]
+    results = asyncio.run(sales_test_data.esql.aquery_batch(queries, return_exceptions=True))
+    pd.testing.assert_frame_equal(results[0], sales_test_data.esql.query(queries[0]))
+    pd.testing.assert_frame_equal(results[1], sales_test_data.esql.query(queries[1]))
+    assert isinstance(results[2], Exception)
+
+@pytest.mark.timeout(10)
+def test_executor_normalizes_the_dtypes_of_the_data(sales_test_data: pd.DataFrame):
+    raw_data = pd.read_csv('public/data/sales.csv')
+    queries = ["SELECT cust, quant.sum WHERE date > '2018-01-01' ORDER BY 1", "SELECT prod, quant.max WHERE state = 'NY' ORDER BY 1"]
+    executor = AsyncQueryExecutor()
+    result = asyncio.run(executor.query(raw_data, queries[0]))
+    results = asyncio.run(executor.query_batch(raw_data, queries))
+    executor.shutdown()
+    pd.testing.assert_frame_equal(result, sales_test_data.esql.query(queries[0]))
+    for query, batch_result in zip(queries, results):
+        pd.testing.assert_frame_equal(batch_result, sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_executor_limits_the_number_of_concurrent_queries(monkeypatch, sales_test_data: pd.DataFrame):
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+    def slow_query(data, query, decimal_places, cancellation_token, catalog=None):
+        nonlocal running, max_running
+        with lock:
+            running += 1
+            max_running = max(max_running, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return pd.DataFrame()
+    monkeypatch.setattr(aio, '_run_query', slow_query)
+
+    executor = AsyncQueryExecutor(max_concurrency=2)
+    asyncio.run(executor.query_batch(sales_test_data, ["SELECT cust"] * 8))
+    executor.shutdown()
+    assert max_running == 2
+
+@pytest.mark.timeout(30)
+def test_timeout_cancels_the_running_scan(monkeypatch, sales_test_data: pd.DataFrame):
+    large_data = pd.concat([sales_test_data] * 50, ignore_index=True)
+    outcome = {}
+    run_query = aio._run_query
+    def recording_query(*args):
+        try:
+            return run_query(*args)
+        except BaseException as error:
+            outcome['error'] = error
+            raise
+    monkeypatch.setattr(aio, '_run_query', recording_query)
+
+    executor = AsyncQueryExecutor(max_concurrency=1)
+    query = "SELECT cust, prod, g1.quant.sum, g2.quant.sum, g3.quant.sum OVER g1, g2, g3 SUCH THAT g1.month = 1, g2.month = 2, g3.month = 3"
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(executor.query(large_data, query, timeout=0.05))
+    executor.shutdown(wait=True)
+    assert isinstance(outcome.get('error'), QueryCancelledError)
+
+@pytest.mark.timeout(30)
+def test_cancellation_stops_the_aggregation_passes(monkeypatch, sales_test_data: pd.DataFrame):
+    large_data = pd.concat([sales_test_data] * 30, ignore_index=True)
+    assert len(large_data) > AGGREGATION_CHECK_INTERVAL
+    cancellation_token = CancellationToken()
+    updated_rows = []
+    update = SumState.update
+    def cancelling_update(self, group_ids, values, weights=None):
+        updated_rows.append(len(group_ids))
+        cancellation_token.cancel()
+        update(self, group_ids, values, weights)
+    monkeypatch.setattr(SumState, 'update', cancelling_update)
+
+    query = "SELECT cust, prod, quant.sum, g1.quant.sum, g2.quant.sum OVER g1, g2 SUCH THAT g1.month = 1, g2.month = 2"
+    with pytest.raises(QueryCancelledError):
+        execute(get_parsed_query(large_data, query), 2, cancellation_token, DatasetCatalog(large_data))
+    assert updated_rows == [AGGREGATION_CHECK_INTERVAL]
+
+def test_executor_rejects_non_positive_concurrency():
+    with pytest.raises(ValueError):
+        AsyncQueryExecutor(max_concurrency=0)
+
+
+
+if __name__ == '__main__':
+    pytest.main()
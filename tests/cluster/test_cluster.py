@@ -0,0 +1,134 @@
+import sys
+import json
+import socket
+import threading
+import subprocess
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.cluster.coordinator import Coordinator
+from src.esql.cluster.worker import ShardWorker
+from src.esql.cluster.error import WorkerError
+from src.esql.cluster.protocol import parse_address, send_message, receive_message, encode_plan, decode_plan
+from src.esql import partial
+from src.esql.parser.error import ParsingError
+from src.esql.parser.parse import get_parsed_query
+from src.esql.server.registry import DatasetRegistry
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.fixture
+def worker_processes(tmp_path):
+    data = pd.read_csv('public/data/sales.csv')
+    processes = []
+    addresses = []
+    try:
+        for number, rows in enumerate(np.array_split(np.arange(len(data)), 3)):
+            path = tmp_path / f"sales-{number}.csv"
+            data.iloc[rows].to_csv(path, index=False)
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'src.esql', 'worker', '--listen', '127.0.0.1:0', '--dataset', f"sales={path}"],
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            processes.append(process)
+            for line in process.stderr:
+                if line.startswith('Worker listening on '):
+                    addresses.append(line.removeprefix('Worker listening on ').strip())
+                    break
+        yield addresses
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+@pytest.fixture
+def worker(sales_test_data: pd.DataFrame):
+    registry = DatasetRegistry()
+    registry.register('sales', sales_test_data)
+    shard_worker = ShardWorker(('127.0.0.1', 0), registry)
+    thread = threading.Thread(target=shard_worker.serve_forever, daemon=True)
+    thread.start()
+    yield shard_worker
+    shard_worker.shutdown()
+    shard_worker.server_close()
+
+def _mapped_file(array: np.ndarray) -> str | None:
+    # The file of the memory map that holds the array, if any. Copies of a memmap have no file.
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array.filename if array is not None else None
+
+
+@pytest.mark.timeout(60)
+def test_query_over_worker_processes_matches_the_whole_dataset(worker_processes: list[str], sales_test_data: pd.DataFrame):
+    assert len(worker_processes) == 3
+    coordinator = Coordinator(worker_processes)
+    for query in [
+        "SELECT cust, prod, quant.sum, quant.avg, quant.max, state.count_distinct HAVING quant.sum > 1000 ORDER BY 2",
+        "SELECT prod, x.quant.count, y.quant.avg OVER x, y WHERE year = 2018 SUCH THAT x.state = 'NY', y.quant > 500 ORDER BY 1"
+    ]:
+        pd.testing.assert_frame_equal(coordinator.query('sales', query), sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_coordinator_reports_errors_of_workers(worker: ShardWorker):
+    coordinator = Coordinator([worker.address])
+    assert coordinator.describe('sales')['quant'] == 'int64'
+    with pytest.raises(WorkerError):
+        coordinator.query('missing', "SELECT cust, quant.sum")
+    with pytest.raises(ParsingError):
+        coordinator.query('sales', "SELECT nope")
+    with pytest.raises(WorkerError):
+        Coordinator([('127.0.0.1', 1)], timeout=1).query('sales', "SELECT cust, quant.sum")
+
+@pytest.mark.timeout(10)
+def test_coordinator_caches_the_schema_and_sends_the_plan(worker: ShardWorker, sales_test_data: pd.DataFrame, monkeypatch):
+    request_types = []
+    handle_request_message = worker.handle_request_message
+    def record(header: dict) -> tuple[dict, bytes]:
+        request_types.append(header.get('type'))
+        return handle_request_message(header)
+    monkeypatch.setattr(worker, 'handle_request_message', record)
+    monkeypatch.setattr(partial, 'get_parsed_query', lambda data, query: pytest.fail("The worker parsed the query"))
+
+    coordinator = Coordinator([worker.address])
+    queries = ["SELECT cust, quant.sum WHERE date > '2018-03-01' and not state = 'NY' ORDER BY 1", "SELECT prod, x.quant.avg OVER x SUCH THAT x.credit = true or x.quant < 100"]
+    for query in queries:
+        pd.testing.assert_frame_equal(coordinator.query('sales', query), sales_test_data.esql.query(query))
+    assert request_types == ['describe', 'partial_aggregate', 'partial_aggregate']
+
+def test_plans_keep_dates_and_logical_operators(sales_test_data: pd.DataFrame):
+    parsed_query = get_parsed_query(sales_test_data, "SELECT cust, x.quant.sum OVER x WHERE date > '2018-03-01' and not (state = 'NY' or quant < 3.5) SUCH THAT x.credit = true HAVING quant.sum > 10 ORDER BY -1")
+    plan = encode_plan(parsed_query)
+    assert decode_plan(json.loads(json.dumps(plan))) == {**parsed_query, 'data': None}
+
+@pytest.mark.timeout(10)
+def test_worker_answers_malformed_requests(worker: ShardWorker):
+    with socket.create_connection(worker.address, timeout=5) as connection:
+        send_message(connection, {'type': 'partial_aggregate', 'dataset': 'sales'})
+        header, payload = receive_message(connection)
+        assert header['status'] == 'error' and 'KeyError' in header['message'] and payload == b''
+        send_message(connection, {'type': 'describe', 'dataset': 'sales'})
+        header, _ = receive_message(connection)
+        assert header['status'] == 'ok'
+
+def test_registry_memory_maps_column_files(tmp_path, sales_test_data: pd.DataFrame):
+    for column in ['cust', 'quant']:
+        np.save(tmp_path / f"{column}.npy", sales_test_data[column].to_numpy().astype(str if column == 'cust' else np.int64))
+    dataset = DatasetRegistry().load('sales', str(tmp_path))
+    assert _mapped_file(dataset.data['quant'].to_numpy()) == str(tmp_path / "quant.npy")
+    assert _mapped_file(dataset.catalog.encoded_table.columns['quant']) == str(tmp_path / "quant.npy")
+    query = "SELECT cust, quant.sum ORDER BY 1"
+    pd.testing.assert_frame_equal(dataset.query(query, 2)['result'], sales_test_data.esql.query(query))
+
+def test_parse_address():
+    assert parse_address('10.0.0.1:7500') == ('10.0.0.1', 7500)
+    assert parse_address('worker-1') == ('worker-1', 7400)
+    with pytest.raises(ValueError):
+        parse_address('worker-1:port')
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.correlation import split_emf_conditions, correlate
+from src.esql.parser.types import LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+def _emf(column: str, attribute: str, offset: int = 0) -> dict:
+    return {'group': 'x', 'column': column, 'operator': '=', 'value': {'attribute': attribute, 'offset': offset}, 'is_emf': True}
+
+
+def test_split_emf_conditions_separates_the_rest_of_the_section():
+    local = {'group': 'x', 'column': 'quant', 'operator': '>', 'value': 10, 'is_emf': False}
+    section = {'operator': LogicalOperator.AND, 'conditions': [_emf('cust', 'cust'), {'operator': LogicalOperator.AND, 'conditions': [_emf('month', 'month', -1), local]}]}
+    emf_conditions, local_condition = split_emf_conditions(section)
+    assert emf_conditions == [_emf('cust', 'cust'), _emf('month', 'month', -1)]
+    assert local_condition == local
+    assert split_emf_conditions(local) == ([], local)
+
+def test_rows_and_groups_with_equal_keys_match():
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'cust': ['Dan', 'Dan', 'Sam', 'Sam', None, 'Dan'] * 2,
+        'month': [1, 2, 1, 3, 2, 3] * 2
+    }))
+    encoded_table = EncodedTable(data)
+    row_ids = np.arange(6)
+    group_row_ids = np.array([0, 1, 2, 3, 4, 5])
+    row_keys, group_keys, _ = correlate(encoded_table, [_emf('cust', 'cust'), _emf('month', 'month', -1)], row_ids, group_row_ids)
+    # Group (Dan, 2) matches the row (Dan, 1), group (Dan, 3) the row (Dan, 2).
+    assert group_keys[1] == row_keys[0] and group_keys[5] == row_keys[1]
+    assert group_keys[3] not in row_keys[[0, 1, 2, 5]]
+    assert row_keys[4] == -1 and group_keys[4] == -1
+
+@pytest.mark.timeout(10)
+def test_emf_queries_compare_each_group_with_other_groups(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT cust, month, x.quant.avg, quant.avg, y.quant.count OVER x, y "
+        "SUCH THAT x.cust = cust and x.month = month - 1, y.cust = cust and y.month > 6 and y.year = 2017 ORDER BY 2"
+    )
+    averages = sales_test_data.groupby(['cust', 'month'])['quant'].mean()
+    counts = sales_test_data[(sales_test_data['month'] > 6) & (sales_test_data['year'] == 2017)].groupby('cust')['quant'].count()
+    assert len(result) == len(averages)
+    for row in result.itertuples(index=False):
+        previous_average = averages.get((row.cust, row.month - 1))
+        if previous_average is None:
+            assert pd.isna(row[2])
+        else:
+            assert row[2] == pytest.approx(previous_average, abs=0.01)
+        assert row[3] == pytest.approx(averages[(row.cust, row.month)], abs=0.01)
+        assert row[4] == counts.get(row.cust)
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,110 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.encoding import EncodedTable, MISSING_VALUE_CODE, MISSING_DAY
+from src.esql.parser.types import SimpleCondition, CompoundCondition, LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+def test_low_cardinality_string_columns_are_encoded_with_sorted_dictionaries():
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'state': ['NY', 'CT', 'NY', 'NJ', 'CT', 'NY'],
+        'id': ['a', 'b', 'c', 'd', 'e', 'f'],
+        'quant': [1, 2, 3, 4, 5, 6]
+    }))
+    table = EncodedTable(data)
+    assert list(table.dictionaries['state']) == ['CT', 'NJ', 'NY']
+    assert table.columns['state'].tolist() == [2, 0, 2, 1, 0, 2]
+    assert not table.is_encoded('id')
+    assert not table.is_encoded('quant')
+
+def test_categorical_columns_are_kept_and_encoded_in_sorted_order():
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'prod': pd.Categorical(['Ham', 'Apple', None, 'Ham'], categories=['Ham', 'Apple', 'Zucchini'])
+    }))
+    assert isinstance(data['prod'].dtype, pd.CategoricalDtype)
+    table = EncodedTable(data)
+    assert list(table.dictionaries['prod']) == ['Apple', 'Ham', 'Zucchini']
+    assert table.columns['prod'].tolist() == [1, 0, -1, 1]
+    assert table.rows() == [[1], [0], [None], [1]]
+    assert table.decode('prod', np.array([0, 2, -1])).tolist() == ['Apple', 'Zucchini', None]
+
+def test_encode_condition_replaces_string_values_with_codes():
+    data = _enforce_allowed_dtypes(pd.DataFrame({'state': ['NY', 'CT', 'NY', 'NJ'] * 3, 'quant': range(12)}))
+    table = EncodedTable(data)
+    condition = CompoundCondition(
+        operator=LogicalOperator.AND,
+        conditions=[
+            SimpleCondition(column='state', operator='=', value='NY', is_emf=False),
+            SimpleCondition(column='state', operator='!=', value='PA', is_emf=False),
+            SimpleCondition(column='quant', operator='>', value=1, is_emf=False)
+        ]
+    )
+    encoded = table.encode_condition(condition)
+    assert encoded['conditions'][0]['value'] == 2
+    assert encoded['conditions'][1]['value'] == MISSING_VALUE_CODE
+    assert encoded['conditions'][2] == condition['conditions'][2]
+    assert condition['conditions'][0]['value'] == 'NY'
+
+def test_date_columns_are_stored_as_day_numbers():
+    data = _enforce_allowed_dtypes(pd.DataFrame({'date': ['2020-01-02', '1970-01-01', None, '2019-12-31']}))
+    table = EncodedTable(data)
+    assert table.columns['date'].tolist() == [18263, 0, MISSING_DAY, 18261]
+    assert table.is_valid('date').tolist() == [True, True, False, True]
+    condition = SimpleCondition(column='date', operator='>=', value=date(2020, 1, 1), is_emf=False)
+    assert table.encode_condition(condition)['value'] == 18262
+    assert table.decode_days(np.array([18263, MISSING_DAY])).tolist() == [date(2020, 1, 2), None]
+
+@pytest.mark.timeout(5)
+def test_date_queries_return_dates(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query("SELECT date, quant.sum WHERE date >= '2020-06-01' and date < '2020-07-01' ORDER BY 1")
+    expected = sales_test_data[(sales_test_data['date'] >= date(2020, 6, 1)) & (sales_test_data['date'] < date(2020, 7, 1))].groupby('date')['quant'].sum()
+    assert result['date'].tolist() == expected.index.tolist()
+    assert all(type(value) is date for value in result['date'])
+    assert result['quant.sum'].tolist() == expected.tolist()
+
+def test_nullable_columns_keep_their_missing_values_in_a_validity_mask():
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'quant': pd.array([0, None, 5], dtype='Int64'),
+        'credit': pd.array([True, None, False], dtype='boolean')
+    }))
+    table = EncodedTable(data)
+    assert table.columns['quant'].dtype == np.int64 and table.columns['credit'].dtype == bool
+    assert table.is_valid('quant').tolist() == [True, False, True]
+    assert table.rows() == [[0, True], [None, None], [5, False]]
+
+@pytest.mark.timeout(5)
+def test_aggregates_skip_missing_values_of_nullable_columns():
+    data = pd.DataFrame({
+        'prod': pd.array([0, 0, None, 1, None, 1, 0], dtype='Int64'),
+        'quant': pd.array([0, None, 5, 2, 0, None, 3], dtype='Int64')
+    })
+    result = data.esql.query("SELECT prod, quant.count, quant.sum, quant.min, quant.avg WHERE quant >= 0 ORDER BY 1")
+    assert result['quant.count'].tolist() == [2, 1, 2]
+    assert result['quant.sum'].tolist() == [3, 2, 5]
+    assert result['quant.min'].tolist() == [0, 2, 0]
+    assert result['quant.avg'].tolist() == [1.5, 2.0, 2.5]
+    assert result['prod'].tolist()[:2] == [0, 1] and pd.isna(result['prod'].tolist()[2])
+
+@pytest.mark.timeout(5)
+def test_query_results_are_decoded_and_ordered_by_string_value(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query("SELECT prod, state, quant.count WHERE state = 'NY' ORDER BY 1")
+    assert result['prod'].tolist() == sorted(sales_test_data['prod'].unique())
+    assert set(result['state']) == {'NY'}
+
+@pytest.mark.timeout(5)
+def test_categorical_and_string_inputs_return_the_same_result(sales_test_data: pd.DataFrame):
+    categorical_data = sales_test_data.astype({'cust': 'category', 'prod': 'category', 'state': 'category'})
+    query = "SELECT cust, prod, x.quant.sum OVER x SUCH THAT x.state = 'NJ' ORDER BY 2"
+    pd.testing.assert_frame_equal(
+        categorical_data.esql.query(query),
+        sales_test_data.esql.query(query)
+    )
+
+
+
+if __name__ == '__main__':
+    pytest.main()
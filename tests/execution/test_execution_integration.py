@@ -7,6 +7,8 @@ from datetime import date
 from dotenv import load_dotenv
 
 from src.esql.accessor import ESQLAccessor, _enforce_allowed_dtypes
+from src.esql.execution import algorithms
+from src.esql.execution.aggregates import aggregate_key
 from tests.parser.test_parse import sales_test_data
 
 
@@ -308,6 +310,34 @@ def test_mf_query_with_having(sales_test_data: pd.DataFrame):
 
 
 
+@pytest.mark.timeout(5)
+def test_having_clause_is_evaluated_before_the_other_aggregates(sales_test_data: pd.DataFrame, monkeypatch):
+    updated_row_counts = {}
+    update_aggregate_states = algorithms._update_aggregate_states
+    def record(aggregate_states, aggregates, row_ids, group_ids, encoded_table, weights=None, cancellation_token=None):
+        for aggregate in aggregates:
+            updated_row_counts[aggregate_key(aggregate)] = len(row_ids)
+        return update_aggregate_states(aggregate_states, aggregates, row_ids, group_ids, encoded_table, weights, cancellation_token)
+    monkeypatch.setattr(algorithms, '_update_aggregate_states', record)
+
+    result = sales_test_data.esql.query(
+        "SELECT cust, prod, quant.sum, nj.quant.max OVER nj, ny SUCH THAT nj.state = 'NJ', ny.state = 'NY' and ny.quant > quant.avg "
+        "HAVING ny.quant.count > 9 ORDER BY 2"
+    )
+    expected = []
+    for (cust, prod), data in sales_test_data.groupby(['cust', 'prod']):
+        new_york = data[(data['state'] == 'NY') & (data['quant'] > data['quant'].mean())]
+        if len(new_york) > 9:
+            expected.append((cust, prod, data['quant'].sum(), data[data['state'] == 'NJ']['quant'].max()))
+    assert 0 < len(result) < sales_test_data.groupby(['cust', 'prod']).ngroups
+    assert set(map(_normalize_tuple, result.itertuples(index=False))) == set(map(_normalize_tuple, expected))
+
+    surviving_rows = sales_test_data.set_index(['cust', 'prod']).index.isin(list(zip(result['cust'], result['prod']))).sum()
+    assert updated_row_counts['quant.avg'] == len(sales_test_data)
+    assert updated_row_counts['quant.sum'] == surviving_rows
+    assert updated_row_counts['nj.quant.max'] <= surviving_rows
+
+
 
 if __name__ == '__main__':
     pytest.main()
\ No newline at end of file
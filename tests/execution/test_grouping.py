@@ -0,0 +1,202 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+import src.esql.execution.grouping as grouping
+import src.esql.execution.aggregates as aggregates
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.grouping import compute_group_ids
+from src.esql.execution.aggregates import create_aggregate_state
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.fixture
+def encoded_table() -> EncodedTable:
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'cust': ['Dan', 'Boo', 'Dan', 'Dan', 'Boo', 'Sam'] * 2,
+        'year': [2017, 2017, 2018, 2017, 2017, 2018] * 2,
+        'quant': [1.5, 2.0, np.nan, 4.0, 5.0, 6.0] * 2
+    }))
+    return EncodedTable(data)
+
+
+def test_group_ids_are_dense_and_in_order_of_first_appearance(encoded_table: EncodedTable):
+    group_ids, number_of_groups = compute_group_ids(encoded_table, ['cust', 'year'])
+    assert number_of_groups == 4
+    assert group_ids.tolist() == [0, 1, 2, 0, 1, 3] * 2
+
+def test_group_ids_fall_back_to_hashing_when_the_packed_key_would_overflow(monkeypatch, encoded_table: EncodedTable):
+    expected_group_ids, expected_number_of_groups = compute_group_ids(encoded_table, ['cust', 'year', 'quant'])
+    monkeypatch.setattr(grouping, 'MAX_PACKED_KEY', 5)
+    group_ids, number_of_groups = compute_group_ids(encoded_table, ['cust', 'year', 'quant'])
+    assert number_of_groups == expected_number_of_groups
+    assert group_ids.tolist() == expected_group_ids.tolist()
+
+def test_aggregate_states_update_by_group_id():
+    group_ids = np.array([0, 1, 0, 2, 1])
+    values = np.array([3, 5, 7, 1, 2])
+    expected = {
+        'sum': [10, 7, 1],
+        'count': [2, 2, 1],
+        'min': [3, 2, 1],
+        'max': [7, 5, 1],
+        'avg': [5.0, 3.5, 1.0]
+    }
+    for function, expected_values in expected.items():
+        state = create_aggregate_state(function, number_of_groups=4, dtype=values.dtype)
+        state.update(group_ids, values)
+        result, has_value = state.finalize()
+        assert result[:3].tolist() == expected_values
+        assert has_value.tolist() == [True, True, True, False]
+    integer_sum, _ = create_aggregate_state('sum', 1, values.dtype).finalize()
+    assert integer_sum.dtype == np.int64
+
+def test_variance_states_merge_partitions_exactly():
+    random = np.random.default_rng(3)
+    group_ids = random.integers(0, 3, 3000)
+    # Values far from zero lose all their precision in a naive sum of squares.
+    values = 1e9 + random.normal(0, 1, 3000)
+    expected = pd.Series(values).groupby(group_ids)
+    for function, ddof, square_root in [('var', 1, False), ('stddev', 1, True), ('var_pop', 0, False), ('stddev_pop', 0, True)]:
+        state = create_aggregate_state(function, number_of_groups=4, dtype=values.dtype)
+        other_state = create_aggregate_state(function, number_of_groups=4, dtype=values.dtype)
+        state.update(group_ids[:1000], values[:1000])
+        state.update(group_ids[1000:1700], values[1000:1700])
+        other_state.update(group_ids[1700:], values[1700:])
+        state.merge(other_state)
+        result, has_value = state.finalize()
+        expected_values = expected.std(ddof=ddof) if square_root else expected.var(ddof=ddof)
+        assert result[:3].tolist() == pytest.approx(expected_values.tolist(), rel=1e-6)
+        assert has_value.tolist() == [True, True, True, False]
+
+def test_sample_variances_need_two_values():
+    state = create_aggregate_state('var', number_of_groups=2, dtype=np.dtype(np.float64))
+    state.update(np.array([0, 1, 1]), np.array([4.0, 1.0, 3.0]))
+    result, has_value = state.finalize()
+    assert has_value.tolist() == [False, True]
+    assert result[1] == 2.0
+
+def test_distinct_count_states_merge_across_chunks():
+    group_ids = np.arange(20000) % 2
+    values = np.arange(20000) % 3000
+    for function in ['count_distinct', 'approx_count_distinct']:
+        chunk_values = values.astype(np.uint64) if function == 'approx_count_distinct' else values
+        state = create_aggregate_state(function, number_of_groups=3, dtype=chunk_values.dtype)
+        other_state = create_aggregate_state(function, number_of_groups=3, dtype=chunk_values.dtype)
+        state.update(group_ids[:12000], chunk_values[:12000])
+        other_state.update(group_ids[12000:], chunk_values[12000:])
+        state.merge(other_state)
+        result, has_value = state.finalize()
+        assert result[:2].tolist() == pytest.approx([1500, 1500], rel=0.05 if function == 'approx_count_distinct' else 0)
+        assert result[2] == 0 and has_value.tolist() == [True, True, False]
+
+def test_hyperloglog_sketches_lower_their_precision_to_bound_memory():
+    state = create_aggregate_state('approx_count_distinct', number_of_groups=1 << 20, dtype=np.dtype(np.uint64))
+    assert state.registers.nbytes <= aggregates.HLL_MAX_REGISTERS
+    assert state.precision == 6
+
+def test_hyperloglog_sketches_warn_when_the_register_budget_cannot_be_met(monkeypatch):
+    monkeypatch.setattr(aggregates, 'HLL_MAX_REGISTERS', 1 << 12)
+    with pytest.warns(RuntimeWarning, match="HLL_MAX_REGISTERS"):
+        state = create_aggregate_state('approx_count_distinct', number_of_groups=1 << 10, dtype=np.dtype(np.uint64))
+    assert state.precision == aggregates.HLL_MIN_PRECISION
+    assert state.registers.shape == (1 << 10, 1 << aggregates.HLL_MIN_PRECISION)
+    state.update(np.arange(1 << 10).repeat(3), np.arange(3 << 10, dtype=np.uint64))
+    result, has_value = state.finalize()
+    assert has_value.all() and result.mean() == pytest.approx(3, rel=0.1)
+
+def test_exact_percentiles_interpolate_like_numpy(monkeypatch):
+    random = np.random.default_rng(1)
+    group_ids = random.integers(0, 50, 5000)
+    values = random.normal(100, 20, 5000)
+    expected = pd.Series(values).groupby(group_ids).quantile(0.95).to_numpy()
+    for partition_max_groups in [1024, 0]:
+        monkeypatch.setattr(aggregates, 'PARTITION_MAX_GROUPS', partition_max_groups)
+        state = create_aggregate_state('p95', number_of_groups=51, dtype=values.dtype)
+        state.update(group_ids, values)
+        result, has_value = state.finalize()
+        assert result[:50].tolist() == pytest.approx(expected.tolist())
+        assert not has_value[50]
+
+def test_t_digests_merge_across_chunks():
+    random = np.random.default_rng(2)
+    group_ids = np.repeat([0, 1], 50000)
+    values = np.concatenate([random.exponential(10, 50000), random.normal(0, 1, 50000)])
+    order = random.permutation(len(values))
+    group_ids, values = group_ids[order], values[order]
+    for function, quantile in [('approx_median', 0.5), ('approx_p1', 0.01), ('approx_p99', 0.99)]:
+        state = create_aggregate_state(function, number_of_groups=2, dtype=values.dtype)
+        other_state = create_aggregate_state(function, number_of_groups=2, dtype=values.dtype)
+        state.update(group_ids[:30000], values[:30000])
+        other_state.update(group_ids[30000:], values[30000:])
+        state.merge(other_state)
+        assert np.bincount(state.group_ids).max() <= aggregates.TDIGEST_COMPRESSION + 1
+        result, _ = state.finalize()
+        for group_id in [0, 1]:
+            group_values = values[group_ids == group_id]
+            # The error is bounded in rank, so it is checked against the neighbouring quantiles.
+            lower, upper = np.quantile(group_values, [max(quantile - 0.005, 0), min(quantile + 0.005, 1)])
+            assert lower <= result[group_id] <= upper
+
+def test_small_t_digests_are_exact():
+    values = np.array([5.0, 1.0, 4.0, 2.0, 3.0])
+    state = create_aggregate_state('approx_p30', number_of_groups=1, dtype=values.dtype)
+    state.update(np.zeros(5, dtype=np.int64), values)
+    assert state.finalize()[0][0] == pytest.approx(np.quantile(values, 0.3))
+
+@pytest.mark.timeout(5)
+def test_percentile_queries(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT prod, quant.median, quant.approx_p90, ny.quant.p25 OVER ny SUCH THAT ny.state = 'NY' HAVING quant.median > 480 ORDER BY 1",
+        decimal_places=4
+    )
+    expected = sales_test_data.groupby('prod')['quant'].agg(['median', lambda quant: quant.quantile(0.9)])
+    expected['ny'] = sales_test_data[sales_test_data['state'] == 'NY'].groupby('prod')['quant'].quantile(0.25)
+    expected = expected[expected['median'] > 480].sort_index()
+    assert result['prod'].tolist() == expected.index.tolist()
+    assert result['quant.median'].tolist() == pytest.approx(expected['median'].tolist())
+    assert result['ny.quant.p25'].tolist() == pytest.approx(expected['ny'].tolist())
+    assert result['quant.approx_p90'].tolist() == pytest.approx(expected.iloc[:, 1].tolist(), rel=0.02)
+
+@pytest.mark.timeout(5)
+def test_variance_queries(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT prod, quant.var, quant.stddev_pop, nj.quant.stddev OVER nj SUCH THAT nj.state = 'NJ' ORDER BY 1",
+        decimal_places=4
+    )
+    quantities = sales_test_data.groupby('prod')['quant']
+    assert result['quant.var'].tolist() == pytest.approx(quantities.var().sort_index().tolist())
+    assert result['quant.stddev_pop'].tolist() == pytest.approx(quantities.std(ddof=0).sort_index().tolist())
+    expected = sales_test_data[sales_test_data['state'] == 'NJ'].groupby('prod')['quant'].std().sort_index()
+    assert result['nj.quant.stddev'].tolist() == pytest.approx(expected.tolist())
+
+@pytest.mark.timeout(5)
+def test_count_distinct_queries(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT prod, cust.count_distinct, date.approx_count_distinct, nj.quant.count_distinct OVER nj SUCH THAT nj.state = 'NJ' "
+        "HAVING nj.quant.count_distinct > 200 ORDER BY 1"
+    )
+    expected = sales_test_data.groupby('prod').agg({'cust': 'nunique', 'date': 'nunique'})
+    expected['nj'] = sales_test_data[sales_test_data['state'] == 'NJ'].groupby('prod')['quant'].nunique()
+    expected = expected[expected['nj'] > 200].sort_index()
+    assert result['prod'].tolist() == expected.index.tolist()
+    assert result['cust.count_distinct'].tolist() == expected['cust'].tolist()
+    assert result['nj.quant.count_distinct'].tolist() == expected['nj'].tolist()
+    assert result['date.approx_count_distinct'].tolist() == pytest.approx(expected['date'].tolist(), rel=0.05)
+
+@pytest.mark.timeout(5)
+def test_aggregates_shared_by_select_and_having_are_computed_once(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query("SELECT prod, quant.sum HAVING quant.sum > 0 ORDER BY 1")
+    expected = sales_test_data.groupby('prod')['quant'].sum().sort_index()
+    assert result['quant.sum'].tolist() == expected.tolist()
+
+@pytest.mark.timeout(5)
+def test_where_clause_can_use_the_first_column(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query("SELECT cust, quant.max WHERE cust = 'Dan'")
+    assert result.to_dict('records') == [{'cust': 'Dan', 'quant.max': sales_test_data[sales_test_data['cust'] == 'Dan']['quant'].max()}]
+
+
+
+if __name__ == '__main__':
+    pytest.main()
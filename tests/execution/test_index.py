@@ -0,0 +1,71 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+import src.esql.execution.algorithms as algorithms
+from src.esql.execution.index import InvertedIndex, find_posting_list
+from src.esql.execution.error import RuntimeError
+from src.esql.parser.types import LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+def test_inverted_index_returns_sorted_posting_lists():
+    index = InvertedIndex(np.array([3, 1, 3, 2, 1, 3]))
+    assert len(index) == 3
+    assert index.lookup(3).tolist() == [0, 2, 5]
+    assert index.lookup(1).tolist() == [1, 4]
+    assert index.lookup(7).tolist() == []
+
+def test_posting_lists_are_combined_for_or_and_and():
+    indexes = {
+        'a': InvertedIndex(np.array([1, 2, 1, 2, 1])),
+        'b': InvertedIndex(np.array([5, 5, 6, 6, 5]))
+    }
+    a_equals_1 = {'column': 'a', 'operator': '=', 'value': 1, 'is_emf': False}
+    a_equals_2 = {'column': 'a', 'operator': '=', 'value': 2, 'is_emf': False}
+    b_equals_5 = {'column': 'b', 'operator': '=', 'value': 5, 'is_emf': False}
+    b_greater_than_5 = {'column': 'b', 'operator': '>', 'value': 5, 'is_emf': False}
+
+    row_ids, exact = find_posting_list({'operator': LogicalOperator.OR, 'conditions': [a_equals_1, a_equals_2]}, indexes)
+    assert row_ids.tolist() == [0, 1, 2, 3, 4] and exact
+
+    row_ids, exact = find_posting_list({'operator': LogicalOperator.AND, 'conditions': [a_equals_1, b_equals_5]}, indexes)
+    assert row_ids.tolist() == [0, 4] and exact
+
+    row_ids, exact = find_posting_list({'operator': LogicalOperator.AND, 'conditions': [a_equals_1, b_greater_than_5]}, indexes)
+    assert row_ids.tolist() == [0, 2, 4] and not exact
+
+    assert find_posting_list({'operator': LogicalOperator.OR, 'conditions': [a_equals_1, b_greater_than_5]}, indexes) is None
+    assert find_posting_list({'operator': LogicalOperator.NOT, 'condition': a_equals_1}, indexes) is None
+    assert find_posting_list(a_equals_1, {}) is None
+
+@pytest.mark.timeout(10)
+def test_indexed_queries_return_the_same_results(sales_test_data: pd.DataFrame):
+    queries = [
+        "SELECT cust, quant.sum WHERE state = 'NY' ORDER BY 1",
+        "SELECT prod, quant.max WHERE state = 'NY' or state = 'NJ' ORDER BY 1",
+        "SELECT cust, quant.avg WHERE state = 'NY' and quant > 500 ORDER BY 1",
+        "SELECT cust, quant.avg WHERE state = 'XX' ORDER BY 1",
+        "SELECT prod, g1.quant.sum, g2.quant.count OVER g1, g2 WHERE year = 2017 SUCH THAT g1.state = 'NY', g2.state = 'NJ' and g2.credit = True ORDER BY 1"
+    ]
+    unindexed = pd.DataFrame(sales_test_data.copy())
+    expected = [unindexed.esql.query(query) for query in queries]
+    sales_test_data.esql.create_index('state', 'year', 'credit')
+    for query, expected_result in zip(queries, expected):
+        pd.testing.assert_frame_equal(sales_test_data.esql.query(query), expected_result)
+
+@pytest.mark.timeout(10)
+def test_exact_posting_lists_skip_the_row_scan(monkeypatch, sales_test_data: pd.DataFrame):
+    sales_test_data.esql.create_index('state')
+    monkeypatch.setattr(algorithms, '_evaluate_condition', lambda *args, **kwargs: pytest.fail("rows were scanned"))
+    result = sales_test_data.esql.query("SELECT state, quant.count WHERE state = 'NY'")
+    assert result.to_dict('records') == [{'state': 'NY', 'quant.count': int((sales_test_data['state'] == 'NY').sum())}]
+
+def test_create_index_rejects_unknown_columns(sales_test_data: pd.DataFrame):
+    with pytest.raises(RuntimeError):
+        sales_test_data.esql.create_index('missing')
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,99 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.parser.parse import get_parsed_query
+from src.esql.execution import jit
+from src.esql.execution.execute import execute
+from src.esql.execution.grouping import compute_group_ids
+from src.esql.execution.error import RuntimeError
+from tests.parser.test_parse import sales_test_data
+
+
+KERNEL_QUERIES = [
+    "SELECT cust, quant.sum, quant.avg, x.quant.max, y.quant.count OVER x, y WHERE year = 2018 SUCH THAT x.state = 'NY', y.state = 'NJ' HAVING quant.sum > 10",
+    "SELECT cust, prod, quant.count, quant.min, z.quant.min OVER z WHERE not (state = 'NY' or quant > 500) and date > '2018-03-01' SUCH THAT z.credit = true ORDER BY 2",
+    "SELECT prod, quant.sum, cust.count, x.quant.avg, y.quant.sum OVER x, y WHERE credit = true or quant != 3.5 SUCH THAT x.quant < 200",
+    "SELECT state, quant.sum WHERE cust = 'NOPE'"
+]
+
+
+@pytest.fixture
+def python_kernels(monkeypatch):
+    # Runs the kernels as plain Python functions, so that they are tested without Numba.
+    monkeypatch.setattr(jit, 'numba_available', lambda: True)
+    monkeypatch.setattr(jit, 'compile_kernel', jit.define_kernel)
+
+
+@pytest.mark.timeout(20)
+def test_kernels_return_the_results_of_the_default_engine(sales_test_data: pd.DataFrame, python_kernels):
+    sales_test_data['quant'] = sales_test_data['quant'].astype(float)
+    sales_test_data.loc[::7, 'quant'] = np.nan
+    for query in KERNEL_QUERIES:
+        parsed_query = get_parsed_query(sales_test_data, query)
+        assert jit.can_compile(parsed_query, sales_test_data.esql.catalog.encoded_table)
+        pd.testing.assert_frame_equal(sales_test_data.esql.query(query, engine='jit'), sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_queries_that_differ_in_their_constants_share_a_kernel(sales_test_data: pd.DataFrame):
+    encoded_table = sales_test_data.esql.catalog.encoded_table
+    first = jit.KernelPlan(get_parsed_query(sales_test_data, "SELECT cust, quant.sum WHERE year = 2018 and state = 'NY'"), encoded_table, 10)
+    second = jit.KernelPlan(get_parsed_query(sales_test_data, "SELECT cust, quant.sum WHERE year = 2019 and state = 'NJ'"), encoded_table, 10)
+    third = jit.KernelPlan(get_parsed_query(sales_test_data, "SELECT cust, quant.sum WHERE year = 2019 or state = 'NJ'"), encoded_table, 10)
+    assert first.source == second.source
+    assert first.arguments[2] != second.arguments[2]
+    assert first.source != third.source
+
+@pytest.mark.timeout(20)
+def test_jit_engine_falls_back_to_the_default_engine(sales_test_data: pd.DataFrame, monkeypatch):
+    catalog = sales_test_data.esql.catalog
+    unsupported_query = get_parsed_query(sales_test_data, "SELECT prod, quant.median, x.quant.avg OVER x SUCH THAT x.quant > quant.avg")
+    assert not jit.can_compile(unsupported_query, catalog.encoded_table)
+    assert jit.execute_jit(unsupported_query, 2, catalog) is None
+
+    monkeypatch.setattr(jit, 'numba_available', lambda: False)
+    monkeypatch.setattr(jit, 'compile_kernel', lambda source: pytest.fail("A kernel was compiled without Numba"))
+    query = KERNEL_QUERIES[0]
+    pd.testing.assert_frame_equal(sales_test_data.esql.query(query, engine='jit'), sales_test_data.esql.query(query))
+    with pytest.raises(RuntimeError):
+        execute(get_parsed_query(sales_test_data, query), 2, catalog=catalog, engine='gpu')
+
+@pytest.mark.timeout(20)
+def test_plan_source_runs_as_plain_python(sales_test_data: pd.DataFrame):
+    query = "SELECT cust, prod, quant.sum, quant.min, x.quant.max, y.quant.count OVER x, y WHERE year = 2018 and not month = 3 SUCH THAT x.state = 'NY', y.credit = true"
+    encoded_table = sales_test_data.esql.catalog.encoded_table
+    parsed_query = get_parsed_query(sales_test_data, query)
+    group_ids, number_of_groups = compute_group_ids(encoded_table, parsed_query['select']['grouping_attributes'])
+    plan = jit.KernelPlan(parsed_query, encoded_table, number_of_groups)
+    namespace = {}
+    exec(plan.source, namespace)
+    first_row_ids = np.zeros(number_of_groups, dtype=np.int64)
+    number_of_present_groups = namespace['kernel'](group_ids.astype(np.int64), np.full(number_of_groups, -1, dtype=np.int64), first_row_ids, *plan.arguments)
+
+    expected = sales_test_data.esql.query(query)
+    assert number_of_present_groups == len(expected)
+    first_rows = sales_test_data.iloc[first_row_ids[:number_of_present_groups]]
+    assert first_rows['cust'].tolist() == expected['cust'].tolist()
+    assert first_rows['prod'].tolist() == expected['prod'].tolist()
+    for key, state in plan.aggregate_states.items():
+        values, has_value = state.finalize()
+        values = pd.Series(values[:number_of_present_groups], dtype=object).where(has_value[:number_of_present_groups], None)
+        assert values.tolist() == expected[key].astype(object).where(expected[key].notna(), None).tolist()
+
+@pytest.mark.timeout(120)
+def test_numba_compiles_one_kernel_per_plan_signature(sales_test_data: pd.DataFrame):
+    pytest.importorskip('numba')
+    for query in KERNEL_QUERIES:
+        pd.testing.assert_frame_equal(sales_test_data.esql.query(query, engine='jit'), sales_test_data.esql.query(query))
+    number_of_kernels = len(jit._KERNELS)
+    pd.testing.assert_frame_equal(
+        sales_test_data.esql.query(KERNEL_QUERIES[0].replace('2018', '2019'), engine='jit'),
+        sales_test_data.esql.query(KERNEL_QUERIES[0].replace('2018', '2019'))
+    )
+    assert len(jit._KERNELS) == number_of_kernels
+    source = next(iter(jit._KERNELS))
+    assert jit.compile_kernel(source) is jit._KERNELS[source]
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,72 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.statistics import TableStatistics
+from src.esql.execution.predicates import PredicateCache
+from src.esql.execution.planner import order_condition, estimate_selectivity
+from src.esql.parser.types import LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.fixture
+def encoded_table() -> EncodedTable:
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'state': (['NY'] * 8 + ['NJ'] * 2) * 10,
+        'quant': np.arange(100, dtype=np.float64)
+    }))
+    return EncodedTable(data)
+
+
+def _simple(column: str, operator: str, value) -> dict:
+    return {'column': column, 'operator': operator, 'value': value, 'is_emf': False}
+
+
+def test_selectivity_is_estimated_from_column_statistics(encoded_table: EncodedTable):
+    statistics = TableStatistics(encoded_table)
+    new_york = encoded_table.encode_value('state', 'NY')
+    assert estimate_selectivity(_simple('state', '=', new_york), statistics) == pytest.approx(0.8)
+    assert estimate_selectivity(_simple('state', '!=', new_york), statistics) == pytest.approx(0.2)
+    assert estimate_selectivity(_simple('quant', '<', 10), statistics) == pytest.approx(0.1)
+    not_condition = {'operator': LogicalOperator.NOT, 'condition': _simple('quant', '<', 10)}
+    assert estimate_selectivity(not_condition, statistics) == pytest.approx(0.9)
+
+def test_conjunctions_run_the_most_selective_predicate_first(encoded_table: EncodedTable):
+    statistics = TableStatistics(encoded_table)
+    new_york = _simple('state', '=', encoded_table.encode_value('state', 'NY'))
+    small_quant = _simple('quant', '<', 5)
+    and_condition = order_condition({'operator': LogicalOperator.AND, 'conditions': [new_york, small_quant]}, statistics)
+    assert and_condition['conditions'] == [small_quant, new_york]
+    or_condition = order_condition({'operator': LogicalOperator.OR, 'conditions': [small_quant, new_york]}, statistics)
+    assert or_condition['conditions'] == [new_york, small_quant]
+
+def test_later_predicates_are_only_evaluated_on_surviving_rows(monkeypatch, encoded_table: EncodedTable):
+    predicate_cache = PredicateCache(encoded_table)
+    evaluated_rows = []
+    evaluate_comparison = predicate_cache._evaluate_comparison
+    def record(column, operator, value, row_ids):
+        evaluated_rows.append(100 if row_ids is None else len(row_ids))
+        return evaluate_comparison(column, operator, value, row_ids)
+    monkeypatch.setattr(predicate_cache, '_evaluate_comparison', record)
+
+    new_york = _simple('state', '=', encoded_table.encode_value('state', 'NY'))
+    condition = {'operator': LogicalOperator.AND, 'conditions': [_simple('quant', '<', 5), new_york]}
+    mask = predicate_cache.mask(condition)
+    assert evaluated_rows == [100, 5]
+    assert mask.tolist() == ((encoded_table.columns['quant'] < 5) & (encoded_table.columns['state'] == new_york['value'])).tolist()
+
+@pytest.mark.timeout(10)
+def test_results_do_not_depend_on_the_written_order(sales_test_data: pd.DataFrame):
+    first = sales_test_data.esql.query("SELECT cust, quant.sum WHERE state = 'NY' and quant > 900 or credit = True and year = 2018 ORDER BY 1")
+    second = sales_test_data.esql.query("SELECT cust, quant.sum WHERE year = 2018 and credit = True or quant > 900 and state = 'NY' ORDER BY 1")
+    pd.testing.assert_frame_equal(first, second)
+    data = sales_test_data
+    expected = data[(data['state'] == 'NY') & (data['quant'] > 900) | data['credit'] & (data['year'] == 2018)].groupby('cust')['quant'].sum()
+    assert first.set_index('cust')['quant.sum'].to_dict() == expected.to_dict()
+
+
+
+if __name__ == '__main__':
+    pytest.main()
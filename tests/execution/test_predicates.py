@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.predicates import PredicateCache, predicate_key
+from src.esql.execution.algorithms import _evaluate_condition
+from src.esql.parser.types import LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.fixture
+def encoded_table() -> EncodedTable:
+    data = _enforce_allowed_dtypes(pd.DataFrame({
+        'state': ['NY', 'NJ', None, 'NY', 'CT', 'NJ'] * 2,
+        'year': [2017, 2017, 2018, 2016, 2017, 2018] * 2,
+        'quant': [1.5, np.nan, 3.0, 4.0, 5.0, 6.0] * 2
+    }))
+    return EncodedTable(data)
+
+
+def _simple(column: str, operator: str, value, group: str | None = None) -> dict:
+    condition = {'column': column, 'operator': operator, 'value': value, 'is_emf': False}
+    if group:
+        condition['group'] = group
+    return condition
+
+
+def test_predicate_keys_ignore_the_group_and_operand_order():
+    x_condition = {'operator': LogicalOperator.AND, 'conditions': [_simple('year', '=', 2017, 'x'), _simple('state', '=', 'NJ', 'x')]}
+    y_condition = {'operator': LogicalOperator.AND, 'conditions': [_simple('state', '==', 'NJ', 'y'), _simple('year', '=', 2017, 'y')]}
+    assert predicate_key(x_condition) == predicate_key(y_condition)
+    assert predicate_key(_simple('year', '=', 2017)) != predicate_key(_simple('year', '=', 2017.5))
+    assert predicate_key(_simple('year', '=', 2017)) != predicate_key(_simple('year', '!=', 2017))
+
+def test_each_distinct_predicate_is_evaluated_once(monkeypatch, encoded_table: EncodedTable):
+    predicate_cache = PredicateCache(encoded_table)
+    evaluated = []
+    evaluate_comparison = predicate_cache._evaluate_comparison
+    monkeypatch.setattr(predicate_cache, '_evaluate_comparison', lambda *args: evaluated.append(args) or evaluate_comparison(*args))
+
+    year = encoded_table.columns['year']
+    x_condition = {'operator': LogicalOperator.AND, 'conditions': [_simple('year', '=', 2017, 'x'), _simple('state', '=', 0, 'x')]}
+    y_condition = {'operator': LogicalOperator.AND, 'conditions': [_simple('year', '=', 2017, 'y'), _simple('state', '=', 1, 'y')]}
+    where_condition = _simple('year', '=', 2017)
+    assert predicate_cache.mask(where_condition).tolist() == (year == 2017).tolist()
+    predicate_cache.mask(x_condition)
+    predicate_cache.mask(y_condition)
+    assert len(evaluated) == 3
+
+def test_masks_match_the_row_at_a_time_evaluation(encoded_table: EncodedTable):
+    predicate_cache = PredicateCache(encoded_table)
+    conditions = [
+        _simple('state', '=', encoded_table.encode_value('state', 'NY')),
+        _simple('state', '!=', encoded_table.encode_value('state', 'NY')),
+        _simple('quant', '>', 2.0),
+        _simple('quant', '!=', 4.0),
+        {'operator': LogicalOperator.NOT, 'condition': _simple('quant', '<=', 3.0)},
+        {'operator': LogicalOperator.OR, 'conditions': [_simple('year', '<', 2017), _simple('quant', '>=', 5.0)]}
+    ]
+    rows = encoded_table.rows()
+    for condition in conditions:
+        expected = [_evaluate_condition(condition, row, encoded_table.column_indices) for row in rows]
+        assert predicate_cache.mask(condition).tolist() == expected
+
+@pytest.mark.timeout(10)
+def test_shared_predicates_give_the_same_results(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT cust, x.quant.sum, y.quant.sum OVER x, y WHERE year = 2017 "
+        "SUCH THAT x.year = 2017 and x.state = 'NJ', y.state = 'NY' and y.year = 2017 ORDER BY 1"
+    )
+    data = sales_test_data[sales_test_data['year'] == 2017]
+    for group, state in [('x', 'NJ'), ('y', 'NY')]:
+        expected = data[data['state'] == state].groupby('cust')['quant'].sum()
+        actual = result.set_index('cust')[f'{group}.quant.sum'].dropna()
+        assert actual.astype(int).to_dict() == expected.to_dict()
+
+
+
+if __name__ == '__main__':
+    pytest.main()
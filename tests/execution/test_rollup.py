@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.execution.aggregates import create_aggregate_state
+from src.esql.parser.error import ParsingError, ParsingErrorType
+from tests.parser.test_parse import sales_test_data
+
+
+def test_regrouped_states_equal_states_of_the_coarser_groups():
+    random = np.random.default_rng(7)
+    values = random.integers(0, 1000, 5000)
+    group_ids = random.integers(0, 40, 5000)
+    group_map = np.arange(40) % 3
+    for function in ['count', 'sum', 'avg', 'min', 'max', 'var', 'count_distinct', 'median']:
+        fine_state = create_aggregate_state(function, 40, values.dtype)
+        fine_state.update(group_ids, values)
+        coarse_state = create_aggregate_state(function, 3, values.dtype)
+        coarse_state.update(group_map[group_ids], values)
+        regrouped_values, regrouped_has_value = fine_state.regroup(group_map, 3).finalize()
+        expected_values, expected_has_value = coarse_state.finalize()
+        assert regrouped_values == pytest.approx(expected_values)
+        assert regrouped_has_value.tolist() == expected_has_value.tolist()
+
+@pytest.mark.timeout(10)
+def test_rollup_adds_subtotals_and_a_grand_total(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query("SELECT rollup(cust, prod), quant.sum, quant.avg, quant.max ORDER BY 2")
+    by_cust_prod = sales_test_data.groupby(['cust', 'prod'])['quant']
+    by_cust = sales_test_data.groupby('cust')['quant']
+    assert len(result) == len(by_cust_prod.sum()) + len(by_cust.sum()) + 1
+    for row in result.itertuples(index=False):
+        if row.prod is not None:
+            expected = by_cust_prod.get_group((row.cust, row.prod))
+        elif row.cust is not None:
+            expected = by_cust.get_group(row.cust)
+        else:
+            expected = sales_test_data['quant']
+        assert row[2] == expected.sum()
+        assert row[3] == pytest.approx(expected.mean(), abs=0.01)
+        assert row[4] == expected.max()
+    # Subtotals sort after the groups of their customer, the grand total last.
+    assert result.iloc[-1]['cust'] is None
+    first_customer = result[result['cust'] == result.iloc[0]['cust']]
+    assert first_customer.iloc[-1]['prod'] is None
+
+@pytest.mark.timeout(10)
+def test_cube_with_having_and_grouping_variables(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT year, cube(prod, state), x.quant.count OVER x WHERE month > 6 SUCH THAT x.quant > 500 HAVING x.quant.count > 100"
+    )
+    data = sales_test_data[(sales_test_data['month'] > 6) & (sales_test_data['quant'] > 500)]
+    expected_rows = 0
+    for attributes in [['year', 'prod', 'state'], ['year', 'prod'], ['year', 'state'], ['year']]:
+        counts = data.groupby(attributes)['quant'].count()
+        counts = counts[counts > 100]
+        expected_rows += len(counts)
+        missing = [attribute for attribute in ['prod', 'state'] if attribute not in attributes]
+        rows = result[result[missing].isna().all(axis=1) & result[attributes].notna().all(axis=1)]
+        assert sorted(rows['x.quant.count'].tolist()) == sorted(counts.tolist())
+    assert len(result) == expected_rows
+
+def test_grouping_sets_cannot_be_used_with_emf_conditions(sales_test_data: pd.DataFrame):
+    with pytest.raises(ParsingError) as parsingError:
+        sales_test_data.esql.query("SELECT rollup(cust, month), x.quant.sum OVER x SUCH THAT x.cust = cust")
+    assert parsingError.value.error_type == ParsingErrorType.SUCH_THAT_CLAUSE
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+import pandas as pd
+from beartype.roar import BeartypeCallHintParamViolation
+
+from src.esql import SampleSpec
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.sampling import draw_sample
+from src.esql.execution.aggregates import create_aggregate_state
+from tests.parser.test_parse import sales_test_data
+
+
+def test_weighted_states_scale_up_the_sample():
+    group_ids = np.array([0, 0, 1])
+    values = np.array([2.0, 4.0, 6.0])
+    weights = np.array([10.0, 10.0, 1.0])
+    estimates = {}
+    for function in ['count', 'sum', 'avg']:
+        state = create_aggregate_state(function, number_of_groups=2, dtype=values.dtype, weighted=True)
+        state.update(group_ids, values, weights)
+        estimates[function] = (state.finalize()[0].tolist(), state.standard_errors().tolist())
+    assert estimates['count'] == ([20.0, 1.0], [pytest.approx(np.sqrt(180.0)), 0.0])
+    assert estimates['sum'] == ([60.0, 6.0], [pytest.approx(np.sqrt(90 * 4 + 90 * 16)), 0.0])
+    assert estimates['avg'][0] == [3.0, 6.0]
+    assert estimates['avg'][1][1] == 0.0
+
+def test_stratified_samples_keep_small_groups(sales_test_data: pd.DataFrame):
+    encoded_table = EncodedTable(sales_test_data)
+    _, uniform_weights = draw_sample(encoded_table, SampleSpec(0.01, seed=7), ['cust', 'prod'])
+    row_ids, weights = draw_sample(encoded_table, SampleSpec(0.01, seed=7, stratified=True, min_rows_per_stratum=20), ['cust', 'prod'])
+    assert set(uniform_weights.tolist()) == {100.0}
+    sampled = sales_test_data.iloc[row_ids]
+    assert sampled.groupby(['cust', 'prod']).ngroups == sales_test_data.groupby(['cust', 'prod']).ngroups
+    assert weights.sum() == pytest.approx(len(sales_test_data), rel=0.1)
+
+@pytest.mark.timeout(10)
+def test_a_full_sample_gives_the_exact_answer(sales_test_data: pd.DataFrame):
+    query = "SELECT prod, quant.sum, quant.count, quant.avg, quant.max, x.quant.sum OVER x SUCH THAT x.state = 'NY' ORDER BY 1"
+    expected = sales_test_data.esql.query(query)
+    result = sales_test_data.esql.query(query, approximate=SampleSpec(1.0))
+    assert result['prod'].tolist() == expected['prod'].tolist()
+    for column in expected.columns[1:]:
+        assert result[column].tolist() == pytest.approx(expected[column].tolist())
+    assert result['quant.sum.ci_low'].tolist() == pytest.approx(expected['quant.sum'].tolist())
+    assert 'quant.max.ci_low' not in result.columns
+
+@pytest.mark.timeout(10)
+def test_confidence_intervals_cover_the_exact_answer(sales_test_data: pd.DataFrame):
+    query = "SELECT prod, quant.sum, quant.count, quant.avg ORDER BY 1"
+    expected = sales_test_data.esql.query(query).set_index('prod')
+    result = sales_test_data.esql.query(query, approximate=SampleSpec(0.3, seed=3, confidence=0.99)).set_index('prod')
+    for aggregate in ['quant.sum', 'quant.count', 'quant.avg']:
+        covered = (result[f'{aggregate}.ci_low'] <= expected[aggregate]) & (expected[aggregate] <= result[f'{aggregate}.ci_high'])
+        assert covered.mean() >= 0.8
+        assert (result[f'{aggregate}.ci_low'] < result[f'{aggregate}.ci_high']).all()
+
+def test_sample_specs_are_validated():
+    with pytest.raises(BeartypeCallHintParamViolation):
+        SampleSpec(0)
+    with pytest.raises(BeartypeCallHintParamViolation):
+        SampleSpec(0.1, confidence=1.5)
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,48 @@
+import pytest
+import pandas as pd
+
+from src.esql.execution.scheduler import schedule_passes
+from src.esql.parser.types import LogicalOperator
+from tests.parser.test_parse import sales_test_data
+
+
+def _section(group: str, *dependencies: str) -> dict:
+    conditions = [{'group': group, 'column': 'quant', 'operator': '>', 'value': {'group': dependency, 'column': 'quant', 'function': 'avg'}, 'is_emf': True} for dependency in dependencies]
+    conditions.append({'group': group, 'column': 'year', 'operator': '=', 'value': 2017, 'is_emf': False})
+    return {'operator': LogicalOperator.AND, 'conditions': conditions} if len(conditions) > 1 else conditions[0]
+
+
+def test_independent_grouping_variables_share_a_pass():
+    groups = [f'g{number}' for number in range(12)]
+    sections = {}
+    for number, group in enumerate(groups):
+        if number < 4:
+            sections[group] = _section(group)
+        elif number < 8:
+            sections[group] = _section(group, f'g{number - 4}')
+        else:
+            sections[group] = _section(group, f'g{number - 4}', 'g0')
+    passes = schedule_passes(groups, sections)
+    assert passes == [groups[:4], groups[4:8], groups[8:]]
+
+def test_grouping_variables_without_sections_are_scheduled_first():
+    assert schedule_passes(['x', 'y', 'z'], {'y': _section('y', 'z'), 'z': _section('z')}) == [['x', 'z'], ['y']]
+
+@pytest.mark.timeout(10)
+def test_dependent_grouping_variables_compare_with_the_aggregates_of_their_group(sales_test_data: pd.DataFrame):
+    result = sales_test_data.esql.query(
+        "SELECT prod, x.quant.avg, y.quant.count, z.quant.max OVER x, y, z "
+        "SUCH THAT x.state = 'NY', y.quant > x.quant.avg or y.state = 'NJ', z.quant < y.quant.count and z.quant > quant.avg ORDER BY 1"
+    ).set_index('prod')
+    for prod, data in sales_test_data.groupby('prod'):
+        new_york_average = data[data['state'] == 'NY']['quant'].mean()
+        y_count = ((data['quant'] > new_york_average) | (data['state'] == 'NJ')).sum()
+        z_max = data[(data['quant'] < y_count) & (data['quant'] > data['quant'].mean())]['quant'].max()
+        assert result.loc[prod, 'x.quant.avg'] == pytest.approx(new_york_average, abs=0.01)
+        assert result.loc[prod, 'y.quant.count'] == y_count
+        assert result.loc[prod, 'z.quant.max'] == z_max or pd.isna(z_max) and pd.isna(result.loc[prod, 'z.quant.max'])
+
+
+
+if __name__ == '__main__':
+    pytest.main()
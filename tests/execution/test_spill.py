@@ -0,0 +1,66 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.execution.error import RuntimeError
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.spill import SpillDirectory, parse_memory_limit, partition_rows
+from tests.parser.test_parse import sales_test_data
+
+
+def test_parse_memory_limit_accepts_bytes_and_units():
+    assert parse_memory_limit(1024) == 1024
+    assert parse_memory_limit('4GB') == 4 * 10 ** 9
+    assert parse_memory_limit('1.5 MiB') == 3 << 19
+    for memory_limit in ['4 GX', 'GB', '0kb']:
+        with pytest.raises(RuntimeError):
+            parse_memory_limit(memory_limit)
+
+def test_rows_with_the_same_values_are_in_the_same_partition(sales_test_data: pd.DataFrame):
+    encoded_table = EncodedTable(_enforce_allowed_dtypes(sales_test_data))
+    row_ids = np.arange(0, len(sales_test_data), 2)
+    partitions = partition_rows(encoded_table, ['cust', 'month'], row_ids, 7)
+    assert np.sort(np.concatenate(partitions)).tolist() == row_ids.tolist()
+    keys = [set(zip(sales_test_data['cust'].iloc[partition], sales_test_data['month'].iloc[partition])) for partition in partitions]
+    assert sum(len(partition_keys) for partition_keys in keys) == len(set().union(*keys))
+
+def test_spill_directory_is_removed_when_closed():
+    with SpillDirectory() as spill_directory:
+        spill_directory.spill(pd.DataFrame({'a': [1, 2]}))
+        spill_directory.spill(pd.DataFrame({'a': [3]}))
+        assert spill_directory.read()['a'].tolist() == [1, 2, 3]
+        path = spill_directory._directory.name
+        assert len(os.listdir(path)) == 2
+    assert not os.path.exists(path)
+
+@pytest.mark.timeout(20)
+def test_queries_over_the_memory_limit_return_the_same_result(sales_test_data: pd.DataFrame):
+    queries = [
+        "SELECT cust, prod, day, month, quant.sum, quant.avg, x.quant.max OVER x WHERE quant > 100 SUCH THAT x.state = 'NY' ORDER BY 4",
+        "SELECT cust, month, x.quant.avg, y.quant.count OVER x, y SUCH THAT x.cust = cust and x.month = month - 1, y.cust = cust and y.quant > 500 ORDER BY -2",
+        "SELECT prod, state, quant.median, x.quant.count OVER x SUCH THAT x.quant > quant.avg HAVING quant.median > 450 ORDER BY 2"
+    ]
+    for query in queries:
+        pd.testing.assert_frame_equal(
+            sales_test_data.esql.query(query, memory_limit='10KB'),
+            sales_test_data.esql.query(query)
+        )
+
+@pytest.mark.timeout(20)
+def test_groups_that_tie_under_order_by_keep_the_order_of_query(sales_test_data: pd.DataFrame):
+    for query in [
+        "SELECT cust, prod, day, month, quant.sum, quant.max ORDER BY 3",
+        "SELECT cust, prod, day, month, x.quant.count OVER x SUCH THAT x.state = 'NY' ORDER BY -1",
+        "SELECT cust, prod, day, month, quant.sum WHERE year = 2018"
+    ]:
+        pd.testing.assert_frame_equal(
+            sales_test_data.esql.query(query, memory_limit='10KB'),
+            sales_test_data.esql.query(query)
+        )
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,57 @@
+import pytest
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from src.esql.accessor import _enforce_allowed_dtypes
+from src.esql.parser.parse import get_parsed_query
+from src.esql.execution.execute import execute
+from src.esql.execution.catalog import DatasetCatalog
+from src.esql.execution.encoding import EncodedTable
+from src.esql.execution.predicates import PredicateCache
+from src.esql.execution.statistics import TableStatistics, ZoneMap, BLOCK_NONE, BLOCK_SOME, BLOCK_ALL
+from tests.parser.test_parse import sales_test_data
+
+
+def test_zone_maps_classify_blocks():
+    values = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, np.nan, 8.0, np.nan, np.nan])
+    zone_map = ZoneMap(values, ~np.isnan(values), block_size=4)
+    assert zone_map.null_counts.tolist() == [0, 1, 2]
+    assert zone_map.classify('>', 4.0).tolist() == [BLOCK_NONE, BLOCK_SOME, BLOCK_NONE]
+    assert zone_map.classify('<=', 4.0).tolist() == [BLOCK_ALL, BLOCK_NONE, BLOCK_NONE]
+    assert zone_map.classify('!=', 9.0).tolist() == [BLOCK_ALL, BLOCK_ALL, BLOCK_ALL]
+    assert zone_map.classify('=', 2.0).tolist() == [BLOCK_SOME, BLOCK_NONE, BLOCK_NONE]
+
+def test_zone_maps_skip_blocks_that_cannot_match(monkeypatch):
+    data = _enforce_allowed_dtypes(pd.DataFrame({'year': np.repeat([2016, 2017, 2018, 2019], 25)}))
+    encoded_table = EncodedTable(data)
+    predicate_cache = PredicateCache(encoded_table, statistics=TableStatistics(encoded_table, block_size=10))
+    compared_rows = []
+    compare = predicate_cache._compare
+    def record(column, operator, value, rows):
+        compared_rows.append(len(range(100)[rows]) if isinstance(rows, slice) else len(rows))
+        return compare(column, operator, value, rows)
+    monkeypatch.setattr(predicate_cache, '_compare', record)
+
+    mask = predicate_cache.mask({'column': 'year', 'operator': '>=', 'value': 2019, 'is_emf': False})
+    assert mask.tolist() == (data['year'] >= 2019).tolist()
+    assert compared_rows == [10]
+
+def test_group_count_estimates_are_bounded_by_the_rows(sales_test_data: pd.DataFrame):
+    statistics = TableStatistics(EncodedTable(sales_test_data))
+    assert statistics.estimate_group_count(['year']) == sales_test_data['year'].nunique()
+    assert statistics.estimate_group_count(['cust', 'prod', 'day', 'quant']) == len(sales_test_data)
+
+@pytest.mark.timeout(10)
+def test_block_skipping_gives_the_same_results(sales_test_data: pd.DataFrame):
+    data = sales_test_data.sort_values('date', ignore_index=True)
+    query = "SELECT prod, quant.sum, x.quant.max OVER x WHERE date < '2017-01-01' SUCH THAT x.year >= 2016 and x.quant > 500 ORDER BY 1"
+    expected = execute(get_parsed_query(data, query), 2)
+    result = execute(get_parsed_query(data, query), 2, catalog=DatasetCatalog(data, zone_map_block_size=256))
+    pd.testing.assert_frame_equal(result, expected)
+    assert result['quant.sum'].sum() == data[data['date'] < date(2017, 1, 1)]['quant'].sum()
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,39 @@
+import pytest
+import pandas as pd
+
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.mark.timeout(20)
+def test_ordered_batches_are_merged_from_sorted_partitions(sales_test_data: pd.DataFrame):
+    for query in [
+        "SELECT cust, prod, day, quant.sum, quant.avg ORDER BY 3",
+        "SELECT cust, prod, day, month, quant.sum ORDER BY 2",
+        "SELECT cust, prod, day, month, quant.max ORDER BY -1",
+        "SELECT cust, prod, day, x.quant.max OVER x SUCH THAT x.cust = cust and x.prod = prod and x.day = day and x.state = 'NY' ORDER BY -3"
+    ]:
+        batches = list(sales_test_data.esql.iter_query(query, batch_size=100, memory_limit=20_000))
+        assert len(batches) > 1
+        assert all(len(batch) <= 100 for batch in batches)
+        pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(20)
+def test_unordered_batches_hold_every_group_once(sales_test_data: pd.DataFrame):
+    query = "SELECT cust, prod, day, quant.sum"
+    batches = list(sales_test_data.esql.iter_query(query, batch_size=50, memory_limit=20_000))
+    assert all(len(batch) <= 50 for batch in batches)
+    result = pd.concat(batches, ignore_index=True).sort_values(['cust', 'prod', 'day'], ignore_index=True)
+    expected = sales_test_data.esql.query(query).sort_values(['cust', 'prod', 'day'], ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+@pytest.mark.timeout(10)
+def test_queries_that_cannot_be_partitioned_are_yielded_in_batches(sales_test_data: pd.DataFrame):
+    query = "SELECT ROLLUP(cust, prod), quant.sum ORDER BY 2"
+    batches = list(sales_test_data.esql.iter_query(query, batch_size=7, memory_limit=1_000))
+    assert [len(batch) for batch in batches[:-1]] == [7] * (len(batches) - 1)
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), sales_test_data.esql.query(query))
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import subprocess
+import pytest
+
+from tests.parser.test_parse import sales_test_data
+
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Generous bound on the time the accessor adds to importing pandas and beartype, in microseconds.
+ACCESSOR_IMPORT_BUDGET_US = 400_000
+
+
+def _import_times(statement: str) -> dict[str, int]:
+    # The cumulative import time of every module imported by the statement (python -X importtime).
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=REPOSITORY_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    import_times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line.removeprefix('import time:').split('|')
+        import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+@pytest.mark.timeout(30)
+def test_parsing_against_a_schema_does_not_import_pandas():
+    import_times = _import_times(
+        "from src.esql.parser.parse import parse_query; "
+        "parse_query(\"SELECT cust, quant.sum WHERE date > '2018-01-01' and paid = true\", {'cust': 'string', 'quant': 'int64', 'date': 'date', 'paid': 'bool'})"
+    )
+    assert 'src.esql.parser.parse' in import_times
+    assert not {'pandas', 'numpy', 'beartype'} & set(import_times)
+
+@pytest.mark.timeout(30)
+def test_importing_the_package_does_not_import_pandas():
+    import_times = _import_times("import src.esql")
+    assert 'pandas' not in import_times
+
+@pytest.mark.timeout(30)
+def test_accessor_imports_the_execution_engine_on_first_use():
+    import_times = _import_times("import pandas, beartype; import src.esql.accessor")
+    assert not {'src.esql.execution.execute', 'src.esql.execution.sampling', 'src.esql.lazy', 'src.esql.aio', 'asyncio'} & set(import_times)
+    assert import_times['src.esql.accessor'] < ACCESSOR_IMPORT_BUDGET_US
+
+@pytest.mark.timeout(30)
+def test_cli_imports_the_cluster_protocol_on_first_use():
+    import_times = _import_times("import src.esql.cli")
+    assert not {'src.esql.cluster.protocol', 'src.esql.server.app'} & set(import_times)
+
+@pytest.mark.timeout(30)
+def test_lazily_imported_annotations_are_checked(sales_test_data):
+    from beartype.roar import BeartypeCallHintParamViolation
+    from src.esql.execution.sampling import SampleSpec
+    from src.esql.lazy import LazyQuery
+
+    assert isinstance(sales_test_data.esql.lazy("SELECT cust, quant.sum"), LazyQuery)
+    assert len(sales_test_data.esql.query("SELECT cust, quant.sum", approximate=SampleSpec(fraction=0.5, seed=0))) > 0
+    with pytest.raises(BeartypeCallHintParamViolation):
+        sales_test_data.esql.query("SELECT cust, quant.sum", approximate=0.5)
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,51 @@
+import pytest
+import pandas as pd
+
+import src.esql as esql
+from src.esql.parser.error import ParsingError
+from src.esql.execution import algorithms
+from tests.parser.test_parse import sales_test_data
+
+
+@pytest.mark.timeout(20)
+def test_collected_queries_return_the_results_of_eager_queries(sales_test_data: pd.DataFrame):
+    queries = [
+        "SELECT cust, quant.sum, quant.avg, x.quant.max, y.quant.count OVER x, y WHERE year = 2018 SUCH THAT x.state = 'NY', y.state = 'NJ' HAVING quant.sum > 10",
+        "SELECT cust, quant.max, z.quant.max OVER z WHERE year = 2018 SUCH THAT z.state = 'NY' ORDER BY 1",
+        "SELECT prod, cust, quant.median, state.count_distinct",
+        "SELECT cust, x.quant.sum OVER x",
+        "SELECT prod, x.quant.avg OVER x SUCH THAT x.quant > quant.avg ORDER BY 1",
+        "SELECT ROLLUP(cust, prod), quant.sum"
+    ]
+    results = esql.collect(*[sales_test_data.esql.lazy(query) for query in queries])
+    for query, result in zip(queries, results):
+        pd.testing.assert_frame_equal(result, sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_collected_queries_share_their_aggregates(sales_test_data: pd.DataFrame, monkeypatch):
+    updated_aggregates = []
+    update_aggregate_states = algorithms._update_aggregate_states
+    def record(**kwargs):
+        updated_aggregates.extend(aggregate['function'] for aggregate in kwargs['aggregates'])
+        update_aggregate_states(**kwargs)
+    monkeypatch.setattr(algorithms, '_update_aggregate_states', record)
+
+    first = sales_test_data.esql.lazy("SELECT prod, quant.sum, x.quant.max OVER x WHERE year = 2017 SUCH THAT x.state = 'NY'")
+    second = sales_test_data.esql.lazy("SELECT prod, quant.sum, y.quant.max OVER y WHERE year = 2017 SUCH THAT y.state = 'NY' ORDER BY 1")
+    first_result, second_result, repeated_result = esql.collect(first, second, first)
+    assert sorted(updated_aggregates) == ['max', 'sum']
+    pd.testing.assert_frame_equal(repeated_result, first_result)
+    expected = first_result.rename(columns={'x.quant.max': 'y.quant.max'}).sort_values('prod', ignore_index=True)
+    pd.testing.assert_frame_equal(second_result, expected)
+
+def test_lazy_queries_are_parsed_but_not_executed(sales_test_data: pd.DataFrame, monkeypatch):
+    monkeypatch.setattr(algorithms, 'build_grouped_table', lambda **kwargs: pytest.fail("The query was executed"))
+    lazy_query = sales_test_data.esql.lazy("SELECT cust, quant.sum")
+    assert repr(lazy_query) == "LazyQuery('SELECT cust, quant.sum')"
+    with pytest.raises(ParsingError):
+        sales_test_data.esql.lazy("SELECT nope")
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -3,7 +3,8 @@ import numpy as np
 import pandas as pd
 
 from src.esql.accessor import _enforce_allowed_dtypes
-from src.esql.parser.parse import _prepare_query, get_parsed_query
+from src.esql.parser.parse import _prepare_query, get_parsed_query, parse_query
+from src.esql.parser.error import ParsingError
 from src.esql.parser.types import ParsedQuery, ParsedSelectClause, AggregatesDict, GlobalAggregate, GroupAggregate, SimpleCondition, CompoundCondition, NotCondition, SimpleGroupCondition, CompoundGroupCondition, NotGroupCondition, GlobalAggregateCondition, GroupAggregateCondition, LogicalOperator
 
 
@@ -233,6 +234,19 @@ def test_get_parsed_query_returns_expected_structure_with_missing_parts(sales_te
             parsedQuery['order_by'] == expected['order_by'] and \
             parsedQuery['aggregates'] == expected['aggregates']
 
+def test_parsing_against_dtype_names_matches_parsing_against_the_data(sales_test_data: pd.DataFrame):
+    column_dtypes = {'cust': 'string', 'prod': 'string', 'day': 'int64', 'month': 'int64', 'year': 'int64', 'state': 'string', 'quant': 'int64', 'date': 'date'}
+    query = "SELECT cust, quant.sum, x.quant.avg OVER x WHERE date > '2018-01-01' and year != 2019 SUCH THAT x.state = 'NY' and x.cust = cust HAVING quant.sum > 10 ORDER BY 1"
+    parsed_query = parse_query(query, column_dtypes)
+    expected = get_parsed_query(sales_test_data, query)
+    assert parsed_query['data'] is None
+    assert {key: value for key, value in parsed_query.items() if key != 'data'} == {key: value for key, value in expected.items() if key != 'data'}
+    with pytest.raises(ParsingError):
+        parse_query("SELECT cust, state.avg", column_dtypes)
+    with pytest.raises(ParsingError):
+        parse_query("SELECT cust, quant.sum", {'cust': 'string', 'quant': 'decimal'})
+
+
 
               
 if __name__ == '__main__':
@@ -4,7 +4,7 @@ import numpy as np
 from datetime import date
 
 from src.esql.parser.util import get_keyword_clauses, parse_select_clause, parse_over_clause, parse_where_clause, _parse_such_that_section, parse_such_that_clause, parse_having_clause, parse_order_by_clause, _split_by_logical_operator, _split_condition, _has_wrapping_parenthesis
-from src.esql.parser.types import ParsedSelectClause, AggregatesDict, GlobalAggregate, GroupAggregate, ParsedWhereClause, LogicalOperator, SimpleCondition, CompoundCondition, NotCondition, SimpleGroupCondition, CompoundGroupCondition, NotGroupCondition, ParsedSuchThatClause, CompoundAggregateCondition, NotAggregateCondition, GlobalAggregateCondition, GroupAggregateCondition
+from src.esql.parser.types import EMFReference, ParsedSelectClause, AggregatesDict, GlobalAggregate, GroupAggregate, ParsedWhereClause, LogicalOperator, SimpleCondition, CompoundCondition, NotCondition, SimpleGroupCondition, CompoundGroupCondition, NotGroupCondition, ParsedSuchThatClause, CompoundAggregateCondition, NotAggregateCondition, GlobalAggregateCondition, GroupAggregateCondition
 from src.esql.parser.error import ParsingError, ParsingErrorType
 from tests.parser.test_parse import sales_test_data
 
@@ -514,6 +514,123 @@ def test_parse_such_that_clause_raises_error_for_multiple_sections_with_the_same
         assert parsingError.value.error_type == ParsingErrorType.SUCH_THAT_CLAUSE and f"Multiple sections contain group" in parsingError.value.message
 
 
+def test_parse_such_that_clause_parses_conditions_on_grouping_attributes(column_dtypes: dict[str, np.dtype]):
+    parsedSuchThatClause = parse_such_that_clause(
+        such_that_clause="x.cust = cust and x.month = month - 1 and x.quant > 10",
+        groups=['x'],
+        column_dtypes=column_dtypes,
+        grouping_attributes=['cust', 'month']
+    )
+    assert parsedSuchThatClause[0]['conditions'][:2] == [
+        SimpleGroupCondition(
+            group='x',
+            column='cust',
+            operator='=',
+            value=EMFReference(attribute='cust', offset=0),
+            is_emf=True
+        ),
+        SimpleGroupCondition(
+            group='x',
+            column='month',
+            operator='=',
+            value=EMFReference(attribute='month', offset=-1),
+            is_emf=True
+        )
+    ]
+    assert parsedSuchThatClause[0]['conditions'][2]['is_emf'] == False
+
+def test_parse_such_that_clause_raises_error_for_invalid_conditions_on_grouping_attributes(column_dtypes: dict[str, np.dtype]):
+    clauses = [
+        "x.cust = prod",
+        "x.month > month",
+        "x.cust = cust or x.quant > 10",
+        "not x.cust = cust",
+        "x.cust = month",
+        "x.cust = cust + 1"
+    ]
+    for clause in clauses:
+        with pytest.raises(ParsingError) as parsingError:
+            parse_such_that_clause(
+                such_that_clause=clause,
+                groups=['x'],
+                column_dtypes=column_dtypes,
+                grouping_attributes=['cust', 'month']
+            )
+        assert parsingError.value.error_type == ParsingErrorType.SUCH_THAT_CLAUSE
+
+def test_parse_select_clause_allows_distinct_counts_of_any_column(column_dtypes: dict[str, np.dtype]):
+    parsedSelectClause = parse_select_clause("prod, cust.count_distinct, x.state.approx_count_distinct", ['x'], column_dtypes)
+    assert parsedSelectClause['aggregates'] == AggregatesDict(
+        global_scope=[GlobalAggregate(column='cust', function='count_distinct')],
+        group_specific=[GroupAggregate(group='x', column='state', function='approx_count_distinct')]
+    )
+    with pytest.raises(ParsingError):
+        parse_select_clause("prod, cust.sum", ['x'], column_dtypes)
+
+def test_parse_select_clause_allows_percentiles_of_numeric_columns(column_dtypes: dict[str, np.dtype]):
+    parsedSelectClause = parse_select_clause("prod, quant.median, x.quant.approx_p95", ['x'], column_dtypes)
+    assert parsedSelectClause['aggregates'] == AggregatesDict(
+        global_scope=[GlobalAggregate(column='quant', function='median')],
+        group_specific=[GroupAggregate(group='x', column='quant', function='approx_p95')]
+    )
+    for select_clause in ["prod, cust.median", "prod, quant.p101", "prod, quant.p"]:
+        with pytest.raises(ParsingError):
+            parse_select_clause(select_clause, ['x'], column_dtypes)
+
+def test_parse_select_clause_expands_rollup_cube_and_grouping_sets(column_dtypes: dict[str, np.dtype]):
+    parsedSelectClause = parse_select_clause("rollup(cust, prod, year), quant.sum", [], column_dtypes)
+    assert parsedSelectClause['grouping_attributes'] == ['cust', 'prod', 'year']
+    assert parsedSelectClause['select_items_in_order'] == ['cust', 'prod', 'year', 'quant.sum']
+    assert parsedSelectClause['grouping_sets'] == [['cust', 'prod', 'year'], ['cust', 'prod'], ['cust'], []]
+    assert parse_select_clause("year, cube(cust, prod), quant.sum", [], column_dtypes)['grouping_sets'] == [['year', 'cust', 'prod'], ['year', 'cust'], ['year', 'prod'], ['year']]
+    assert parse_select_clause("grouping sets((cust, prod), state, ()), quant.sum", [], column_dtypes)['grouping_sets'] == [['cust', 'prod'], ['state'], []]
+    assert 'grouping_sets' not in parse_select_clause("cust, prod, quant.sum", [], column_dtypes)
+    for select_clause in ["rollup(), quant.sum", "cube(cust, q), quant.sum"]:
+        with pytest.raises(ParsingError) as parsingError:
+            parse_select_clause(select_clause, [], column_dtypes)
+        assert parsingError.value.error_type == ParsingErrorType.SELECT_CLAUSE
+
+def test_parse_such_that_clause_parses_conditions_on_aggregates(column_dtypes: dict[str, np.dtype]):
+    parsedSuchThatClause = parse_such_that_clause(
+        such_that_clause="x.state = 'NY', y.quant > x.quant.avg, z.quant <= quant.max",
+        groups=['x', 'y', 'z'],
+        column_dtypes=column_dtypes
+    )
+    assert parsedSuchThatClause[1] == SimpleGroupCondition(
+        group='y',
+        column='quant',
+        operator='>',
+        value=GroupAggregate(group='x', column='quant', function='avg'),
+        is_emf=True
+    )
+    assert parsedSuchThatClause[2]['value'] == GlobalAggregate(column='quant', function='max')
+
+def test_parse_such_that_clause_raises_error_for_circular_dependencies(column_dtypes: dict[str, np.dtype]):
+    clauses = [
+        "x.quant > x.quant.avg",
+        "x.quant > y.quant.avg, y.quant > z.quant.sum, z.quant < x.quant.max",
+        "x.cust = cust and x.quant > quant.avg",
+        "x.state > y.quant.avg"
+    ]
+    for clause in clauses:
+        with pytest.raises(ParsingError) as parsingError:
+            parse_such_that_clause(
+                such_that_clause=clause,
+                groups=['x', 'y', 'z'],
+                column_dtypes=column_dtypes,
+                grouping_attributes=['cust']
+            )
+        assert parsingError.value.error_type == ParsingErrorType.SUCH_THAT_CLAUSE
+
+def test_parse_where_clause_raises_error_for_conditions_on_grouping_attributes(column_dtypes: dict[str, np.dtype]):
+    with pytest.raises(ParsingError) as parsingError:
+        parse_where_clause(
+            where_clause="month = month",
+            column_dtypes=column_dtypes
+        )
+    assert parsingError.value.error_type == ParsingErrorType.WHERE_CLAUSE
+
+
 ###########################################################################
 # PARSE_HAVING_CLAUSE TESTS
 ###########################################################################
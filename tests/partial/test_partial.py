@@ -0,0 +1,64 @@
+import io
+import pytest
+import numpy as np
+import pandas as pd
+
+from src.esql.partial import FORMAT_VERSION, PartialState, partial_aggregate, merge_states, finalize
+from src.esql.execution.error import RuntimeError
+from tests.parser.test_parse import sales_test_data
+
+
+def _split(data: pd.DataFrame, number_of_parts: int) -> list[pd.DataFrame]:
+    return [data.iloc[rows] for rows in np.array_split(np.arange(len(data)), number_of_parts)]
+
+
+@pytest.mark.timeout(20)
+def test_merged_partial_states_give_the_result_of_the_whole_dataset(sales_test_data: pd.DataFrame):
+    query = (
+        "SELECT cust, prod, quant.sum, quant.avg, quant.min, quant.max, quant.var, state.count_distinct, quant.median, x.quant.count "
+        "OVER x WHERE year > 2016 SUCH THAT x.state = 'NY' HAVING quant.sum > 100 ORDER BY 2"
+    )
+    states = [PartialState.from_bytes(partial_aggregate(part, query).to_bytes()) for part in _split(sales_test_data, 4)]
+    pd.testing.assert_frame_equal(finalize(merge_states(states)), sales_test_data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_partial_states_keep_missing_and_date_grouping_attributes(sales_test_data: pd.DataFrame):
+    data = sales_test_data.copy()
+    data['quant'] = data['quant'].astype('Int64').mask(data['day'] == 1)
+    query = "SELECT date, quant.count, quant.avg ORDER BY 1"
+    states = [partial_aggregate(part, query) for part in _split(data, 3)]
+    merged_state = merge_states(states)
+    assert merged_state.number_of_groups == data['date'].nunique()
+    pd.testing.assert_frame_equal(finalize(merged_state), data.esql.query(query))
+
+@pytest.mark.timeout(10)
+def test_finalize_can_project_a_different_query_over_the_same_aggregates(sales_test_data: pd.DataFrame):
+    state = merge_states(partial_aggregate(part, "SELECT prod, quant.sum, quant.count") for part in _split(sales_test_data, 2))
+    query = "SELECT prod, quant.sum HAVING quant.count > 1000 ORDER BY 1"
+    pd.testing.assert_frame_equal(finalize(state, query), sales_test_data.esql.query(query))
+    with pytest.raises(RuntimeError):
+        finalize(state, "SELECT prod, quant.max")
+
+def test_partial_states_of_other_versions_are_rejected(sales_test_data: pd.DataFrame):
+    data = partial_aggregate(sales_test_data, "SELECT cust, quant.sum").to_bytes()
+    with np.load(io.BytesIO(data)) as arrays:
+        arrays = dict(arrays)
+    arrays['meta'] = np.array(str(arrays['meta']).replace(f'"version": {FORMAT_VERSION}', '"version": 0'))
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    with pytest.raises(RuntimeError):
+        PartialState.from_bytes(buffer.getvalue())
+
+def test_queries_that_depend_on_whole_groups_are_rejected(sales_test_data: pd.DataFrame):
+    for query in [
+        "SELECT cust, x.quant.sum OVER x SUCH THAT x.cust = cust",
+        "SELECT cust, x.quant.sum OVER x SUCH THAT x.quant > quant.avg",
+        "SELECT ROLLUP(cust, prod), quant.sum"
+    ]:
+        with pytest.raises(RuntimeError):
+            partial_aggregate(sales_test_data, query)
+
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,86 @@
+import json
+import pytest
+import pandas as pd
+
+from src.esql.server.app import create_app
+from src.esql.server.registry import DatasetRegistry
+from src.esql.server.cache import LRUCache
+
+
+@pytest.fixture
+def registry() -> DatasetRegistry:
+    registry = DatasetRegistry(cache_size=8)
+    registry.load_csv(
+        name='sales',
+        path='public/data/sales.csv',
+        dtypes={'quant': 'float64', 'date': 'date'}
+    )
+    return registry
+
+@pytest.fixture
+def client(registry: DatasetRegistry):
+    app = create_app(registry, workers=2)
+    return app.test_client()
+
+
+def test_registry_enforces_dtypes_when_loading(registry: DatasetRegistry):
+    data = registry.get('sales').data
+    assert pd.api.types.is_float_dtype(data['quant'].dtype)
+    assert pd.api.types.is_string_dtype(data['cust'].dtype)
+
+def test_query_returns_json_rows_and_timings(client):
+    response = client.post('/datasets/sales/query', json={'query': "SELECT prod, quant.max WHERE state = 'NY' ORDER BY 1"})
+    assert response.status_code == 200
+    payload = response.get_json()
+    expected = pd.read_csv('public/data/sales.csv').query("state == 'NY'").groupby('prod')['quant'].max().sort_index()
+    assert payload['columns'] == ['prod', 'quant.max']
+    assert payload['rows'] == [[prod, float(quant)] for prod, quant in expected.items()]
+    assert {'queue_ms', 'parse_ms', 'execute_ms', 'serialize_ms', 'total_ms'} <= set(payload['timings'])
+    assert 'execute;dur=' in response.headers['Server-Timing']
+
+def test_query_results_and_plans_are_cached(client):
+    body = {'query': "SELECT cust, quant.sum"}
+    first = client.post('/datasets/sales/query', json=body).get_json()
+    second = client.post('/datasets/sales/query', json={'query': "select   cust,  QUANT.SUM"}).get_json()
+    assert first['cached'] == {'plan': False, 'result': False}
+    assert second['cached'] == {'plan': True, 'result': True}
+    assert first['rows'] == second['rows']
+
+def test_cached_results_are_returned_as_copies(registry: DatasetRegistry):
+    dataset = registry.get('sales')
+    first = dataset.query("SELECT cust, quant.sum", 2)['result']
+    expected = first.copy()
+    first.loc[:, 'quant.sum'] = 0
+    second = dataset.query("SELECT cust, quant.sum", 2)
+    assert second['result_cached']
+    pd.testing.assert_frame_equal(second['result'], expected)
+    second['result'].drop(columns='cust', inplace=True)
+    pd.testing.assert_frame_equal(dataset.query("SELECT cust, quant.sum", 2)['result'], expected)
+
+def test_query_streams_ndjson(client):
+    response = client.post('/datasets/sales/query?format=ndjson', json={'query': "SELECT prod, quant.count ORDER BY 1"})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == pd.read_csv('public/data/sales.csv')['prod'].nunique()
+    assert list(lines[0].keys()) == ['prod', 'quant.count']
+
+def test_query_errors_are_reported_as_json(client):
+    assert client.post('/datasets/missing/query', json={'query': "SELECT cust"}).status_code == 404
+    assert client.post('/datasets/sales/query', json={'query': "SELECT nope"}).status_code == 400
+    assert client.post('/datasets/sales/query', json={'query': "SELECT cust", 'decimal_places': 0}).status_code == 400
+    assert client.post('/datasets/sales/query', json={}).status_code == 400
+
+def test_lru_cache_evicts_least_recently_used_entry():
+    cache = LRUCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+
+if __name__ == '__main__':
+    pytest.main()